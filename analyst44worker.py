@@ -1,7 +1,123 @@
+import argparse
+import hashlib
+import importlib
+import os
 import subprocess
 import sys
 import traceback
-from datetime import datetime
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+from clients import get_supabase
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Default number of steps allowed to run at the same time.
+DEFAULT_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "3"))
+
+# PIPELINE_ISOLATED=1 runs every step in its own python3 subprocess
+# (same as --isolated). By default steps run in this process.
+DEFAULT_ISOLATED = os.getenv("PIPELINE_ISOLATED", "0") == "1"
+
+# Completion markers (one pipeline_checkpoints row per successful step,
+# sql/pipeline_checkpoints.sql); kept apart from jobs_monitor, which feeds
+# the daily jobs digest
+CHECKPOINTS_TABLE = "pipeline_checkpoints"
+CHECKPOINT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "analyst44worker/checkpoint")
+
+
+# --------------------------------------------------
+# Pipeline definition (DAG)
+# --------------------------------------------------
+# Each step declares the steps it must run "after".
+# "entry" is the function called when the step runs in-process;
+# "script" is what runs when the pipeline is started with --isolated.
+# critical=True  -> a failure stops the pipeline (no new steps are started)
+# critical=False -> a failure is logged and dependants still run
+# "resume_with" (optional): steps that must also have completed for this one
+# to be skipped on --resume, for a step whose effect is only safe to keep
+# together with theirs (a reset and the step that refills the table)
+PIPELINE_STEPS = [
+    # Step 1: Fetch financial statements
+    {"name": "financial_statements",
+     "script": "analyst_financial_statements_worker.py", "entry": "run_worker",
+     "after": [], "critical": True},
+
+    # Step 1.09 – 1.15: SPY chain (reset -> 6 months FMP sync -> AI decision)
+    {"name": "spy_daily_bars_reset",
+     "script": "spy_daily_bars_reset.py", "entry": "run",
+     "after": [], "critical": True},
+    {"name": "spy_daily_bars_sync",
+     "script": "spy_daily_bars_sync.py", "entry": "run",
+     "after": ["spy_daily_bars_reset"], "critical": True},
+    {"name": "spy_market_state_daily",
+     "script": "spy_market_state_daily_runner.py", "entry": "run",
+     "after": ["spy_daily_bars_sync"], "critical": True},
+
+    # Step 1.16 – 1.18: VIX chain (reset -> 6 months FMP sync -> AI decision)
+    {"name": "vix_daily_bars_reset",
+     "script": "vix_daily_reset.py", "entry": "run",
+     "after": [], "critical": True},
+    {"name": "vix_daily_bars_sync",
+     "script": "vix_daily_history_loader.py", "entry": "run",
+     "after": ["vix_daily_bars_reset"], "critical": True},
+    {"name": "vix_market_state_daily",
+     "script": "vix_market_state_daily_runner.py", "entry": "main",
+     "after": ["vix_daily_bars_sync"], "critical": False},
+
+    # Step 1.2: Fetch earnings-related news
+    {"name": "fetch_earnings_news",
+     "script": "fmp_earnings_news_fetcher.py", "entry": "main",
+     "after": [], "critical": True},
+
+    # Step 1.5: Reset daily scores snapshot (only once fresh statements exist)
+    {"name": "reset_financial_scores",
+     "script": "reset_analyst_financial_scores.py", "entry": "reset_scores",
+     "after": ["financial_statements"], "critical": True,
+     "resume_with": ["financial_scores"]},
+
+    # Step 2: Run financial scoring (build fresh snapshot)
+    {"name": "financial_scores",
+     "script": "analyst_financial_scores_worker.py", "entry": "run_worker",
+     "after": ["reset_financial_scores"], "critical": False},
+
+    # Step 2.5: Build News Revalidation Input (needs scores + news)
+    {"name": "news_revalidation_input_builder",
+     "script": "news_revalidation_input_builder.py", "entry": "main",
+     "after": ["financial_scores", "fetch_earnings_news"], "critical": True},
+
+    # Step 2.6: Run News Revalidation AI (LOG ONLY)
+    {"name": "news_revalidation_ai",
+     "script": "news_revalidation_ai_runner.py", "entry": "main",
+     "after": ["news_revalidation_input_builder"], "critical": False},
+
+    # Step 2.7: Merge earnings news into financial scores
+    {"name": "merge_earnings_into_financial_scores",
+     "script": "merge_earnings_into_financial_scores.py", "entry": "run_earnings_merge",
+     "after": ["news_revalidation_ai"], "critical": False},
+
+    # Step 3: Save score history
+    {"name": "build_scores_history",
+     "script": "build_scores_history.py", "entry": "build_history",
+     "after": ["merge_earnings_into_financial_scores"], "critical": False},
+
+    # Step 3.5: Cleanup earnings calendar (every reader of the calendar is done)
+    {"name": "cleanup_earnings_calendar",
+     "script": "cleanup_earnings_calendar.py", "entry": "main",
+     "after": ["build_scores_history", "fetch_earnings_news"], "critical": False},
+
+    # Step 4: Sync earnings calendar
+    {"name": "update_earnings_calendar",
+     "script": "earnings_calendar_us_sync_reset.py", "entry": "main",
+     "after": ["cleanup_earnings_calendar"], "critical": True},
+
+    # Step 5: Backfill missing earnings symbols
+    {"name": "backfill_missing_earnings",
+     "script": "earnings_calendar_us_backfill.py", "entry": "backfill_missing_symbols",
+     "after": ["update_earnings_calendar"], "critical": False},
+]
 
 
 def log(msg: str) -> None:
@@ -25,131 +141,298 @@ def run_step(name: str, cmd: list[str]) -> bool:
         return False
 
 
-def main() -> int:
-    log("🚀 analyst44worker.py started")
+def run_step_in_process(name: str, script: str, entry: str) -> bool:
+    """
+    Import the step's module and call its entry function in this process.
+    All steps share the clients from clients.py, so there is no interpreter
+    start-up, re-import or new TLS connection per step.
+    """
+    log(f"Starting step: {name} | in-process: {script}:{entry}()")
+    try:
+        module = importlib.import_module(script.removesuffix(".py"))
+        getattr(module, entry)()
+        log(f"✔️ Step completed: {name}")
+        return True
+    except SystemExit as e:
+        # Scripts may call exit()/sys.exit() – keep subprocess semantics
+        if e.code in (None, 0):
+            log(f"✔️ Step completed: {name}")
+            return True
+        log(f"❌ Step failed: {name} | exit code={e.code}")
+        return False
+    except Exception:
+        log(f"❌ Unexpected error in step: {name}")
+        log(traceback.format_exc())
+        return False
 
-    # Step 1: Fetch financial statements
-    if not run_step(
-        "financial_statements",
-        ["python3", "analyst_financial_statements_worker.py"],
-    ):
-        log("Stopping pipeline because financial statements step failed.")
-        return 1
 
-    # Step 1.09: Reset SPY daily bars table
-    if not run_step(
-            "spy_daily_bars_reset",
-            ["python3", "spy_daily_bars_reset.py"],
-    ):
-        log("Stopping pipeline because spy_daily_bars_reset failed.")
-        return 1
+def validate_pipeline(steps: list[dict]) -> list[str]:
+    """
+    Raise ValueError on duplicate names, unknown dependencies or cycles.
+    Returns the step names in dependency (topological) order.
+    """
+    names = [s["name"] for s in steps]
+    if len(names) != len(set(names)):
+        raise ValueError("Duplicate step names in pipeline")
 
-    # 🔹 Step 1.1: Sync SPY daily bars (6 months, FMP)
-    if not run_step(
-        "spy_daily_bars_sync",
-        ["python3", "spy_daily_bars_sync.py"],
-    ):
-        log("Stopping pipeline because spy_daily_bars_sync failed.")
-        return 1
+    known = set(names)
+    for step in steps:
+        for dep in step["after"] + step.get("resume_with", []):
+            if dep not in known:
+                raise ValueError(f"Step {step['name']} depends on unknown step {dep}")
 
-    # 🔹 Step 1.15: SPY market state AI decision
-    if not run_step(
-            "spy_market_state_daily",
-            ["python3", "spy_market_state_daily_runner.py"],
-    ):
-        log("Stopping pipeline because spy_market_state_daily failed.")
-        return 1
+    # Kahn's algorithm – every step must become reachable
+    order = []
+    remaining = {s["name"]: set(s["after"]) for s in steps}
+    while remaining:
+        ready = [n for n, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependency cycle between steps: {sorted(remaining)}")
+        for n in ready:
+            del remaining[n]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+        order.extend(ready)
 
-    # 🔄 Step 1.16: Reset VIX daily bars table
-    if not run_step(
-            "vix_daily_bars_reset",
-            ["python3", "vix_daily_reset.py"],
-    ):
-        log("Stopping pipeline because vix_daily_bars_reset failed.")
-        return 1
+    return order
 
-    # 📈 Step 1.17: Sync VIX daily bars (6 months, FMP)
-    if not run_step(
-            "vix_daily_bars_sync",
-            ["python3", "vix_daily_history_loader.py"],
-    ):
-        log("Stopping pipeline because vix_daily_bars_sync failed.")
-        return 1
 
-    # Step 1.18: VIX market state AI decision
-    run_step(
-        "vix_market_state_daily",
-        ["python3", "vix_market_state_daily_runner.py"]
+# --------------------------------------------------
+# Checkpoints (completion markers in pipeline_checkpoints)
+# --------------------------------------------------
+def compute_fingerprints(steps: list[dict], order: list[str]) -> dict[str, str]:
+    """
+    Input fingerprint per step: hash of the step's script source, its entry
+    and the fingerprints of the steps it runs after. Editing a script
+    therefore invalidates its marker and the markers of everything
+    downstream of it.
+    """
+    by_name = {s["name"]: s for s in steps}
+    fingerprints = {}
+
+    for name in order:
+        step = by_name[name]
+        h = hashlib.sha256()
+        h.update(name.encode())
+        h.update(step["entry"].encode())
+        h.update((BASE_DIR / step["script"]).read_bytes())
+        for dep in sorted(step["after"]):
+            h.update(fingerprints[dep].encode())
+        fingerprints[name] = h.hexdigest()[:16]
+
+    return fingerprints
+
+
+def checkpoint_run_id(run_date: str, step_name: str, fingerprint: str) -> str:
+    """Deterministic pipeline_checkpoints.run_id for (run date, step, fingerprint)."""
+    return str(uuid.uuid5(CHECKPOINT_NAMESPACE, f"{run_date}/{step_name}/{fingerprint}"))
+
+
+def load_completed_run_ids(run_ids: list[str]) -> set[str]:
+    """Return the run_ids that already have a completion marker."""
+    resp = (
+        get_supabase()
+        .table(CHECKPOINTS_TABLE)
+        .select("run_id")
+        .in_("run_id", run_ids)
+        .execute()
     )
+    return {r["run_id"] for r in resp.data or []}
 
-    # 🔹 Step 1.2: Fetch earnings-related news
-    if not run_step(
-            "fetch_earnings_news",
-            ["python3", "fmp_earnings_news_fetcher.py"],
-    ):
-        log("Stopping pipeline because fetch_earnings_news failed.")
-        return 1
 
-    # 🔹 Step 1.5: Reset daily scores snapshot
-    if not run_step(
-        "reset_financial_scores",
-        ["python3", "reset_analyst_financial_scores.py"],
-    ):
-        log("Stopping pipeline because reset_financial_scores failed.")
-        return 1
+# Steps whose marker could not be written in this run (reported at the end)
+_unsaved_checkpoints: list[str] = []
 
-    # Step 2: Run financial scoring (build fresh snapshot)
-    if not run_step(
-        "financial_scores",
-        ["python3", "analyst_financial_scores_worker.py"],
-    ):
-        log("Score step finished (may include errors).")
-
-    # Step 2.5: Build News Revalidation Input
-    if not run_step(
-            "news_revalidation_input_builder",
-            ["python3", "news_revalidation_input_builder.py"],
-    ):
-        log("Stopping pipeline because news_revalidation_input_builder failed.")
+
+def record_step_completed(
+    step_name: str, run_id: str, run_date: str, started_at: datetime
+) -> None:
+    """Upsert the completion marker for a step. Never fails the pipeline."""
+    finished_at = datetime.now(timezone.utc)
+    row = {
+        "run_id": run_id,
+        "step_name": step_name,
+        "run_date": run_date,
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "duration_ms": int((finished_at - started_at).total_seconds() * 1000),
+    }
+    try:
+        get_supabase().table(CHECKPOINTS_TABLE).upsert(row, on_conflict="run_id").execute()
+    except Exception as e:
+        _unsaved_checkpoints.append(step_name)
+        log(f"⚠️ Could not record checkpoint for {step_name}: {e}")
+
+
+def find_resumable_steps(
+    steps: list[dict], order: list[str], run_ids: dict[str, str]
+) -> set[str]:
+    """
+    Steps that can be skipped on --resume: the step has a success marker
+    for this run date/fingerprint, every step it runs after is skipped too,
+    and every step in its "resume_with" has a marker as well. The pipeline
+    restarts from the first incomplete step.
+    """
+    try:
+        completed_ids = load_completed_run_ids(list(run_ids.values()))
+    except Exception as e:
+        log(f"⚠️ Could not load checkpoints, running all steps: {e}")
+        return set()
+
+    by_name = {s["name"]: s for s in steps}
+    resumable: set[str] = set()
+    for name in order:
+        step = by_name[name]
+        if (
+            run_ids[name] in completed_ids
+            and all(dep in resumable for dep in step["after"])
+            and all(run_ids[other] in completed_ids for other in step.get("resume_with", []))
+        ):
+            resumable.add(name)
+
+    return resumable
+
+
+def execute_step(step: dict, isolated: bool, run_id: str, run_date: str) -> bool:
+    """Run one step and record its completion marker on success."""
+    started_at = datetime.now(timezone.utc)
+
+    if isolated:
+        ok = run_step(step["name"], ["python3", step["script"]])
+    else:
+        ok = run_step_in_process(step["name"], step["script"], step["entry"])
+
+    if ok:
+        record_step_completed(step["name"], run_id, run_date, started_at)
+    return ok
+
+
+def run_pipeline(
+    steps: list[dict],
+    max_workers: int,
+    isolated: bool = False,
+    run_date: str | None = None,
+    resume: bool = False,
+) -> int:
+    """
+    Run the steps as a DAG on a pool of max_workers threads.
+
+    A step starts as soon as all its "after" steps are done. Steps are
+    started in declaration order, so list the long ones first.
+    When a critical step fails no new steps are started; steps already
+    running are allowed to finish and the pipeline returns 1.
+    With isolated=True every step runs as its own python3 subprocess.
+
+    Every successful step records a completion marker for run_date. With
+    resume=True steps that already completed for run_date are skipped.
+    """
+    order = validate_pipeline(steps)
+
+    run_date = run_date or datetime.utcnow().date().isoformat()
+    fingerprints = compute_fingerprints(steps, order)
+    run_ids = {
+        name: checkpoint_run_id(run_date, name, fp) for name, fp in fingerprints.items()
+    }
+
+    done: set[str] = set()
+    if resume:
+        done = find_resumable_steps(steps, order, run_ids)
+        for name in order:
+            if name in done:
+                log(f"⏭️ Skipping step (already completed for {run_date}): {name}")
+
+    _unsaved_checkpoints.clear()
+    pending = [s for s in steps if s["name"] not in done]
+    running = {}
+    failed_step = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            if failed_step is None:
+                for step in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    if all(dep in done for dep in step["after"]):
+                        future = pool.submit(
+                            execute_step, step, isolated, run_ids[step["name"]], run_date
+                        )
+                        running[future] = step
+                        pending.remove(step)
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                if future.result():
+                    done.add(step["name"])
+                elif not step["critical"]:
+                    log(f"Step {step['name']} failed (non-critical) – continuing.")
+                    done.add(step["name"])
+                elif failed_step is None:
+                    failed_step = step
+                    log(f"Stopping pipeline because {step['name']} failed.")
+
+    if _unsaved_checkpoints:
+        log(
+            f"⚠️ No checkpoint saved for {len(_unsaved_checkpoints)} step(s) "
+            f"({', '.join(_unsaved_checkpoints)}) – --resume will rerun them"
+        )
+
+    if failed_step is not None:
+        skipped = [s["name"] for s in pending]
+        if skipped:
+            log(f"Steps not started: {', '.join(skipped)}")
         return 1
 
-    # 💡 Step 2.6: Run News Revalidation AI (LOG ONLY)
-    run_step(
-        "news_revalidation_ai",
-        ["python3", "news_revalidation_ai_runner.py"],
-    )
+    return 0
 
-    # 💡 Step 2.7: Merge earnings news into financial scores
-    run_step(
-        name="merge_earnings_into_financial_scores",
-        cmd=["python3", "merge_earnings_into_financial_scores.py"],
-    )
 
-    # Step 3: Save score history
-    run_step(
-        "build_scores_history",
-        ["python3", "build_scores_history.py"],
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="analyst44 daily pipeline")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help="max number of steps running at the same time (1 = sequential)",
     )
-
-    # Step 3.5: Cleanup earnings calendar
-    run_step(
-        "cleanup_earnings_calendar",
-        ["python3", "cleanup_earnings_calendar.py"],
+    parser.add_argument(
+        "--isolated",
+        action="store_true",
+        default=DEFAULT_ISOLATED,
+        help="run every step in its own python3 subprocess",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip steps that already completed for --run-date",
+    )
+    parser.add_argument(
+        "--run-date",
+        default=None,
+        help="run date (YYYY-MM-DD, UTC) used for completion markers; default today",
     )
+    return parser.parse_args(argv)
 
-    # Step 4: Sync earnings calendar
-    if not run_step(
-        "update_earnings_calendar",
-        ["python3", "earnings_calendar_us_sync_reset.py"],
-    ):
-        log("Stopping pipeline because earnings calendar update failed.")
-        return 1
 
-    # Step 5: Backfill missing earnings symbols
-    run_step(
-        "backfill_missing_earnings",
-        ["python3", "earnings_calendar_us_backfill.py"],
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    mode = "isolated" if args.isolated else "in-process"
+    log(
+        f"🚀 analyst44worker.py started | workers={args.workers} | mode={mode}"
+        f" | resume={args.resume}"
+    )
+
+    rc = run_pipeline(
+        PIPELINE_STEPS,
+        max_workers=max(1, args.workers),
+        isolated=args.isolated,
+        run_date=args.run_date,
+        resume=args.resume,
     )
+    if rc != 0:
+        return rc
 
     log("🎯 analyst44 daily pipeline finished")
     return 0
@@ -5,35 +5,54 @@
 # send them to GPT with analyst_financial_scoring_prompt.txt,
 # and store the scores into analyst_financial_scores.
 
-import os
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
 from pathlib import Path
 
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
 
-from openai import OpenAI
+import llm_cache
+import llm_payload_encoder
+import llm_telemetry
+import openai_batch
+import openai_throttle
+from clients import get_openai, get_supabase
+from supabase_reader import stream_rows
 
 
-load_dotenv()
+supabase: Client = get_supabase()
+# no SDK retries: 429s are retried by openai_throttle
+openai_client = get_openai(max_retries=0)
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+BASE_DIR = Path(__file__).resolve().parent
+PROMPT_PATH = BASE_DIR / "analyst_financial_scoring_prompt.txt"
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
+REPORTS_TABLE = "analyst_input_financial_statements"
+# Two newest reports per symbol (sql/latest_two_reports.sql)
+LATEST_TWO_VIEW = "analyst_input_financial_statements_latest_two"
+# Symbols per in.() filter when prefetching reports (keeps the URL short)
+REPORTS_PREFETCH_CHUNK = int(os.getenv("SCORES_PREFETCH_CHUNK", "200"))
 
-if not OPENAI_API_KEY:
-    raise RuntimeError("Missing OPENAI_API_KEY")
+MODEL = "gpt-4.1-mini"
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# GPT requests in flight at once (TPM budget / 429 backoff: openai_throttle)
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "8"))
+# Expected completion size, reserved in the TPM budget up front
+EST_COMPLETION_TOKENS = 800
 
-BASE_DIR = Path(__file__).resolve().parent
-PROMPT_PATH = BASE_DIR / "analyst_financial_scoring_prompt.txt"
+# Sent unrounded: the prompt echoes close_before_earnings as echo_price and
+# derives target_range from it
+EXACT_FIELDS = frozenset({
+    "close_before_earnings",
+    "eps_basic",
+    "eps_diluted",
+    "estimated_eps_avg",
+    "estimated_eps_low",
+    "estimated_eps_high",
+})
 
 
 def load_system_prompt() -> str:
@@ -43,9 +62,8 @@ def load_system_prompt() -> str:
 
 def get_symbols() -> list[str]:
     """Fetch all symbols from earnings_calendar_us."""
-    res = supabase.table("earnings_calendar_us").select("symbol").execute()
-    data = res.data or []
-    return [row["symbol"] for row in data if row.get("symbol")]
+    rows = stream_rows("earnings_calendar_us", "symbol", key="id")
+    return [row["symbol"] for row in rows if row.get("symbol")]
 
 
 def get_two_latest_reports(symbol: str):
@@ -54,7 +72,7 @@ def get_two_latest_reports(symbol: str):
     Returns (latest_report, previous_report) as dicts or (None, None) if not enough data.
     """
     res = (
-        supabase.table("analyst_input_financial_statements")
+        supabase.table(REPORTS_TABLE)
         .select("*")
         .eq("symbol", symbol)
         .order("report_date", desc=True)
@@ -71,6 +89,46 @@ def get_two_latest_reports(symbol: str):
     return latest, previous
 
 
+def load_two_latest_reports(symbols: list[str]) -> dict[str, tuple[dict, dict]]:
+    """
+    Bulk version of get_two_latest_reports() for the whole universe:
+    {symbol: (latest_report, previous_report)}, only for symbols with at
+    least two reports. Reads REPORTS_PREFETCH_CHUNK symbols per paged query
+    from the latest-two view, so at most 2 rows per symbol are transferred.
+    Without the view, falls back to paging the reports table newest first.
+    """
+    unique = sorted(set(symbols))
+    try:
+        latest_two = _load_latest_two(unique, LATEST_TWO_VIEW, ("symbol", "report_rank"), False)
+    except Exception as e:
+        print(f"Latest-two view unavailable ({e}) – reading full report history.")
+        latest_two = _load_latest_two(unique, REPORTS_TABLE, ("symbol", "report_date"), True)
+
+    return {sym: (rows[0], rows[1]) for sym, rows in latest_two.items() if len(rows) == 2}
+
+
+def _load_latest_two(symbols: list[str], table: str, key: tuple, desc: bool) -> dict[str, list[dict]]:
+    latest_two: dict[str, list[dict]] = {}
+
+    for i in range(0, len(symbols), REPORTS_PREFETCH_CHUNK):
+        chunk = symbols[i:i + REPORTS_PREFETCH_CHUNK]
+        rows = stream_rows(
+            table,
+            "*",
+            key=key,
+            desc=desc,
+            where=lambda q, chunk=chunk: q.in_("symbol", chunk),
+            client=supabase,
+        )
+        for row in rows:
+            row.pop("report_rank", None)
+            kept = latest_two.setdefault(row["symbol"], [])
+            if len(kept) < 2:
+                kept.append(row)
+
+    return latest_two
+
+
 def prepare_payload(latest: dict, previous: dict) -> dict:
     """
     Build the payload sent to GPT:
@@ -95,44 +153,115 @@ def prepare_payload(latest: dict, previous: dict) -> dict:
     return payload
 
 
-def call_gpt(system_prompt: str, payload: dict) -> dict | None:
+def compact_payload(system_prompt: str, payload: dict) -> str:
     """
-    Call GPT with the system prompt and the two-report payload.
-    Expects JSON in the exact format we defined in the system prompt.
-    Returns parsed dict or None on failure.
+    Compact JSON for the two reports: no nulls, only fields the prompt
+    describes, floats at 4 significant digits except prices and EPS
+    (EXACT_FIELDS; see llm_payload_encoder).
     """
-    user_content = json.dumps(payload, default=str)
-
-    try:
-        resp = openai_client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content},
-            ],
-            temperature=0.1,
+    compacted = {
+        name: llm_payload_encoder.compact(
+            report,
+            keep=llm_payload_encoder.fields_in(system_prompt, report),
+            exact=EXACT_FIELDS,
         )
-    except Exception as e:
-        print(f"  Error calling GPT: {e}")
-        return None
+        for name, report in payload.items()
+    }
+    return llm_payload_encoder.encode(compacted)
 
-    try:
-        content = resp.choices[0].message.content
-    except Exception as e:
-        print(f"  Error reading GPT response: {e}")
+
+def encode_payload(system_prompt: str, payload: dict) -> str:
+    """The user message sent to GPT (compact_payload), with token savings logged."""
+    text = compact_payload(system_prompt, payload)
+    llm_payload_encoder.record_savings("financial_scores", json.dumps(payload, default=str), text)
+    return text
+
+
+def cache_message(system_prompt: str, payload: dict) -> str:
+    """llm_cache key text: the payload encoded as sent, minus run metadata."""
+    return compact_payload(system_prompt, llm_cache.normalize(payload))
+
+
+def build_gpt_request(system_prompt: str, payload: dict) -> dict:
+    """chat.completions.create kwargs for one symbol (sync and batch backends)."""
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": encode_payload(system_prompt, payload)},
+        ],
+        "temperature": 0.1,
+    }
+
+
+def get_cached_gpt_data(system_prompt: str, payload: dict) -> dict | None:
+    """Cached answer for (model, prompt, encoded payload) – see llm_cache."""
+    cached = llm_cache.get(MODEL, system_prompt, cache_message(system_prompt, payload))
+    if cached is None:
         return None
 
+    # The cache key ignores analysis_date; echo today's like the model would
+    data = dict(cached)
+    data["analysis_date"] = payload["latest_report"].get("analysis_date")
+    print(f"  GPT cache hit for {data.get('symbol')}")
+    return data
+
+
+def parse_gpt_content(content: str | None) -> dict | None:
     if not content:
         print("  Empty GPT response content")
         return None
 
     try:
-        data = json.loads(content)
+        return json.loads(content)
     except Exception as e:
         print(f"  Failed to parse GPT JSON: {e}")
         print("  Raw content:", content)
         return None
 
+
+def call_gpt(system_prompt: str, payload: dict) -> dict | None:
+    """
+    Call GPT with the system prompt and the two-report payload.
+    Expects JSON in the exact format we defined in the system prompt.
+    Returns parsed dict or None on failure.
+    Answers are cached by (model, prompt, encoded payload) – see llm_cache.
+    """
+    cached = get_cached_gpt_data(system_prompt, payload)
+    if cached is not None:
+        return cached
+
+    request = build_gpt_request(system_prompt, payload)
+    est_tokens = (
+        openai_throttle.estimate_tokens(*(m["content"] for m in request["messages"]))
+        + EST_COMPLETION_TOKENS
+    )
+
+    with llm_telemetry.track("financial_scores", MODEL, payload["latest_report"].get("symbol")) as t:
+        try:
+            resp = openai_throttle.call(
+                lambda: t.call(lambda: openai_client.chat.completions.create(**request)),
+                est_tokens,
+                on_retry=t.on_retry,
+                on_wait=t.on_wait,
+            )
+        except Exception as e:
+            print(f"  Error calling GPT: {e}")
+            return None
+
+        try:
+            content = resp.choices[0].message.content
+        except Exception as e:
+            print(f"  Error reading GPT response: {e}")
+            t.fail(error=str(e))
+            return None
+
+        data = parse_gpt_content(content)
+        if data is None:
+            t.fail()
+            return None
+
+    llm_cache.put(MODEL, system_prompt, cache_message(system_prompt, payload), data)
     return data
 
 
@@ -190,38 +319,137 @@ def insert_score_row(gpt_data: dict):
         print(f"  Error inserting into analyst_financial_scores for {symbol}: {e}")
 
 
-def process_symbol(symbol: str, system_prompt: str):
-    print(f"Processing scores for {symbol} ...")
-
-    latest, previous = get_two_latest_reports(symbol)
+def load_payload(symbol: str, reports: dict | None = None) -> dict | None:
+    """
+    GPT payload for a symbol, or None when it has fewer than two reports.
+    reports: prefetched load_two_latest_reports() index; None queries per symbol.
+    """
+    if reports is None:
+        latest, previous = get_two_latest_reports(symbol)
+    else:
+        latest, previous = reports.get(symbol, (None, None))
     if latest is None or previous is None:
         print(f"  Not enough reports for {symbol}, skipping.")
-        return
+        return None
+
+    return prepare_payload(latest, previous)
+
+
+def score_symbol(symbol: str, system_prompt: str, reports: dict | None = None) -> dict | None:
+    """Load the two reports and score them with GPT. Returns the GPT data or None."""
+    print(f"Processing scores for {symbol} ...")
+
+    payload = load_payload(symbol, reports)
+    if payload is None:
+        return None
 
-    payload = prepare_payload(latest, previous)
     gpt_data = call_gpt(system_prompt, payload)
     if not gpt_data:
         print(f"  No valid GPT data for {symbol}, skipping.")
-        return
+        return None
 
-    insert_score_row(gpt_data)
-    print(f"  Scores saved for {symbol}.")
+    return gpt_data
 
 
-def run_worker():
-    print("Starting analyst_financial_scores_worker...")
+def process_symbol(symbol: str, system_prompt: str, reports: dict | None = None):
+    gpt_data = score_symbol(symbol, system_prompt, reports)
+    if gpt_data:
+        insert_score_row(gpt_data)
+        print(f"  Scores saved for {symbol}.")
 
-    system_prompt = load_system_prompt()
-    symbols = get_symbols()
 
-    print(f"Found {len(symbols)} symbols to process.")
+def run_worker_batch(symbols: list[str], system_prompt: str, reports: dict | None):
+    """
+    Batch backend (LLM_BACKEND=batch): cache misses go out as one OpenAI
+    batch, then rows are inserted in symbol order as in the sync path.
+    """
+    payloads: dict[str, dict] = {}
+    answers: dict[str, dict | None] = {}
+    requests = []
 
     for symbol in symbols:
         try:
-            process_symbol(symbol, system_prompt)
+            payload = load_payload(symbol, reports)
+        except Exception as e:
+            print(f"Unexpected error loading reports for {symbol}: {e}")
+            continue
+        if payload is None:
+            continue
+
+        payloads[symbol] = payload
+        cached = get_cached_gpt_data(system_prompt, payload)
+        if cached is not None:
+            answers[symbol] = cached
+        else:
+            requests.append({
+                "custom_id": symbol,
+                "symbol": symbol,
+                "body": build_gpt_request(system_prompt, payload),
+            })
+
+    contents = openai_batch.run(requests, "analyst_financial_scores", step="financial_scores")
+
+    for symbol, payload in payloads.items():
+        try:
+            gpt_data = answers.get(symbol)
+            if gpt_data is None:
+                gpt_data = parse_gpt_content(contents.get(symbol))
+                if gpt_data is None:
+                    print(f"  No valid GPT data for {symbol}, skipping.")
+                    continue
+                llm_cache.put(MODEL, system_prompt, cache_message(system_prompt, payload), gpt_data)
+
+            insert_score_row(gpt_data)
+            print(f"  Scores saved for {symbol}.")
         except Exception as e:
             print(f"Unexpected error processing {symbol}: {e}")
 
+
+def run_worker():
+    print("Starting analyst_financial_scores_worker...")
+
+    system_prompt = load_system_prompt()
+    # the calendar can list a symbol more than once; score each one once
+    # whichever backend runs
+    symbols = list(dict.fromkeys(get_symbols()))
+
+    print(f"Found {len(symbols)} symbols to process.")
+
+    try:
+        reports = load_two_latest_reports(symbols)
+        print(f"Prefetched reports for {len(reports)} symbols.")
+    except Exception as e:
+        print(f"Error prefetching reports, falling back to per-symbol queries: {e}")
+        reports = None
+
+    if openai_batch.enabled():
+        run_worker_batch(symbols, system_prompt, reports)
+        llm_payload_encoder.log_savings()
+        llm_telemetry.flush()
+        print("Done.")
+        return
+
+    print(f"Scoring with {SCORING_WORKERS} concurrent GPT requests.")
+
+    # GPT calls run concurrently; rows are inserted in symbol order, each
+    # one as soon as it and every symbol before it are done.
+    with ThreadPoolExecutor(max_workers=max(1, SCORING_WORKERS)) as pool:
+        futures = [
+            (symbol, pool.submit(score_symbol, symbol, system_prompt, reports))
+            for symbol in symbols
+        ]
+
+        for symbol, future in futures:
+            try:
+                gpt_data = future.result()
+                if gpt_data:
+                    insert_score_row(gpt_data)
+                    print(f"  Scores saved for {symbol}.")
+            except Exception as e:
+                print(f"Unexpected error processing {symbol}: {e}")
+
+    llm_payload_encoder.log_savings()
+    llm_telemetry.flush()
     print("Done.")
 
 
@@ -2,65 +2,75 @@
 # Adds: D11 (last earnings date, earnings time, close before earnings)
 
 import os
-import requests
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from supabase import Client
 from datetime import datetime, timedelta
 
-load_dotenv()
+import fmp_client
+import supabase_batch
+from clients import get_supabase
+from supabase_reader import stream_rows
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-FMP_API_KEY = os.getenv("FMP_API_KEY")
+supabase: Client = get_supabase()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Concurrency – symbols in flight, and endpoint calls in flight across them.
+# The FMP quota itself is enforced by fmp_rate_limiter.
+SYMBOL_WORKERS = int(os.getenv("STATEMENTS_SYMBOL_WORKERS", "4"))
+FETCH_WORKERS = int(os.getenv("STATEMENTS_FETCH_WORKERS", "12"))
 
+# Records are buffered and written as multi-row upserts of this size
+UPSERT_BATCH_SIZE = int(os.getenv("STATEMENTS_UPSERT_BATCH_SIZE", "100"))
 
-# ---------------- FMP helpers ---------------- #
+TARGET_TABLE = "analyst_input_financial_statements"
+
+# Symbols whose report_date is at most this many days ago (or still ahead)
+# fetch their statements past the FMP disk cache, so a filing that lands
+# during the day is not hidden by a copy cached before it
+STATEMENTS_UNCACHED_DAYS = int(os.getenv("STATEMENTS_UNCACHED_DAYS", "1"))
 
-def fmp_get(path: str, params: dict | None = None):
-    if params is None:
-        params = {}
-    params["apikey"] = FMP_API_KEY
-    url = f"https://financialmodelingprep.com/api/v3{path}"
-    resp = requests.get(url, params=params, timeout=20)
-    resp.raise_for_status()
-    return resp.json()
+# D11 bulk lookup: how far back to look for the last earnings date, the
+# range per earning_calendar request, and symbols per price request
+D11_LOOKBACK_DAYS = int(os.getenv("D11_LOOKBACK_DAYS", "120"))
+D11_CALENDAR_CHUNK_DAYS = 30
+# FMP truncates range calendar responses without saying so; a window that
+# returns this many rows is treated as truncated and split
+D11_CALENDAR_ROW_CAP = int(os.getenv("D11_CALENDAR_ROW_CAP", "4000"))
+D11_PRICE_BATCH_SIZE = 5
 
+_buffer_lock = threading.Lock()
+_pending_records: dict[tuple, dict] = {}
 
-def get_income_statements(symbol: str, limit: int = 2):
-    return fmp_get(f"/income-statement/{symbol}",
-                   {"limit": limit, "period": "quarter"})
 
+# ---------------- FMP helpers ---------------- #
+
+def get_income_statements(symbol: str, limit: int = 2, use_cache: bool = True):
+    return fmp_client.income_statement(symbol, limit, use_cache=use_cache)
 
-def get_balance_sheets(symbol: str, limit: int = 8):
-    return fmp_get(f"/balance-sheet-statement/{symbol}",
-                   {"limit": limit, "period": "quarter"})
 
+def get_balance_sheets(symbol: str, limit: int = 8, use_cache: bool = True):
+    return fmp_client.balance_sheet_statement(symbol, limit, use_cache=use_cache)
 
-def get_cash_flows(symbol: str, limit: int = 8):
-    return fmp_get(f"/cash-flow-statement/{symbol}",
-                   {"limit": limit, "period": "quarter"})
 
+def get_cash_flows(symbol: str, limit: int = 8, use_cache: bool = True):
+    return fmp_client.cash_flow_statement(symbol, limit, use_cache=use_cache)
 
-def get_ratios(symbol: str, limit: int = 8):
-    return fmp_get(f"/ratios/{symbol}",
-                   {"limit": limit, "period": "quarter"})
 
+def get_ratios(symbol: str, limit: int = 8, use_cache: bool = True):
+    return fmp_client.ratios(symbol, limit, use_cache=use_cache)
 
-def get_financial_growth(symbol: str, limit: int = 2):
-    return fmp_get(f"/financial-growth/{symbol}",
-                   {"limit": limit, "period": "quarter"})
 
+def get_financial_growth(symbol: str, limit: int = 2, use_cache: bool = True):
+    return fmp_client.financial_growth(symbol, limit, use_cache=use_cache)
 
-def get_key_metrics(symbol: str, limit: int = 8):
-    return fmp_get(f"/key-metrics/{symbol}",
-                   {"limit": limit, "period": "quarter"})
+
+def get_key_metrics(symbol: str, limit: int = 8, use_cache: bool = True):
+    return fmp_client.key_metrics(symbol, limit, use_cache=use_cache)
 
 
 def get_rating(symbol: str):
     try:
-        data = fmp_get(f"/rating/{symbol}")
+        data = fmp_client.rating(symbol)
         return data[0] if data else None
     except:
         return None
@@ -68,7 +78,7 @@ def get_rating(symbol: str):
 
 def get_analyst_estimates(symbol: str):
     try:
-        data = fmp_get(f"/analyst-estimates/{symbol}")
+        data = fmp_client.analyst_estimates(symbol)
         return data[0] if data else None
     except:
         return None
@@ -77,8 +87,7 @@ def get_analyst_estimates(symbol: str):
 # ---------------- D11 helpers ---------------- #
 
 def get_last_earnings(symbol: str):
-    url = f"https://financialmodelingprep.com/api/v3/historical/earning_calendar/{symbol}?limit=10&apikey={FMP_API_KEY}"
-    r = requests.get(url).json()
+    r = fmp_client.historical_earning_calendar(symbol, limit=10)
 
     if not r:
         return None
@@ -100,13 +109,7 @@ def get_close_before_earnings(symbol: str, earnings_date: str):
 
     prev_str = (ed - timedelta(days=1)).strftime("%Y-%m-%d")
 
-    url = f"https://financialmodelingprep.com/api/v3/historical-price-full/{symbol}?from={prev_str}&to={prev_str}&apikey={FMP_API_KEY}"
-    r = requests.get(url).json()
-
-    try:
-        return r["historical"][0]["close"]
-    except:
-        return None
+    return _close_on_day(symbol, prev_str)
 
 
 def get_d11(symbol: str):
@@ -121,6 +124,163 @@ def get_d11(symbol: str):
     return earnings_date, earnings_time, close_before
 
 
+def _load_last_earnings_bulk(symbols: set[str]) -> dict[str, dict]:
+    """
+    Latest past earnings row per symbol from the range earning_calendar
+    (a handful of requests for the whole universe). A window that comes
+    back at D11_CALENDAR_ROW_CAP rows is split in half and refetched; if a
+    single day is still capped, symbols whose best date is older than that
+    day are left out, so build_d11_index() looks them up per symbol.
+    """
+    today = datetime.now().date()
+    start = today - timedelta(days=D11_LOOKBACK_DAYS)
+    last_by_symbol: dict[str, dict] = {}
+    truncated_day = None
+
+    windows = []
+    while start < today:
+        end = min(start + timedelta(days=D11_CALENDAR_CHUNK_DAYS), today - timedelta(days=1))
+        windows.append((start, end))
+        start = end + timedelta(days=1)
+
+    while windows:
+        start, end = windows.pop()
+        rows = fmp_client.earning_calendar(start.isoformat(), end.isoformat()) or []
+
+        if len(rows) >= D11_CALENDAR_ROW_CAP:
+            if start < end:
+                mid = start + (end - start) // 2
+                print(f"  D11: calendar {start}..{end} hit {len(rows)} rows – splitting")
+                windows.append((start, mid))
+                windows.append((mid + timedelta(days=1), end))
+                continue
+            print(f"  D11: calendar for {start} still capped at {len(rows)} rows")
+            truncated_day = max(truncated_day or start, start)
+
+        for row in rows:
+            sym = row.get("symbol")
+            d = row.get("date")
+            if sym not in symbols or not d or d >= today.isoformat():
+                continue
+            if sym not in last_by_symbol or d > last_by_symbol[sym]["date"]:
+                last_by_symbol[sym] = row
+
+    if truncated_day is not None:
+        last_by_symbol = {
+            sym: row for sym, row in last_by_symbol.items()
+            if row["date"] >= truncated_day.isoformat()
+        }
+
+    return last_by_symbol
+
+
+def _load_closes_bulk(prev_day_by_symbol: dict[str, str]) -> dict[str, float | None]:
+    """
+    Close on each symbol's day-before-earnings. Symbols sharing a date are
+    fetched together, D11_PRICE_BATCH_SIZE per request. A failed batch
+    falls back to one request per symbol.
+    """
+    by_date: dict[str, list[str]] = {}
+    for sym, day in prev_day_by_symbol.items():
+        by_date.setdefault(day, []).append(sym)
+
+    closes: dict[str, float | None] = {}
+    for day, syms in by_date.items():
+        for i in range(0, len(syms), D11_PRICE_BATCH_SIZE):
+            batch = syms[i:i + D11_PRICE_BATCH_SIZE]
+            try:
+                bars = fmp_client.historical_price_full_multi(batch, day, day)
+            except Exception as e:
+                print(f"  D11 price batch {batch} failed ({e}) – per-symbol fallback")
+                for sym in batch:
+                    closes[sym] = _close_on_day(sym, day)
+                continue
+
+            for sym in batch:
+                hist = bars.get(sym) or []
+                closes[sym] = hist[0].get("close") if hist else None
+
+    return closes
+
+
+def _close_on_day(symbol: str, day: str):
+    try:
+        r = fmp_client.historical_price_full(symbol, from_date=day, to_date=day)
+        return r["historical"][0]["close"]
+    except:
+        return None
+
+
+def build_d11_index(symbols: list[str]) -> dict[str, tuple]:
+    """
+    D11 for the whole universe: {symbol: (last_earnings_date, time, close_before)}.
+    Same result as get_d11() per symbol, but from a few range requests.
+    Symbols the range calendar does not cover fall back to get_last_earnings().
+    """
+    universe = set(symbols)
+    last_by_symbol = _load_last_earnings_bulk(universe)
+
+    missing = sorted(universe - set(last_by_symbol))
+    if missing:
+        print(f"  D11: {len(missing)} symbols not in range calendar – per-symbol lookup")
+    for sym in missing:
+        try:
+            last = get_last_earnings(sym)
+        except Exception as e:
+            print(f"  D11: error loading last earnings for {sym}: {e}")
+            continue
+        if last:
+            last_by_symbol[sym] = last
+
+    prev_day_by_symbol = {}
+    for sym, row in last_by_symbol.items():
+        try:
+            ed = datetime.strptime(row["date"], "%Y-%m-%d")
+        except:
+            continue
+        prev_day_by_symbol[sym] = (ed - timedelta(days=1)).strftime("%Y-%m-%d")
+
+    closes = _load_closes_bulk(prev_day_by_symbol)
+
+    index = {sym: (None, None, None) for sym in universe}
+    for sym, row in last_by_symbol.items():
+        index[sym] = (row.get("date"), row.get("time"), closes.get(sym))
+    return index
+
+
+# ---------------- Upsert buffer ---------------- #
+
+def queue_record(rec: dict) -> None:
+    """Buffer a record; flush once UPSERT_BATCH_SIZE records are waiting."""
+    with _buffer_lock:
+        # keyed like the conflict target – a batch must not hit a row twice
+        _pending_records[(rec["symbol"], rec["report_date"])] = rec
+        full = len(_pending_records) >= UPSERT_BATCH_SIZE
+
+    if full:
+        flush_records()
+
+
+def flush_records() -> tuple[int, int]:
+    """Write every buffered record. Returns (upserted, failed)."""
+    with _buffer_lock:
+        records = list(_pending_records.values())
+        _pending_records.clear()
+
+    if not records:
+        return 0, 0
+
+    failed = supabase_batch.write_rows(
+        TARGET_TABLE, records, on_conflict="symbol,report_date", batch_size=UPSERT_BATCH_SIZE
+    )
+    for rec, e in failed:
+        print(f"  Error upserting {rec['symbol']} {rec['report_date']}: {e}")
+
+    ok = len(records) - len(failed)
+    print(f"  Upserted {ok} records into {TARGET_TABLE} ({len(failed)} failed)")
+    return ok, len(failed)
+
+
 # ---------------- Core logic ---------------- #
 
 def build_record_from_row(
@@ -243,12 +403,25 @@ def build_record_from_row(
     }
 
 
-def process_symbol(symbol: str):
+def _rows_or_empty(future) -> list:
+    """Result of a list endpoint future, [] on error (same as the old try/except)."""
+    try:
+        return future.result() or []
+    except:
+        return []
+
+
+def process_symbol(
+    symbol: str,
+    fetch_pool: ThreadPoolExecutor,
+    d11_index: dict[str, tuple],
+    use_cache: bool = True,
+):
     print(f"Processing {symbol} ...")
 
-    # Base data
+    # Base data (fetched first – no point calling the rest without it)
     try:
-        income_list = get_income_statements(symbol, limit=2)
+        income_list = get_income_statements(symbol, limit=2, use_cache=use_cache)
     except Exception as e:
         print(f"  Error fetching income statements for {symbol}: {e}")
         return
@@ -259,31 +432,26 @@ def process_symbol(symbol: str):
 
     income_rows = income_list[:2]
 
-    try: balance_list = get_balance_sheets(symbol, limit=8)
-    except: balance_list = []
-    balance_by_date = {r.get("date"): r for r in balance_list or []}
+    # Fan out the remaining endpoint calls for this symbol
+    balance_f = fetch_pool.submit(get_balance_sheets, symbol, 8, use_cache)
+    cash_f = fetch_pool.submit(get_cash_flows, symbol, 8, use_cache)
+    ratios_f = fetch_pool.submit(get_ratios, symbol, 8, use_cache)
+    growth_f = fetch_pool.submit(get_financial_growth, symbol, 2, use_cache)
+    metrics_f = fetch_pool.submit(get_key_metrics, symbol, 8, use_cache)
+    rating_f = fetch_pool.submit(get_rating, symbol)
+    estimates_f = fetch_pool.submit(get_analyst_estimates, symbol)
 
-    try: cash_list = get_cash_flows(symbol, limit=8)
-    except: cash_list = []
-    cash_by_date = {r.get("date"): r for r in cash_list or []}
+    balance_by_date = {r.get("date"): r for r in _rows_or_empty(balance_f)}
+    cash_by_date = {r.get("date"): r for r in _rows_or_empty(cash_f)}
+    ratios_by_date = {r.get("date"): r for r in _rows_or_empty(ratios_f)}
+    growth_by_date = {r.get("date"): r for r in _rows_or_empty(growth_f)}
+    metrics_by_date = {r.get("date"): r for r in _rows_or_empty(metrics_f)}
 
-    try: ratios_list = get_ratios(symbol, limit=8)
-    except: ratios_list = []
-    ratios_by_date = {r.get("date"): r for r in ratios_list or []}
+    rating_row = rating_f.result()
+    estimates_row = estimates_f.result()
 
-    try: growth_list = get_financial_growth(symbol, limit=2)
-    except: growth_list = []
-    growth_by_date = {r.get("date"): r for r in growth_list or []}
-
-    try: metrics_list = get_key_metrics(symbol, limit=8)
-    except: metrics_list = []
-    metrics_by_date = {r.get("date"): r for r in metrics_list or []}
-
-    rating_row = get_rating(symbol)
-    estimates_row = get_analyst_estimates(symbol)
-
-    # D11
-    d11_data = get_d11(symbol)
+    # D11 (prefetched for the whole universe; per-symbol only as a fallback)
+    d11_data = d11_index.get(symbol) or get_d11(symbol)
 
     # Merge to records
     for income_row in income_rows:
@@ -304,31 +472,59 @@ def process_symbol(symbol: str):
             d11_data,
         )
 
-        try:
-            supabase.table("analyst_input_financial_statements") \
-                .upsert(rec, on_conflict="symbol,report_date") \
-                .execute()
-            print(f"  Upserted {symbol} {report_date}")
-        except Exception as e:
-            print(f"  Error upserting {symbol} {report_date}: {e}")
+        queue_record(rec)
 
 
 def run_worker():
     print("Starting analyst_financial_statements_worker...")
 
     try:
-        res = supabase.table("earnings_calendar_us").select("symbol").execute()
-        symbols = [row["symbol"] for row in res.data]
+        rows = list(stream_rows("earnings_calendar_us", "symbol,report_date", key="id"))
+        symbols = [row["symbol"] for row in rows]
     except Exception as e:
         print(f"Error loading symbols: {e}")
         return
 
-    for symbol in symbols:
-        try:
-            process_symbol(symbol)
-        except Exception as e:
-            print(f"Unexpected error processing {symbol}: {e}")
+    # Reporting now: statements may land mid-run, so skip the disk cache
+    recent = (datetime.now().date() - timedelta(days=STATEMENTS_UNCACHED_DAYS)).isoformat()
+    uncached = {
+        row["symbol"] for row in rows
+        if row.get("report_date") and str(row["report_date"])[:10] >= recent
+    }
+
+    print(
+        f"Processing {len(symbols)} symbols | symbol_workers={SYMBOL_WORKERS} "
+        f"fetch_workers={FETCH_WORKERS} uncached={len(uncached)}"
+    )
+
+    try:
+        d11_index = build_d11_index(symbols)
+        print(f"D11 index built for {len(d11_index)} symbols")
+    except Exception as e:
+        print(f"Error building D11 index, falling back to per-symbol D11: {e}")
+        d11_index = {}
 
+    # Symbols run concurrently; each symbol fans its endpoint calls out to
+    # fetch_pool. Total FMP throughput is capped by fmp_rate_limiter.
+    try:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as fetch_pool, \
+                ThreadPoolExecutor(max_workers=SYMBOL_WORKERS) as symbol_pool:
+            futures = {
+                symbol_pool.submit(
+                    process_symbol, symbol, fetch_pool, d11_index, symbol not in uncached
+                ): symbol
+                for symbol in symbols
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Unexpected error processing {futures[future]}: {e}")
+    finally:
+        # Whatever is still buffered – also on Ctrl-C / fatal errors
+        flush_records()
+
+    fmp_client.log_latency_report()
     print("Done.")
 
 
@@ -1,64 +1,208 @@
-import os
-from supabase import create_client, Client
+from supabase import Client
 from datetime import datetime
+import hashlib
+import json
+import os
+
+import supabase_batch
+from clients import get_supabase
+from supabase_reader import stream_rows
+
+supabase: Client = get_supabase()
+
+SCORES_TABLE = "analyst_financial_scores"
+HISTORY_TABLE = "analyst_financial_scores_history"
+HISTORY_LATEST_VIEW = "analyst_financial_scores_history_latest"
+HISTORY_BATCH_SIZE = 500
+TOUCH_CHUNK = 200
+
+# diff: insert a history row only when a symbol's scored columns changed
+#       since its latest history row (sql/scores_history_diff.sql)
+# full: copy every score row on every run
+SCORES_HISTORY_MODE = os.getenv("SCORES_HISTORY_MODE", "diff")
+
+# Columns of a history row that are bookkeeping rather than scores; they
+# are left out of row_hash so an unchanged symbol hashes the same each run.
+UNHASHED_COLUMNS = {"original_id", "analysis_date", "news_updated_at", "saved_at"}
+
+
+def to_history_row(row: dict, saved_at: str) -> dict:
+    return {
+        "original_id": row["id"],
+        "symbol": row["symbol"],
+        "last_earnings_date": row["last_earnings_date"],
+        "analysis_date": row["analysis_date"],
+        "echo_price": row["echo_price"],
+
+        # --- core scores ---
+        "total_score": row["total_score"],
+        "profitability": row["profitability"],
+        "growth": row["growth"],
+        "financial_strength": row["financial_strength"],
+
+        # --- targets ---
+        "target_range_low": row["target_range_low"],
+        "target_range_high": row["target_range_high"],
+
+        # --- AI text ---
+        "swing_forecast_weeks_2_3": row["swing_forecast_weeks_2_3"],
+        "volatility_flag": row["volatility_flag"],
+        "summary_30_words": row["summary_30_words"],
+        "comparison_trend": row["comparison_trend"],
+        "direction": row["direction"],
+
+        # --- 🔥 NEWS / EARNINGS FIELDS (NEW) ---
+        "news_bias_label": row["news_bias_label"],
+        "news_bias_strength": row["news_bias_strength"],
+        "news_score": row["news_score"],
+        "final_weighted_score": row["final_weighted_score"],
+        "news_updated_at": row["news_updated_at"],
+
+        # --- meta ---
+        "saved_at": saved_at
+    }
+
+
+def row_hash(history_row: dict) -> str:
+    """Stable sha256 of the scored columns of a history row."""
+    scored = {k: v for k, v in history_row.items() if k not in UNHASHED_COLUMNS}
+    encoded = json.dumps(scored, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def snapshot_via_rpc() -> int:
+    """
+    Server-side INSERT ... SELECT (sql/scores_history_snapshot.sql):
+    replaces the history of every analysis_date in the scores table in one
+    transaction. Returns the number of rows copied.
+    """
+    res = supabase.rpc("snapshot_analyst_financial_scores_history", {}).execute()
+    return int(res.data or 0)
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def snapshot_batched() -> int:
+    """
+    Client-side fallback with the same result: delete the analysis_dates
+    being snapshotted from history, then insert in batches.
+    """
+    saved_at = datetime.utcnow().isoformat()
+    rows = [
+        to_history_row(row, saved_at)
+        for row in stream_rows(SCORES_TABLE, "*", key="id", client=supabase)
+    ]
+    if not rows:
+        return 0
+
+    # Reruns replace the day's snapshot instead of duplicating it
+    for analysis_date in sorted({r["analysis_date"] for r in rows if r["analysis_date"]}):
+        supabase.table(HISTORY_TABLE).delete().eq("analysis_date", analysis_date).execute()
+        print(f"Cleared history for analysis_date={analysis_date}")
+
+    failed = supabase_batch.write_rows(HISTORY_TABLE, rows, batch_size=HISTORY_BATCH_SIZE)
+    for row, e in failed:
+        print(f"Error inserting history for {row['symbol']}: {e}")
+
+    return len(rows) - len(failed)
+
+
+def load_latest_hashes(symbols: list[str]) -> dict[str, dict]:
+    """
+    {symbol: {"id", "row_hash", "analysis_date"}} of the latest history row
+    of each of `symbols`.
+    """
+    latest = {}
+    for i in range(0, len(symbols), TOUCH_CHUNK):
+        chunk = symbols[i:i + TOUCH_CHUNK]
+        rows = stream_rows(
+            HISTORY_LATEST_VIEW, "id,row_hash,analysis_date", key="symbol",
+            where=lambda q, chunk=chunk: q.in_("symbol", chunk), client=supabase,
+        )
+        latest.update((r["symbol"], r) for r in rows)
+    return latest
+
+
+def touch_last_seen(ids: list, seen_at: str) -> None:
+    for i in range(0, len(ids), TOUCH_CHUNK):
+        chunk = ids[i:i + TOUCH_CHUNK]
+        supabase.table(HISTORY_TABLE).update({"last_seen_at": seen_at}).in_("id", chunk).execute()
+
+
+def snapshot_diff() -> tuple[int, int, int]:
+    """
+    Change-only snapshot: insert rows whose hash differs from the symbol's
+    latest history row, bump last_seen_at on the rest. A changed row for
+    the same analysis_date as that latest row (a same-day rerun) replaces
+    it, so there is still one history row per symbol and analysis_date.
+    Returns (inserted, replaced, unchanged).
+    """
+    saved_at = datetime.utcnow().isoformat()
+    history_rows = [
+        to_history_row(row, saved_at)
+        for row in stream_rows(SCORES_TABLE, "*", key="id", client=supabase)
+    ]
+    latest = load_latest_hashes(sorted({r["symbol"] for r in history_rows}))
+
+    inserts = []
+    replaces = []
+    unchanged_ids = []
+    for history_row in history_rows:
+        history_row["row_hash"] = row_hash(history_row)
+        history_row["last_seen_at"] = saved_at
+
+        prev = latest.get(history_row["symbol"])
+        if prev and prev.get("row_hash") == history_row["row_hash"]:
+            unchanged_ids.append(prev["id"])
+        elif prev and prev.get("analysis_date") == history_row["analysis_date"]:
+            replaces.append(dict(history_row, id=prev["id"]))
+        else:
+            inserts.append(history_row)
+
+    failed_inserts = supabase_batch.write_rows(HISTORY_TABLE, inserts, batch_size=HISTORY_BATCH_SIZE)
+    failed_replaces = supabase_batch.write_rows(
+        HISTORY_TABLE, replaces, on_conflict="id", batch_size=HISTORY_BATCH_SIZE
+    )
+    for row, e in failed_inserts + failed_replaces:
+        print(f"Error writing history for {row['symbol']}: {e}")
+
+    touch_last_seen(unchanged_ids, saved_at)
+    return (
+        len(inserts) - len(failed_inserts),
+        len(replaces) - len(failed_replaces),
+        len(unchanged_ids),
+    )
+
+
+def snapshot_full() -> int:
+    try:
+        inserted = snapshot_via_rpc()
+        print("Snapshot done server-side.")
+    except Exception as e:
+        print(f"Snapshot RPC unavailable ({e}) – using batched inserts.")
+        inserted = snapshot_batched()
+    return inserted
+
 
 def build_history():
-    print("Fetching analyst_financial_scores...")
+    print(f"Snapshotting {SCORES_TABLE} into {HISTORY_TABLE} (mode={SCORES_HISTORY_MODE})...")
+
+    if SCORES_HISTORY_MODE == "diff":
+        try:
+            inserted, replaced, unchanged = snapshot_diff()
+            print(
+                f"DONE. Inserted {inserted} changed rows, replaced {replaced} same-day rows, "
+                f"{unchanged} unchanged (last_seen_at updated)."
+            )
+            return
+        except Exception as e:
+            print(f"Diff snapshot unavailable ({e}) – falling back to a full snapshot.")
 
-    response = supabase.table("analyst_financial_scores").select("*").execute()
+    inserted = snapshot_full()
 
-    if not response.data:
+    if not inserted:
         print("No rows found.")
         return
 
-    rows = response.data
-    print(f"Inserting {len(rows)} rows into history...")
-
-    for row in rows:
-        history_row = {
-            "original_id": row["id"],
-            "symbol": row["symbol"],
-            "last_earnings_date": row["last_earnings_date"],
-            "analysis_date": row["analysis_date"],
-            "echo_price": row["echo_price"],
-
-            # --- core scores ---
-            "total_score": row["total_score"],
-            "profitability": row["profitability"],
-            "growth": row["growth"],
-            "financial_strength": row["financial_strength"],
-
-            # --- targets ---
-            "target_range_low": row["target_range_low"],
-            "target_range_high": row["target_range_high"],
-
-            # --- AI text ---
-            "swing_forecast_weeks_2_3": row["swing_forecast_weeks_2_3"],
-            "volatility_flag": row["volatility_flag"],
-            "summary_30_words": row["summary_30_words"],
-            "comparison_trend": row["comparison_trend"],
-            "direction": row["direction"],
-
-            # --- 🔥 NEWS / EARNINGS FIELDS (NEW) ---
-            "news_bias_label": row["news_bias_label"],
-            "news_bias_strength": row["news_bias_strength"],
-            "news_score": row["news_score"],
-            "final_weighted_score": row["final_weighted_score"],
-            "news_updated_at": row["news_updated_at"],
-
-            # --- meta ---
-            "saved_at": datetime.utcnow().isoformat()
-        }
-
-        supabase.table("analyst_financial_scores_history").insert(history_row).execute()
-        print(f"Inserted: {row['symbol']}")
-
-    print("DONE.")
+    print(f"DONE. Inserted {inserted} rows into history.")
 
 if __name__ == "__main__":
     build_history()
@@ -1,10 +1,6 @@
-import supabase
-import os
+from clients import get_supabase
 
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-sb = supabase.create_client(url, key)
+sb = get_supabase()
 
 def main():
     print("Cleaning earnings_calendar_us...")
@@ -0,0 +1,51 @@
+# clients.py
+#
+# Shared Supabase / OpenAI clients.
+# Every worker gets its clients from here, so when the pipeline runs the
+# steps in one process (analyst44worker.py default mode) they all share
+# the same warm clients and HTTP connection pools.
+
+import os
+import threading
+
+from dotenv import load_dotenv
+from supabase import create_client, Client
+from openai import OpenAI
+
+load_dotenv()
+
+_lock = threading.Lock()
+_supabase: Client | None = None
+_openai: OpenAI | None = None
+
+
+def get_supabase() -> Client:
+    """Return the process-wide Supabase client (created on first use)."""
+    global _supabase
+    with _lock:
+        if _supabase is None:
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not url or not key:
+                raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
+            _supabase = create_client(url, key)
+        return _supabase
+
+
+def get_openai(max_retries: int | None = None) -> OpenAI:
+    """
+    Return the process-wide OpenAI client (created on first use).
+    max_retries overrides the SDK's own retry count on a copy that shares
+    the same connection pool; callers that retry through openai_throttle
+    pass max_retries=0 so every 429 reaches the shared backoff.
+    """
+    global _openai
+    with _lock:
+        if _openai is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError("Missing OPENAI_API_KEY")
+            _openai = OpenAI(api_key=api_key)
+        if max_retries is not None:
+            return _openai.with_options(max_retries=max_retries)
+        return _openai
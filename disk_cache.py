@@ -0,0 +1,113 @@
+# disk_cache.py
+#
+# Small persistent key/value cache on local disk (one SQLite file per
+# namespace). Values are JSON. Entries can expire (TTL) and every
+# namespace is size-bounded: the least recently used entries are evicted.
+# Safe to use from several threads and processes at once.
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+CACHE_DIR = os.getenv(
+    "A44_CACHE_DIR", os.path.join(tempfile.gettempdir(), "analyst44_cache")
+)
+
+_local = threading.local()
+
+
+def _connect(namespace: str) -> sqlite3.Connection:
+    """One connection per (thread, namespace)."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(namespace)
+    if conn is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(
+            os.path.join(CACHE_DIR, f"{namespace}.sqlite"), timeout=30, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        conns[namespace] = conn
+    return conn
+
+
+def get(namespace: str, key: str):
+    """Return (hit, value). Expired entries are a miss."""
+    conn = _connect(namespace)
+    now = time.time()
+    row = conn.execute(
+        "SELECT value FROM entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+        (key, now),
+    ).fetchone()
+    if row is None:
+        return False, None
+
+    conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+    return True, json.loads(row[0])
+
+
+def put(namespace: str, key: str, value, ttl_seconds: float | None, max_bytes: int) -> None:
+    """
+    Store a JSON-serialisable value. ttl_seconds=None never expires.
+    After the write the namespace is trimmed to max_bytes (expired
+    entries first, then least recently used).
+    """
+    conn = _connect(namespace)
+    now = time.time()
+    text = json.dumps(value, default=str)
+    expires_at = None if ttl_seconds is None else now + ttl_seconds
+
+    conn.execute(
+        "INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_access) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (key, text, len(text), expires_at, now),
+    )
+    _evict(conn, now, max_bytes)
+
+
+def delete(namespace: str, key: str) -> None:
+    _connect(namespace).execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
+def clear(namespace: str) -> int:
+    """Drop every entry of a namespace. Returns the number of entries removed."""
+    cur = _connect(namespace).execute("DELETE FROM entries")
+    return cur.rowcount
+
+
+def _evict(conn: sqlite3.Connection, now: float, max_bytes: int) -> None:
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= max_bytes:
+        return
+
+    conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    # Oldest first until we are under the bound
+    while total > max_bytes:
+        rows = conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC LIMIT 100"
+        ).fetchall()
+        if not rows:
+            break
+        freed = []
+        for key, size in rows:
+            freed.append(key)
+            total -= size
+            if total <= max_bytes:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in freed])
@@ -1,8 +1,9 @@
 import requests
 import json
-import os
 from datetime import datetime
-from supabase import create_client, Client
+from supabase import Client
+
+from clients import get_supabase
 
 # --------------------------------------------------------
 # CONFIG
@@ -10,9 +11,7 @@ from supabase import create_client, Client
 NASDAQ_URL = "https://api.nasdaq.com/api/calendar/earnings?date={date}"
 HEADERS = {"User-Agent": "Mozilla/5.0", "Accept": "application/json"}
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_supabase()
 
 
 # --------------------------------------------------------
@@ -0,0 +1,398 @@
+# fmp_client.py
+#
+# Shared HTTP client for financialmodelingprep.com (FMP).
+# - one pooled keep-alive requests.Session per process
+# - the same timeout on every call
+# - typed helpers per endpoint
+# - per-endpoint latency accounting (log_latency_report())
+# - shared rate limit (fmp_rate_limiter) with back-off on 429; 429 and 5xx
+#   retries each take a token
+# - on-disk response cache with a TTL per endpoint family (disk_cache)
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date
+from urllib.parse import quote
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import disk_cache
+import fmp_rate_limiter
+
+load_dotenv()
+
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+FMP_BASE_URL = "https://financialmodelingprep.com/api/v3"
+
+FMP_TIMEOUT_SECONDS = float(os.getenv("FMP_TIMEOUT_SECONDS", "20"))
+FMP_POOL_SIZE = int(os.getenv("FMP_POOL_SIZE", "16"))
+
+# How many times a 429 is retried, and the back-off when FMP sends no Retry-After
+FMP_MAX_429_RETRIES = int(os.getenv("FMP_MAX_429_RETRIES", "3"))
+FMP_429_BACKOFF_SECONDS = float(os.getenv("FMP_429_BACKOFF_SECONDS", "5"))
+
+# 502/503/504 are retried here too (not in the urllib3 adapter), so every
+# retry takes its own rate-limiter token. Back-off doubles per attempt.
+FMP_MAX_5XX_RETRIES = int(os.getenv("FMP_MAX_5XX_RETRIES", "2"))
+FMP_5XX_BACKOFF_SECONDS = float(os.getenv("FMP_5XX_BACKOFF_SECONDS", "0.5"))
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+# Response cache. FMP_CACHE_BYPASS=1 skips cache reads (fresh responses
+# are still stored). TTLs are in seconds; 0 = never cached.
+FMP_CACHE_BYPASS = os.getenv("FMP_CACHE_BYPASS", "0") == "1"
+FMP_CACHE_MAX_BYTES = int(float(os.getenv("FMP_CACHE_MAX_MB", "256")) * 1024 * 1024)
+CACHE_NAMESPACE = "fmp"
+
+# Quarterly fundamentals change at most once a quarter; keep it under a day
+# by default – that still covers every rerun of the nightly pipeline.
+# Callers pass use_cache=False for symbols that are reporting right now.
+TTL_STATEMENTS = float(os.getenv("FMP_CACHE_TTL_STATEMENTS", str(12 * 3600)))
+TTL_REFERENCE = float(os.getenv("FMP_CACHE_TTL_REFERENCE", str(6 * 3600)))
+TTL_CLOSED_PRICES = float(os.getenv("FMP_CACHE_TTL_CLOSED_PRICES", str(30 * 24 * 3600)))
+
+CACHE_TTLS = {
+    "income-statement": TTL_STATEMENTS,
+    "balance-sheet-statement": TTL_STATEMENTS,
+    "cash-flow-statement": TTL_STATEMENTS,
+    "ratios": TTL_STATEMENTS,
+    "financial-growth": TTL_STATEMENTS,
+    "key-metrics": TTL_STATEMENTS,
+    "rating": TTL_REFERENCE,
+    "analyst-estimates": TTL_REFERENCE,
+    "historical-earning-calendar": TTL_REFERENCE,
+    "earning-calendar": TTL_REFERENCE,
+    # quote, historical-chart-*, stock_news and open-ended price history:
+    # live data, never cached
+}
+
+_session_lock = threading.Lock()
+_session: requests.Session | None = None
+
+_stats_lock = threading.Lock()
+_stats: dict[str, dict] = {}
+
+
+# ---------------- Session ---------------- #
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled session (created on first use)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            # connection-level retries only; status retries go through
+            # _fetch() so they are rate limited
+            retry = Retry(
+                total=2,
+                status=0,
+                backoff_factor=0.5,
+                status_forcelist=(),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=FMP_POOL_SIZE,
+                pool_maxsize=FMP_POOL_SIZE,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+# ---------------- Latency accounting ---------------- #
+
+def _endpoint_stats(endpoint: str) -> dict:
+    # caller holds _stats_lock
+    return _stats.setdefault(
+        endpoint,
+        {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0, "throttled_s": 0.0,
+         "cache_hits": 0},
+    )
+
+
+def _record_throttle(endpoint: str, waited: float) -> None:
+    if waited <= 0:
+        return
+    with _stats_lock:
+        _endpoint_stats(endpoint)["throttled_s"] += waited
+
+
+def _record_cache_hit(endpoint: str) -> None:
+    with _stats_lock:
+        _endpoint_stats(endpoint)["cache_hits"] += 1
+
+
+def _record(endpoint: str, elapsed: float, ok: bool) -> None:
+    with _stats_lock:
+        s = _endpoint_stats(endpoint)
+        s["calls"] += 1
+        s["total_s"] += elapsed
+        s["max_s"] = max(s["max_s"], elapsed)
+        if not ok:
+            s["errors"] += 1
+
+
+def latency_report() -> dict[str, dict]:
+    """Snapshot of per-endpoint stats: calls, errors, total_s, avg_s, max_s, throttled_s, cache_hits."""
+    with _stats_lock:
+        report = {}
+        for endpoint, s in _stats.items():
+            report[endpoint] = dict(s, avg_s=s["total_s"] / s["calls"] if s["calls"] else 0.0)
+        return report
+
+
+def log_latency_report() -> None:
+    report = latency_report()
+    if not report:
+        return
+    print("FMP latency by endpoint:")
+    for endpoint, s in sorted(report.items(), key=lambda kv: -kv[1]["total_s"]):
+        print(
+            f"  {endpoint:<28} calls={s['calls']:<5} hits={s['cache_hits']:<5} "
+            f"errors={s['errors']:<4} "
+            f"avg={s['avg_s'] * 1000:.0f}ms max={s['max_s'] * 1000:.0f}ms "
+            f"total={s['total_s']:.1f}s throttled={s['throttled_s']:.1f}s"
+        )
+
+
+# ---------------- Core GET ---------------- #
+
+def _cache_key(path: str, params: dict) -> str:
+    raw = json.dumps([path, sorted(params.items())], default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def fmp_get(
+    path: str,
+    params: dict | None = None,
+    endpoint: str | None = None,
+    cache_ttl: float | None = None,
+    use_cache: bool = True,
+):
+    """
+    GET {FMP_BASE_URL}{path} and return the parsed JSON.
+    Raises requests.HTTPError on non-2xx responses.
+    `endpoint` is the name used for latency accounting and for the cache
+    TTL lookup in CACHE_TTLS (defaults to the first path segment).
+    `cache_ttl` overrides that TTL; use_cache=False skips the cache.
+    Every attempt takes a token from the shared FMP rate limiter; a 429
+    empties the bucket for all processes and is retried.
+    """
+    if not FMP_API_KEY:
+        raise RuntimeError("Missing FMP_API_KEY")
+
+    params = dict(params or {})
+    endpoint = endpoint or path.strip("/").split("/")[0]
+
+    ttl = CACHE_TTLS.get(endpoint, 0) if cache_ttl is None else cache_ttl
+    cache_key = _cache_key(path, params) if use_cache and ttl > 0 else None
+
+    if cache_key and not FMP_CACHE_BYPASS:
+        hit, data = disk_cache.get(CACHE_NAMESPACE, cache_key)
+        if hit:
+            _record_cache_hit(endpoint)
+            return data
+
+    params["apikey"] = FMP_API_KEY
+    data = _fetch(path, params, endpoint)
+
+    # Empty answers are often transient on FMP – do not pin them
+    if cache_key and data:
+        disk_cache.put(CACHE_NAMESPACE, cache_key, data, ttl, FMP_CACHE_MAX_BYTES)
+    return data
+
+
+def _fetch(path: str, params: dict, endpoint: str):
+    """
+    One rate-limited GET, timed into the endpoint stats. 429 and 502/503/504
+    are retried; each attempt takes its own rate-limiter token.
+    """
+    attempt = 0
+    attempt_5xx = 0
+    backoff = 0.0
+    while True:
+        if backoff:
+            time.sleep(backoff)
+            backoff = 0.0
+        _record_throttle(endpoint, fmp_rate_limiter.acquire())
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            resp = get_session().get(
+                f"{FMP_BASE_URL}{path}", params=params, timeout=FMP_TIMEOUT_SECONDS
+            )
+            if resp.status_code == 429 and attempt < FMP_MAX_429_RETRIES:
+                attempt += 1
+                fmp_rate_limiter.penalize(_retry_after_seconds(resp))
+                continue
+            if resp.status_code in RETRY_STATUSES and attempt_5xx < FMP_MAX_5XX_RETRIES:
+                backoff = FMP_5XX_BACKOFF_SECONDS * 2 ** attempt_5xx
+                attempt_5xx += 1
+                continue
+            resp.raise_for_status()
+            data = resp.json()
+            ok = True
+            return data
+        finally:
+            _record(endpoint, time.perf_counter() - started, ok)
+
+
+def _retry_after_seconds(resp: requests.Response) -> float:
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return FMP_429_BACKOFF_SECONDS
+
+
+def _sym(symbol: str) -> str:
+    # ^VIX -> %5EVIX, keep commas for multi-symbol paths
+    return quote(symbol, safe=",")
+
+
+# ---------------- Fundamentals ---------------- #
+# use_cache=False for symbols that are reporting right now: a statement
+# cached before the filing landed would otherwise hide it for TTL_STATEMENTS.
+
+def income_statement(
+    symbol: str, limit: int, period: str = "quarter", use_cache: bool = True
+) -> list[dict]:
+    return fmp_get(f"/income-statement/{_sym(symbol)}",
+                   {"limit": limit, "period": period}, endpoint="income-statement",
+                   use_cache=use_cache)
+
+
+def balance_sheet_statement(
+    symbol: str, limit: int, period: str = "quarter", use_cache: bool = True
+) -> list[dict]:
+    return fmp_get(f"/balance-sheet-statement/{_sym(symbol)}",
+                   {"limit": limit, "period": period}, endpoint="balance-sheet-statement",
+                   use_cache=use_cache)
+
+
+def cash_flow_statement(
+    symbol: str, limit: int, period: str = "quarter", use_cache: bool = True
+) -> list[dict]:
+    return fmp_get(f"/cash-flow-statement/{_sym(symbol)}",
+                   {"limit": limit, "period": period}, endpoint="cash-flow-statement",
+                   use_cache=use_cache)
+
+
+def ratios(
+    symbol: str, limit: int, period: str = "quarter", use_cache: bool = True
+) -> list[dict]:
+    return fmp_get(f"/ratios/{_sym(symbol)}",
+                   {"limit": limit, "period": period}, endpoint="ratios",
+                   use_cache=use_cache)
+
+
+def financial_growth(
+    symbol: str, limit: int, period: str = "quarter", use_cache: bool = True
+) -> list[dict]:
+    return fmp_get(f"/financial-growth/{_sym(symbol)}",
+                   {"limit": limit, "period": period}, endpoint="financial-growth",
+                   use_cache=use_cache)
+
+
+def key_metrics(
+    symbol: str, limit: int, period: str = "quarter", use_cache: bool = True
+) -> list[dict]:
+    return fmp_get(f"/key-metrics/{_sym(symbol)}",
+                   {"limit": limit, "period": period}, endpoint="key-metrics",
+                   use_cache=use_cache)
+
+
+def rating(symbol: str) -> list[dict]:
+    return fmp_get(f"/rating/{_sym(symbol)}", endpoint="rating")
+
+
+def analyst_estimates(symbol: str) -> list[dict]:
+    return fmp_get(f"/analyst-estimates/{_sym(symbol)}", endpoint="analyst-estimates")
+
+
+# ---------------- Earnings / prices ---------------- #
+
+def historical_earning_calendar(symbol: str, limit: int = 10) -> list[dict]:
+    return fmp_get(f"/historical/earning_calendar/{_sym(symbol)}",
+                   {"limit": limit}, endpoint="historical-earning-calendar")
+
+
+def earning_calendar(from_date: str, to_date: str) -> list[dict]:
+    """All companies' earnings between from_date and to_date (FMP caps the range at ~3 months)."""
+    return fmp_get("/earning_calendar", {"from": from_date, "to": to_date},
+                   endpoint="earning-calendar")
+
+
+def historical_price_full(
+    symbol: str,
+    from_date: str | None = None,
+    to_date: str | None = None,
+    timeseries: int | None = None,
+) -> dict:
+    params = {}
+    if from_date:
+        params["from"] = from_date
+    if to_date:
+        params["to"] = to_date
+    if timeseries:
+        params["timeseries"] = timeseries
+
+    # A window that ended before today will not change any more
+    closed = bool(to_date) and to_date < date.today().isoformat()
+    return fmp_get(f"/historical-price-full/{_sym(symbol)}",
+                   params, endpoint="historical-price-full",
+                   cache_ttl=TTL_CLOSED_PRICES if closed else 0)
+
+
+def historical_price_full_multi(
+    symbols: list[str], from_date: str, to_date: str
+) -> dict[str, list[dict]]:
+    """
+    Daily bars for several symbols in one request (FMP allows up to 5).
+    Returns {symbol: historical bars}; symbols without data are absent.
+    """
+    data = historical_price_full(",".join(symbols), from_date=from_date, to_date=to_date)
+    if not data:
+        return {}
+
+    # one symbol -> {"symbol", "historical"}; several -> {"historicalStockList": [...]}
+    stock_list = data.get("historicalStockList") if isinstance(data, dict) else None
+    if stock_list is None:
+        stock_list = [data] if isinstance(data, dict) else []
+
+    return {
+        item["symbol"]: item.get("historical") or []
+        for item in stock_list
+        if item.get("symbol")
+    }
+
+
+def historical_chart(interval: str, symbol: str) -> list[dict]:
+    return fmp_get(f"/historical-chart/{interval}/{_sym(symbol)}",
+                   endpoint=f"historical-chart-{interval}")
+
+
+def quote_symbol(symbol: str) -> list[dict]:
+    return fmp_get(f"/quote/{_sym(symbol)}", endpoint="quote")
+
+
+# ---------------- News ---------------- #
+
+def stock_news(limit: int, **params) -> list[dict]:
+    return fmp_get("/stock_news", dict(params, limit=limit), endpoint="stock_news")
+
+
+def stock_news_multi(symbols: list[str], limit: int, **params) -> list[dict]:
+    """
+    News for several tickers in one request, newest first across all of
+    them; each item carries its "symbol". `limit` caps the whole response.
+    """
+    return fmp_get("/stock_news", dict(params, tickers=",".join(symbols), limit=limit),
+                   endpoint="stock_news")
@@ -1,19 +1,39 @@
 import os
-import requests
-from datetime import datetime
-from supabase import create_client, Client
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+from supabase import Client
+
+import fmp_client
+import supabase_batch
+from clients import get_supabase
+from supabase_reader import stream_rows
 
 # =============================
 # CONFIG
 # =============================
 
-FMP_API_KEY = os.getenv("FMP_API_KEY")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase: Client = get_supabase()
+
+NEWS_TABLE = "fmp_news"
+STATE_TABLE = "news_fetch_state"
+
+NEWS_PAGE_LIMIT = int(os.getenv("NEWS_PAGE_LIMIT", "20"))
+NEWS_MAX_PAGES = int(os.getenv("NEWS_MAX_PAGES", "5"))
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# batch: one stock_news request per chunk of tickers (fetch_chunk)
+# symbol: one request (or more, paging) per symbol (fetch_new_news)
+NEWS_FETCH_MODE = os.getenv("NEWS_FETCH_MODE", "batch")
 
-FMP_URL = "https://financialmodelingprep.com/api/v3/stock_news"
+# Multi-ticker chunks: items per request, items budgeted per ticker (so a
+# chunk holds NEWS_BATCH_LIMIT // NEWS_BATCH_ITEMS_PER_SYMBOL tickers) and
+# the longest tickers= value, URL-encoded, a request may carry.
+NEWS_BATCH_LIMIT = int(os.getenv("NEWS_BATCH_LIMIT", "200"))
+NEWS_BATCH_ITEMS_PER_SYMBOL = int(os.getenv("NEWS_BATCH_ITEMS_PER_SYMBOL", "10"))
+NEWS_BATCH_MAX_TICKERS_CHARS = int(os.getenv("NEWS_BATCH_MAX_TICKERS_CHARS", "1500"))
+NEWS_BATCH_MAX_PAGES = int(os.getenv("NEWS_BATCH_MAX_PAGES", "2"))
+
+# is_earnings_related() keeps news within ±3 days of the report
+EARNINGS_WINDOW_DAYS = 3
 
 # =============================
 # EARNINGS-RELATED FILTER
@@ -81,24 +101,263 @@ def is_earnings_related(news: dict, earnings_date: str | None) -> bool:
 # =============================
 
 def get_earnings_symbols():
-    res = (
-        supabase
-        .table("earnings_calendar_us")
-        .select("symbol, report_date")
-        .execute()
-    )
-    return res.data or []
-
-def fetch_news_for_symbol(symbol: str):
-    params = {
-        "symbol": symbol,
-        "limit": 20,
-        "apikey": FMP_API_KEY
+    return list(stream_rows(
+        "earnings_calendar_us", "symbol,report_date", key="id", client=supabase
+    ))
+
+def _published(news: dict) -> datetime | None:
+    try:
+        return datetime.fromisoformat(news["publishedDate"][:19])
+    except Exception:
+        return None
+
+# =============================
+# CURSORS (news_fetch_state)
+# =============================
+
+def load_cursors() -> dict[str, datetime]:
+    """{symbol: latest publishedDate already fetched}; {} if the table is missing."""
+    try:
+        return {
+            r["symbol"]: datetime.fromisoformat(r["last_published_at"][:19])
+            for r in stream_rows(STATE_TABLE, "last_published_at", key="symbol", client=supabase)
+            if r.get("last_published_at")
+        }
+    except Exception as e:
+        print(f"⚠️ {STATE_TABLE} unavailable ({e}) – fetching without cursors")
+        return {}
+
+
+def save_cursors(cursors: dict[str, datetime]):
+    if not cursors:
+        return
+    now = datetime.utcnow().isoformat()
+    rows = [
+        {"symbol": s, "last_published_at": c.isoformat(), "last_fetched_at": now}
+        for s, c in cursors.items()
+    ]
+    try:
+        failed = supabase_batch.write_rows(STATE_TABLE, rows, on_conflict="symbol")
+        if failed:
+            print(f"⚠️ {len(failed)} cursors not saved: {failed[0][1]}")
+    except Exception as e:
+        print(f"⚠️ Could not save cursors ({e})")
+
+# =============================
+# FETCH
+# =============================
+
+def fetch_window(earnings_date: str | None, cursor: datetime | None) -> dict | None:
+    """
+    from/to for the news request: the report's ±3 day window, starting no
+    earlier than the cursor's day. None when nothing new can pass the filter.
+    """
+    today = date.today()
+    start = cursor.date() if cursor else None
+    end = today
+
+    if earnings_date:
+        earn = date.fromisoformat(earnings_date[:10])
+        # +1: the filter compares whole days against midnight of report_date
+        window_start = earn - timedelta(days=EARNINGS_WINDOW_DAYS + 1)
+        start = max(start, window_start) if start else window_start
+        end = min(end, earn + timedelta(days=EARNINGS_WINDOW_DAYS))
+
+    if start and start > end:
+        return None
+
+    params = {"to": end.isoformat()}
+    if start:
+        params["from"] = start.isoformat()
+    return params
+
+
+def fetch_new_news(
+    symbol: str, earnings_date: str | None, cursor: datetime | None
+) -> tuple[list[dict], bool]:
+    """
+    News for `symbol` published at or after the cursor, newest first.
+    Pages until a page reaches already-seen items (or runs short).
+    Returns (items, complete); complete is False when paging stopped on
+    NEWS_MAX_PAGES, i.e. older new items may still be unfetched.
+    """
+    window = fetch_window(earnings_date, cursor)
+    if window is None:
+        return [], True
+
+    items = []
+    for page in range(NEWS_MAX_PAGES):
+        batch = fmp_client.stock_news(
+            limit=NEWS_PAGE_LIMIT, symbol=symbol, page=page, **window
+        ) or []
+
+        fresh = [n for n in batch if _is_fresh(n, cursor)]
+        items.extend(fresh)
+
+        if len(batch) < NEWS_PAGE_LIMIT or len(fresh) < len(batch):
+            return items, True
+    return items, False
+
+
+def _is_fresh(news: dict, cursor: datetime | None) -> bool:
+    # items on the cursor's own second are kept: the url upsert makes
+    # re-writing them harmless, skipping them could lose an article
+    published = _published(news)
+    return cursor is None or published is None or published >= cursor
+
+# =============================
+# MULTI-TICKER FETCH
+# =============================
+
+def _lower_bound(target: dict) -> datetime | None:
+    """Oldest publish time this target still needs (None = unbounded)."""
+    bounds = [target["cursor"]] if target["cursor"] else []
+    if target["window"].get("from"):
+        bounds.append(datetime.fromisoformat(target["window"]["from"]))
+    return max(bounds) if bounds else None
+
+
+def chunk_targets(targets: list[dict]) -> list[list[dict]]:
+    """
+    Group targets into multi-ticker requests: same report_date (one shared
+    from/to window), at most NEWS_BATCH_LIMIT // NEWS_BATCH_ITEMS_PER_SYMBOL
+    tickers, and a tickers= value under NEWS_BATCH_MAX_TICKERS_CHARS.
+    """
+    max_symbols = max(1, NEWS_BATCH_LIMIT // NEWS_BATCH_ITEMS_PER_SYMBOL)
+
+    by_date: dict[str, dict[str, dict]] = {}
+    for t in targets:
+        # a symbol listed twice for the same date is fetched once
+        by_date.setdefault(t["report_date"], {}).setdefault(t["symbol"], t)
+
+    chunks = []
+    for group in by_date.values():
+        chunk, chars = [], 0
+        for t in group.values():
+            cost = len(quote(t["symbol"], safe="")) + 3  # + encoded comma
+            if chunk and (len(chunk) >= max_symbols or chars + cost > NEWS_BATCH_MAX_TICKERS_CHARS):
+                chunks.append(chunk)
+                chunk, chars = [], 0
+            chunk.append(t)
+            chars += cost
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def fetch_chunk(chunk: list[dict]) -> tuple[dict[str, list[dict]], list[dict], list[dict]]:
+    """
+    Fetch news for a chunk of targets in one multi-ticker request, paging
+    (up to NEWS_BATCH_MAX_PAGES) until every symbol reached its cursor or a
+    page runs short, and split the items back per symbol.
+
+    Results are newest first across the chunk, so when the pages run out a
+    symbol is complete only if its cursor is newer than the oldest item
+    seen. Returns ({symbol: new items} for complete symbols, heavily covered
+    symbols that filled their share of the pages, other incomplete symbols).
+    """
+    symbols = [t["symbol"] for t in chunk]
+    window = {"to": max(t["window"]["to"] for t in chunk)}
+    starts = [t["window"].get("from") for t in chunk]
+    if all(starts):
+        window["from"] = min(starts)
+    bounds = {t["symbol"]: _lower_bound(t) for t in chunk}
+
+    found: dict[str, list[dict]] = {s: [] for s in symbols}
+    oldest = None
+    exhausted = True
+
+    for page in range(NEWS_BATCH_MAX_PAGES):
+        batch = fmp_client.stock_news_multi(
+            symbols, limit=NEWS_BATCH_LIMIT, page=page, **window
+        ) or []
+
+        for n in batch:
+            if n.get("symbol") in found:
+                found[n["symbol"]].append(n)
+            published = _published(n)
+            if published and (oldest is None or published < oldest):
+                oldest = published
+
+        if len(batch) < NEWS_BATCH_LIMIT or (
+            oldest is not None
+            and all(b is not None and oldest < b for b in bounds.values())
+        ):
+            exhausted = False
+            break
+
+    heavy, incomplete = [], []
+    if exhausted:
+        for t in chunk:
+            bound = bounds[t["symbol"]]
+            if oldest is not None and bound is not None and oldest < bound:
+                continue
+            if len(found[t["symbol"]]) >= NEWS_BATCH_ITEMS_PER_SYMBOL:
+                heavy.append(t)
+            else:
+                incomplete.append(t)
+    skip = {t["symbol"] for t in heavy + incomplete}
+
+    news = {
+        t["symbol"]: [n for n in found[t["symbol"]] if _is_fresh(n, t["cursor"])]
+        for t in chunk
+        if t["symbol"] not in skip
     }
+    return news, heavy, incomplete
+
+# =============================
+# FETCH ALL
+# =============================
+
+def fetch_per_symbol(targets: list[dict]) -> list[tuple[dict, list[dict], bool]]:
+    """(target, new items, complete) per target; see fetch_new_news()."""
+    results = []
+    for t in targets:
+        try:
+            results.append((t, *fetch_new_news(t["symbol"], t["report_date"], t["cursor"])))
+        except Exception as e:
+            print(f"Failed fetching news for {t['symbol']}: {e}")
+    return results
 
-    r = requests.get(FMP_URL, params=params, timeout=20)
-    r.raise_for_status()
-    return r.json()
+
+def fetch_batched(targets: list[dict]) -> list[tuple[dict, list[dict], bool]]:
+    """
+    Multi-ticker chunks first. Heavily covered names go to per-symbol
+    paging; the names they crowded out get one more multi-ticker pass
+    without them, then per-symbol paging for whatever is still incomplete.
+    Only symbols that reached their cursor come back complete from the
+    multi-ticker pass; the per-symbol fallback reports its own flag.
+    """
+    results = []
+    fallback = []
+    pending = targets
+
+    for attempt in range(2):
+        chunks = chunk_targets(pending)
+        print(f"Fetching news for {len(pending)} symbols in {len(chunks)} multi-ticker requests")
+
+        retry = []
+        for chunk in chunks:
+            try:
+                news, heavy, incomplete = fetch_chunk(chunk)
+            except Exception as e:
+                print(f"Failed fetching news for {len(chunk)} tickers ({e}) – retrying per symbol")
+                fallback.extend(chunk)
+                continue
+            results.extend((t, news[t["symbol"]], True) for t in chunk if t["symbol"] in news)
+            fallback.extend(heavy)
+            retry.extend(incomplete)
+
+        if not retry:
+            break
+        pending = retry
+    else:
+        fallback.extend(retry)
+
+    if fallback:
+        print(f"Per-symbol paging for {len(fallback)} symbols: {', '.join(t['symbol'] for t in fallback)}")
+        results.extend(fetch_per_symbol(fallback))
+    return results
 
 # =============================
 # MAIN
@@ -108,23 +367,52 @@ def main():
     earnings = get_earnings_symbols()
     print(f"Found {len(earnings)} earnings symbols")
 
-    for item in earnings:
-        symbol = item["symbol"]
-        earnings_date = item["report_date"]
+    cursors = load_cursors()
+    fetched_at = datetime.utcnow().isoformat()
 
-        try:
-            news_list = fetch_news_for_symbol(symbol)
-        except Exception as e:
-            print(f"Failed fetching news for {symbol}: {e}")
+    rows_by_url: dict[str, dict] = {}
+    new_cursors: dict[str, datetime] = {}
+
+    targets = []
+    for item in earnings:
+        cursor = cursors.get(item["symbol"])
+        window = fetch_window(item["report_date"], cursor)
+        if window is None:
+            print(f"{item['symbol']}: cursor past the earnings window, nothing to fetch")
             continue
+        targets.append({
+            "symbol": item["symbol"],
+            "report_date": item["report_date"],
+            "cursor": cursor,
+            "window": window,
+        })
+
+    if NEWS_FETCH_MODE == "batch":
+        fetched = fetch_batched(targets)
+    else:
+        fetched = fetch_per_symbol(targets)
 
-        inserted = 0
+    for target, news_list, complete in fetched:
+        symbol = target["symbol"]
+        earnings_date = target["report_date"]
+        cursor = target["cursor"]
+
+        # Paging stopped on the page cap: items between the cursor and the
+        # oldest one fetched are still missing, so the cursor stays put
+        published = [p for p in map(_published, news_list) if p]
+        if not complete:
+            print(f"{symbol}: hit the page cap before the cursor – cursor not advanced")
+        elif published:
+            new_cursors[symbol] = max(published + ([cursor] if cursor else []))
+
+        accepted = 0
 
         for news in news_list:
-            if not is_earnings_related(news, earnings_date):
+            if not news.get("url") or not is_earnings_related(news, earnings_date):
                 continue
 
-            row = {
+            # one row per url: a batch upsert may not touch the same row twice
+            rows_by_url[news["url"]] = {
                 "symbol": symbol,
                 "title": news.get("title"),
                 "body": news.get("text"),
@@ -132,16 +420,24 @@ def main():
                 "url": news.get("url"),
                 "published_at": news.get("publishedDate"),
                 "earnings_date": earnings_date,
-                "fetched_at": datetime.utcnow().isoformat()
+                "fetched_at": fetched_at
             }
 
-            supabase.table("fmp_news") \
-                .upsert(row, on_conflict="url") \
-                .execute()
+            accepted += 1
+
+        print(f"{symbol}: {len(news_list)} new news items, {accepted} earnings-related")
+
+    rows = list(rows_by_url.values())
+    failed = supabase_batch.write_rows(NEWS_TABLE, rows, on_conflict="url")
+    for row, e in failed:
+        print(f"Failed to upsert news {row['url']} for {row['symbol']}: {e}")
+    print(f"Upserted {len(rows) - len(failed)} earnings-related news items")
 
-            inserted += 1
+    # a symbol whose rows did not all land is re-fetched from its old cursor
+    failed_symbols = {row["symbol"] for row, _ in failed}
+    save_cursors({s: c for s, c in new_cursors.items() if s not in failed_symbols})
 
-        print(f"{symbol}: inserted {inserted} earnings-related news items")
+    fmp_client.log_latency_report()
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,16 @@
 import os
-import requests
 from datetime import datetime
 from supabase import create_client, Client
 
-FMP_API_KEY = os.getenv("FMP_API_KEY")
+import fmp_client
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-FMP_URL = "https://financialmodelingprep.com/api/v3/stock_news"
-
 def fetch_news():
-    params = {
-        "limit": 50,
-        "apikey": FMP_API_KEY
-    }
-
-    r = requests.get(FMP_URL, params=params, timeout=20)
-    r.raise_for_status()
-    news = r.json()
+    news = fmp_client.stock_news(limit=50)
 
     print(f"Fetched {len(news)} news items")
 
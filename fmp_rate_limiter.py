@@ -0,0 +1,110 @@
+# fmp_rate_limiter.py
+#
+# Token-bucket rate limiter for FMP calls, shared by every thread and every
+# process on the box (the bucket lives in a small SQLite file).
+# FMP quota: 300 calls/minute. A caller only sleeps when the bucket is
+# empty, so we can run close to the quota without 429s.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+FMP_RATE_LIMIT_PER_MINUTE = float(os.getenv("FMP_RATE_LIMIT_PER_MINUTE", "300"))
+FMP_RATE_LIMIT_BURST = float(os.getenv("FMP_RATE_LIMIT_BURST", "20"))
+FMP_RATE_LIMIT_DB = os.getenv(
+    "FMP_RATE_LIMIT_DB",
+    os.path.join(tempfile.gettempdir(), "analyst44_fmp_rate_limit.sqlite"),
+)
+
+BUCKET_NAME = "fmp"
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """One SQLite connection per thread (sqlite3 connections are not shareable)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(FMP_RATE_LIMIT_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def _update_bucket(tokens: float, rate: float, capacity: float, penalty_s: float = 0.0) -> float:
+    """
+    Refill the bucket, then try to take `tokens`.
+    Returns 0 if the tokens were taken, otherwise the seconds to wait
+    before enough tokens will be available.
+    penalty_s > 0 empties the bucket and pushes it into debt instead
+    (used after a 429 so every process backs off).
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        row = conn.execute(
+            "SELECT tokens, updated_at FROM buckets WHERE name = ?", (BUCKET_NAME,)
+        ).fetchone()
+
+        if row is None:
+            available = capacity
+        else:
+            available = min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+
+        wait = 0.0
+        if penalty_s > 0:
+            available = min(available, 0.0) - penalty_s * rate
+        elif available >= tokens:
+            available -= tokens
+        else:
+            wait = (tokens - available) / rate
+
+        conn.execute(
+            "INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, "
+            "updated_at = excluded.updated_at",
+            (BUCKET_NAME, available, now),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    return wait
+
+
+def acquire(tokens: float = 1.0) -> float:
+    """
+    Block until `tokens` calls are allowed. Returns the seconds spent waiting.
+    FMP_RATE_LIMIT_PER_MINUTE=0 disables the limiter.
+    """
+    if FMP_RATE_LIMIT_PER_MINUTE <= 0:
+        return 0.0
+
+    rate = FMP_RATE_LIMIT_PER_MINUTE / 60.0
+    capacity = max(FMP_RATE_LIMIT_BURST, tokens)
+
+    waited = 0.0
+    while True:
+        wait = _update_bucket(tokens, rate, capacity)
+        if wait <= 0:
+            return waited
+        time.sleep(wait)
+        waited += wait
+
+
+def penalize(seconds: float) -> None:
+    """Empty the shared bucket for `seconds` (call after FMP returns 429)."""
+    if FMP_RATE_LIMIT_PER_MINUTE <= 0 or seconds <= 0:
+        return
+    rate = FMP_RATE_LIMIT_PER_MINUTE / 60.0
+    _update_bucket(0.0, rate, FMP_RATE_LIMIT_BURST, penalty_s=seconds)
@@ -1,12 +1,13 @@
 import os
-import time
 import uuid
-import requests
 
 from datetime import datetime, UTC
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+import fmp_client
+from supabase_reader import stream_rows
+
 # ==========================================
 # Load environment variables
 # ==========================================
@@ -30,8 +31,7 @@ JOBS_MONITOR_TABLE = "jobs_monitor"
 JOB_NAME = "income_statements_last_sync"
 JOB_GROUP = "financials"
 
-# FMP rate-limit (300 calls/minute ≈ 5 calls/second)
-FMP_SLEEP_SECONDS = 0.2
+# FMP rate-limit (300 calls/minute) נאכף ב-fmp_client דרך fmp_rate_limiter
 
 
 # ------------------------------------------
@@ -64,15 +64,9 @@ def load_symbols_from_calendar() -> list[str]:
     """
     print("Loading symbols from Supabase table earnings_calendar_us ...")
 
-    resp = (
-        supabase
-        .table(EARNINGS_CALENDAR_TABLE)
-        .select("symbol")
-        .range(0, 9999)
-        .execute()
+    rows = stream_rows(
+        EARNINGS_CALENDAR_TABLE, "symbol", key="id", client=supabase
     )
-
-    rows = resp.data or []
     symbols_set = set()
 
     for row in rows:
@@ -101,17 +95,10 @@ def fetch_last_income_statement(symbol: str) -> dict | None:
     מביא את הדוח האחרון בלבד עבור סימבול.
     מחזיר dict או None אם אין נתונים.
     """
-    url = f"https://financialmodelingprep.com/api/v3/income-statement/{symbol}"
-    params = {
-        "apikey": FMP_API_KEY,
-        "limit": 1,
-        "period": "quarter",  # <<< חדש – מבקש רק דוחות רבעוניים
-    }
-
     try:
-        r = requests.get(url, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
+        # period=quarter – מבקש רק דוחות רבעוניים
+        # use_cache=False: the symbol reports today, a cached copy may predate the filing
+        data = fmp_client.income_statement(symbol, limit=1, period="quarter", use_cache=False)
         if not data:
             print(f"[WARN] No income statement for {symbol}")
             return None
@@ -275,25 +262,21 @@ def main():
             stmt = fetch_last_income_statement(symbol)
             if stmt is None:
                 job_row["rows_failed"] += 1
-                time.sleep(FMP_SLEEP_SECONDS)
                 continue
 
             # 🟦 הוספה כאן — בדיקה שהדוח רבעוני בלבד
             if not is_quarterly_statement(stmt):
                 # לא רבעוני → מדלגים (לא נספר כ-failed)
-                time.sleep(FMP_SLEEP_SECONDS)
                 continue
 
             # 🟩 בדיקה קיימת — רק USD
             if not is_usd_statement(stmt):
                 # מדלגים – לא נספר כ-failed
-                time.sleep(FMP_SLEEP_SECONDS)
                 continue
 
             # סינון – רק דוחות במטבע USD
             if not is_usd_statement(stmt):
                 # מדלגים – לא נספר כ-failed, פשוט לא רלוונטי
-                time.sleep(FMP_SLEEP_SECONDS)
                 continue
 
             ok = upsert_income_statement(symbol, stmt)
@@ -302,8 +285,7 @@ def main():
             else:
                 job_row["rows_failed"] += 1
 
-            # כיבוד Rate Limit של FMP
-            time.sleep(FMP_SLEEP_SECONDS)
+        fmp_client.log_latency_report()
 
         # סיום מוצלח
         finish_job_monitor_run(
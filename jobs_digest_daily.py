@@ -6,6 +6,8 @@ from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 from supabase import create_client
 
+from supabase_reader import stream_rows
+
 # --------------------------------------------------
 # Config
 # --------------------------------------------------
@@ -88,14 +90,14 @@ def fetch_jobs_for_today(supabase):
     """Fetch all runs from jobs_monitor that belong to today (LOCAL_TZ)."""
     start_utc, end_utc, date_local = get_today_range_local_to_utc()
 
-    resp = (
-        supabase
-        .table(TABLE_JOBS_MONITOR)
-        .select("*")
-        .order("started_at", desc=False)
-        .execute()
+    # Page through today's window only, oldest first
+    all_rows = stream_rows(
+        TABLE_JOBS_MONITOR,
+        "*",
+        key=("started_at", "id"),
+        where=lambda q: q.gte("started_at", start_utc.isoformat()).lt("started_at", end_utc.isoformat()),
+        client=supabase,
     )
-    all_rows = resp.data or []
 
     rows_today = []
     for r in all_rows:
@@ -0,0 +1,75 @@
+# llm_cache.py
+#
+# Persistent cache of LLM results (disk_cache namespace "llm"), addressed by
+# the content of the request: sha256 of model + system prompt text + the
+# user message exactly as encoded for the model (built from normalize()d
+# data, so run metadata does not change it). Same inputs -> same key, so
+# reruns and days when a symbol's reports did not change reuse the stored
+# answer.
+#
+# Editing the prompt file or the payload encoding (rounding, field
+# filtering) changes the key, so old entries are never served for a
+# different input. Explicit switches:
+#   LLM_CACHE_BYPASS=1        skip cache reads (fresh answers are still stored)
+#   python llm_cache.py --clear   drop every cached answer
+
+import hashlib
+import json
+import os
+import sys
+
+import disk_cache
+
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "128")) * 1024 * 1024)
+CACHE_NAMESPACE = "llm"
+
+# Fields that change between runs without changing the question:
+# the injected run date and Supabase row metadata.
+VOLATILE_KEYS = {"analysis_date", "id", "created_at", "updated_at"}
+
+
+def normalize(value):
+    """Drop VOLATILE_KEYS (at any depth) before encoding the cache message."""
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    return value
+
+
+def cache_key(model: str, system_prompt: str, message: str) -> str:
+    raw = json.dumps({"model": model, "prompt": system_prompt, "message": message})
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get(model: str, system_prompt: str, message: str):
+    """Cached result for this request (message = encoded user message), or None."""
+    if LLM_CACHE_BYPASS:
+        return None
+    hit, data = disk_cache.get(CACHE_NAMESPACE, cache_key(model, system_prompt, message))
+    return data if hit else None
+
+
+def put(model: str, system_prompt: str, message: str, result) -> None:
+    if not result:
+        return
+    disk_cache.put(
+        CACHE_NAMESPACE,
+        cache_key(model, system_prompt, message),
+        result,
+        LLM_CACHE_TTL,
+        LLM_CACHE_MAX_BYTES,
+    )
+
+
+def clear() -> int:
+    return disk_cache.clear(CACHE_NAMESPACE)
+
+
+if __name__ == "__main__":
+    if "--clear" in sys.argv:
+        print(f"Removed {clear()} cached LLM results.")
+    else:
+        print("Usage: python llm_cache.py --clear")
@@ -0,0 +1,107 @@
+# llm_payload_encoder.py
+#
+# Compact encoding of the data we send to LLMs. Input tokens are what we
+# pay for (and wait for) on every call, and plain json.dumps of Supabase
+# rows wastes most of them:
+# - nulls are dropped (prompts already treat a missing field as null);
+# - fields the prompt never mentions are dropped;
+# - floats are rounded to significant digits (no 0.12345678901234 repr),
+#   except fields the prompt needs verbatim (prices, EPS – see `exact`);
+# - series are sent as columns + rows instead of one object per row;
+# - separators carry no whitespace.
+# Token counts use tiktoken when installed, otherwise ~4 chars per token.
+
+import json
+import math
+import re
+import threading
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional dependency
+    _ENCODING = None
+
+DEFAULT_SIG_DIGITS = 4
+
+_stats_lock = threading.Lock()
+_stats: dict[str, dict] = {}
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def round_sig(x, digits: int = DEFAULT_SIG_DIGITS):
+    """Round a float to `digits` significant digits; whole results become ints."""
+    if not isinstance(x, float) or not math.isfinite(x) or x == 0:
+        return x
+    r = float(f"{x:.{digits}g}")
+    return int(r) if r.is_integer() and abs(r) < 1e15 else r
+
+
+def fields_in(prompt: str, record: dict) -> set[str]:
+    """Keys of `record` that the prompt text mentions by name."""
+    return {k for k in record if re.search(rf"\b{re.escape(k)}\b", prompt)}
+
+
+def compact(
+    value,
+    keep: set[str] | None = None,
+    digits: int = DEFAULT_SIG_DIGITS,
+    exact: set[str] | frozenset[str] = frozenset(),
+):
+    """
+    Drop nulls (and, for dicts, keys outside `keep`), round floats.
+    `keep` applies to the top-level dict only; values under a key in
+    `exact` (at any depth) are sent unrounded.
+    """
+    if isinstance(value, dict):
+        return {
+            k: v if k in exact else compact(v, digits=digits, exact=exact)
+            for k, v in value.items()
+            if v is not None and (keep is None or k in keep)
+        }
+    if isinstance(value, list):
+        return [compact(v, digits=digits, exact=exact) for v in value]
+    return round_sig(value, digits)
+
+
+def columnar(rows: list[dict], columns: list[str] | None = None) -> dict:
+    """[{a:1,b:2}, {a:3,b:4}] -> {"columns": ["a","b"], "rows": [[1,2],[3,4]]}"""
+    if columns is None:
+        columns = list(rows[0].keys()) if rows else []
+    return {"columns": columns, "rows": [[r.get(c) for c in columns] for r in rows]}
+
+
+def encode(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def record_savings(label: str, before: str, after: str) -> tuple[int, int]:
+    """Count tokens of the verbose and compact text; accumulate per label."""
+    b, a = count_tokens(before), count_tokens(after)
+    with _stats_lock:
+        s = _stats.setdefault(label, {"calls": 0, "before": 0, "after": 0})
+        s["calls"] += 1
+        s["before"] += b
+        s["after"] += a
+    return b, a
+
+
+def log_savings() -> None:
+    with _stats_lock:
+        snapshot = {k: dict(v) for k, v in _stats.items()}
+    if not snapshot:
+        return
+
+    counter = "tiktoken" if _ENCODING is not None else "chars/4"
+    print(f"LLM payload tokens ({counter}):")
+    for label, s in sorted(snapshot.items()):
+        saved = 100.0 * (1 - s["after"] / s["before"]) if s["before"] else 0.0
+        print(
+            f"  {label:<24} calls={s['calls']:<5} before={s['before']:<8} "
+            f"after={s['after']:<8} saved={saved:.0f}%"
+        )
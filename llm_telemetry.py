@@ -0,0 +1,221 @@
+# llm_telemetry.py
+#
+# Per-call telemetry for every OpenAI call: step, model, symbol, latency,
+# prompt/completion tokens, estimated cost, retries and outcome
+# (ok / error / parse_error). latency_ms is the model request alone; time
+# spent waiting on the TPM budget or 429 cool-down is throttle_wait_ms.
+# Rows are buffered in memory and written to
+# the llm_calls table (sql/llm_calls.sql) in batches; telemetry problems
+# are logged and never fail the step itself.
+#
+#   with llm_telemetry.track("financial_scores", MODEL, symbol) as t:
+#       resp = openai_throttle.call(
+#           lambda: t.call(lambda: client.chat.completions.create(...)),
+#           est_tokens, on_retry=t.on_retry, on_wait=t.on_wait,
+#       )
+#       ...
+#       if parsing failed:
+#           t.fail()
+#
+# Batch API answers have no latency of their own; openai_batch records them
+# with record() (latency_ms empty, cost at the batch discount).
+#
+#   python llm_telemetry.py --summary [days]   p50/p95 latency + tokens per step
+
+import atexit
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+import supabase_batch
+
+LLM_TELEMETRY_ENABLED = os.getenv("LLM_TELEMETRY", "1") == "1"
+LLM_TELEMETRY_BATCH_SIZE = int(os.getenv("LLM_TELEMETRY_BATCH_SIZE", "50"))
+TABLE = "llm_calls"
+SUMMARY_VIEW = "llm_calls_daily_summary"
+
+# USD per 1M tokens (input, output)
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+# Batch API requests are billed at half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+_lock = threading.Lock()
+_buffer: list[dict] = []
+
+
+def _cost_usd(model: str, prompt_tokens: int | None, completion_tokens: int | None) -> float | None:
+    price = PRICES.get(model)
+    if price is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    return round((prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, 6)
+
+
+class Call:
+    """One tracked LLM call (see track())."""
+
+    def __init__(self, step: str, model: str, symbol: str | None):
+        self.row = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "step": step,
+            "model": model,
+            "symbol": symbol,
+            "latency_ms": None,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "total_tokens": None,
+            "cost_usd": None,
+            "retries": 0,
+            "throttle_wait_ms": 0,
+            "status": "ok",
+            "error": None,
+        }
+
+    def on_retry(self) -> None:
+        self.row["retries"] += 1
+
+    def on_wait(self, seconds: float) -> None:
+        self.row["throttle_wait_ms"] += int(seconds * 1000)
+
+    def call(self, fn):
+        """
+        Run one request attempt, timing it and reading token usage from the
+        response. Wrap only the SDK call (inside any throttle/retry loop):
+        latency_ms is the last attempt's.
+        """
+        start = time.perf_counter()
+        try:
+            resp = fn()
+        except Exception as e:
+            self.row["status"] = "error"
+            self.row["error"] = str(e)[:500]
+            raise
+        finally:
+            self.row["latency_ms"] = int((time.perf_counter() - start) * 1000)
+
+        # a retried attempt that succeeded clears the earlier failure
+        self.row["status"] = "ok"
+        self.row["error"] = None
+
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            self.row["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+            self.row["completion_tokens"] = getattr(usage, "completion_tokens", None)
+            self.row["total_tokens"] = getattr(usage, "total_tokens", None)
+            self.row["cost_usd"] = _cost_usd(
+                self.row["model"], self.row["prompt_tokens"], self.row["completion_tokens"]
+            )
+        return resp
+
+    def fail(self, status: str = "parse_error", error: str | None = None) -> None:
+        """Mark an answer that arrived but could not be used."""
+        if self.row["status"] == "ok":
+            self.row["status"] = status
+            self.row["error"] = error
+
+
+def record(
+    step: str,
+    model: str,
+    symbol: str | None = None,
+    usage: dict | None = None,
+    status: str = "ok",
+    error: str | None = None,
+) -> None:
+    """Row for a Batch API answer: token usage from the output line, no latency."""
+    t = Call(step, model, symbol)
+    usage = usage or {}
+    t.row["prompt_tokens"] = usage.get("prompt_tokens")
+    t.row["completion_tokens"] = usage.get("completion_tokens")
+    t.row["total_tokens"] = usage.get("total_tokens")
+    cost = _cost_usd(model, t.row["prompt_tokens"], t.row["completion_tokens"])
+    if cost is not None:
+        t.row["cost_usd"] = round(cost * BATCH_PRICE_FACTOR, 6)
+    t.row["status"] = status
+    t.row["error"] = error[:500] if error else None
+    _enqueue(t.row)
+
+
+@contextmanager
+def track(step: str, model: str, symbol: str | None = None):
+    t = Call(step, model, symbol)
+    try:
+        yield t
+    except Exception as e:
+        if t.row["status"] == "ok":
+            t.row["status"] = "error"
+            t.row["error"] = str(e)[:500]
+        raise
+    finally:
+        _enqueue(t.row)
+
+
+def _enqueue(row: dict) -> None:
+    if not LLM_TELEMETRY_ENABLED:
+        return
+    with _lock:
+        _buffer.append(row)
+        full = len(_buffer) >= LLM_TELEMETRY_BATCH_SIZE
+    if full:
+        flush()
+
+
+def flush() -> None:
+    """Write buffered rows to llm_calls."""
+    global _buffer
+    with _lock:
+        rows, _buffer = _buffer, []
+    if not rows:
+        return
+
+    try:
+        failed = supabase_batch.write_rows(TABLE, rows)
+        if failed:
+            print(f"[llm_telemetry] {len(failed)}/{len(rows)} rows not written: {failed[0][1]}")
+    except Exception as e:
+        print(f"[llm_telemetry] flush failed ({len(rows)} rows dropped): {e}")
+
+
+atexit.register(flush)
+
+
+def print_summary(days: int = 7) -> None:
+    """p50/p95 latency, tokens and cost per step and model for the last `days` days."""
+    from clients import get_supabase
+
+    since = (date.today() - timedelta(days=days)).isoformat()
+    rows = (
+        get_supabase()
+        .table(SUMMARY_VIEW)
+        .select("*")
+        .gte("day", since)
+        .order("day", desc=True)
+        .order("step")
+        .execute()
+        .data
+        or []
+    )
+
+    print(f"LLM calls since {since}:")
+    for r in rows:
+        print(
+            f"  {r['day']} {r['step']:<30} {r['model']:<14} calls={r['calls']:<5} "
+            f"fail={r['failures']:<4} p50={r['p50_latency_ms']}ms p95={r['p95_latency_ms']}ms "
+            f"tokens={r['total_tokens']} cost=${r['cost_usd']} retries={r['retries']} "
+            f"throttle_wait={r.get('throttle_wait_ms') or 0}ms"
+        )
+
+
+if __name__ == "__main__":
+    if "--summary" in sys.argv:
+        idx = sys.argv.index("--summary")
+        print_summary(int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else 7)
+    else:
+        print("Usage: python llm_telemetry.py --summary [days]")
@@ -0,0 +1,124 @@
+# market_features.py
+#
+# Deterministic market-structure features from daily OHLC(V) bars
+# (spy_daily_bars, vix_daily), computed with NumPy.
+# The market-state prompts get this compact feature vector plus a short
+# tail of bars instead of ~190 raw bars: far fewer tokens, and the same
+# bars always give the same numbers.
+
+import numpy as np
+
+TRADING_DAYS = 252
+SWING_WINDOW = 3       # bars on each side for a swing high/low
+SWING_LOOKBACK = 60    # bars scanned for swing structure
+
+
+def _arrays(bars: list[dict]) -> dict[str, np.ndarray]:
+    """bars (oldest first) -> float arrays; missing high/low fall back to close."""
+    close = np.array([float(b["close"]) for b in bars])
+    high = np.array([float(b.get("high") if b.get("high") is not None else b["close"]) for b in bars])
+    low = np.array([float(b.get("low") if b.get("low") is not None else b["close"]) for b in bars])
+    return {"close": close, "high": high, "low": low}
+
+
+def _pct(a: float, b: float) -> float | None:
+    return None if b == 0 else (a / b - 1.0) * 100.0
+
+
+def _sma(x: np.ndarray, n: int) -> np.ndarray:
+    """Simple moving average; result[i] is the mean of x[i : i + n]."""
+    c = np.cumsum(np.insert(x, 0, 0.0))
+    return (c[n:] - c[:-n]) / n
+
+
+def _true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    prev_close = close[:-1]
+    h, lo = high[1:], low[1:]
+    return np.maximum(h - lo, np.maximum(np.abs(h - prev_close), np.abs(lo - prev_close)))
+
+
+def _swings(high: np.ndarray, low: np.ndarray, w: int) -> tuple[np.ndarray, np.ndarray]:
+    """Indices of swing highs / lows: the extreme of a (2w+1)-bar window."""
+    n = len(high)
+    if n < 2 * w + 1:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    win_h = np.lib.stride_tricks.sliding_window_view(high, 2 * w + 1)
+    win_l = np.lib.stride_tricks.sliding_window_view(low, 2 * w + 1)
+    centre = np.arange(w, n - w)
+    return centre[win_h.argmax(axis=1) == w], centre[win_l.argmin(axis=1) == w]
+
+
+def compute_features(bars: list[dict]) -> dict:
+    """
+    Feature vector for bars ordered oldest -> newest. Values are rounded;
+    a feature needing more history than available is None.
+    """
+    a = _arrays(bars)
+    close, high, low = a["close"], a["high"], a["low"]
+    n = len(close)
+    last = close[-1]
+    f: dict[str, float | int | None] = {"bars": n, "last_close": last}
+
+    # Returns
+    for k in (1, 5, 20, 60):
+        f[f"return_{k}d_pct"] = _pct(last, close[-1 - k]) if n > k else None
+
+    # Realized volatility (annualized, from daily log returns)
+    log_ret = np.diff(np.log(close))
+    for k in (10, 20, 60):
+        f[f"realized_vol_{k}d_pct"] = (
+            float(np.std(log_ret[-k:], ddof=1) * np.sqrt(TRADING_DAYS) * 100) if len(log_ret) >= k else None
+        )
+
+    # ATR and range compression (short ATR vs long ATR, 10d range vs 60d range)
+    tr = _true_range(high, low, close)
+    atr14 = float(tr[-14:].mean()) if len(tr) >= 14 else None
+    f["atr_14"] = atr14
+    f["atr_14_pct"] = atr14 / last * 100 if atr14 is not None and last else None
+    f["atr_5_to_atr_20"] = (
+        float(tr[-5:].mean() / tr[-20:].mean()) if len(tr) >= 20 and tr[-20:].mean() > 0 else None
+    )
+    if n >= 60:
+        range_10 = high[-10:].max() - low[-10:].min()
+        range_60 = high[-60:].max() - low[-60:].min()
+        f["range_10d_to_60d"] = float(range_10 / range_60) if range_60 > 0 else None
+    else:
+        f["range_10d_to_60d"] = None
+
+    # Drawdowns
+    running_max = np.maximum.accumulate(close)
+    drawdown = close / running_max - 1.0
+    f["drawdown_from_high_pct"] = float(drawdown[-1] * 100)
+    f["max_drawdown_pct"] = float(drawdown.min() * 100)
+    f["pct_from_window_low"] = _pct(last, float(close.min()))
+    f["close_percentile"] = float((close <= last).mean() * 100)
+
+    # Moving averages: distance and slope over the last 10 bars
+    for k in (20, 50, 100):
+        if n >= k + 10:
+            sma = _sma(close, k)
+            f[f"vs_sma_{k}_pct"] = _pct(last, sma[-1])
+            f[f"sma_{k}_slope_10d_pct"] = _pct(sma[-1], sma[-11])
+        else:
+            f[f"vs_sma_{k}_pct"] = None
+            f[f"sma_{k}_slope_10d_pct"] = None
+
+    # Swing structure over the recent window
+    hi_idx, lo_idx = _swings(high[-SWING_LOOKBACK:], low[-SWING_LOOKBACK:], SWING_WINDOW)
+    sh, sl = high[-SWING_LOOKBACK:][hi_idx], low[-SWING_LOOKBACK:][lo_idx]
+    f["swing_highs"] = int(len(sh))
+    f["swing_lows"] = int(len(sl))
+    f["higher_highs"] = int((np.diff(sh) > 0).sum())
+    f["lower_highs"] = int((np.diff(sh) < 0).sum())
+    f["higher_lows"] = int((np.diff(sl) > 0).sum())
+    f["lower_lows"] = int((np.diff(sl) < 0).sum())
+
+    return {
+        k: (round(float(v), 3) if isinstance(v, (float, np.floating)) else v)
+        for k, v in f.items()
+    }
+
+
+def tail(bars: list[dict], n: int = 10) -> list[dict]:
+    """Last n bars (oldest first) for the prompt."""
+    return bars[-n:]
@@ -0,0 +1,183 @@
+# market_regime.py
+#
+# Rule-based fast path for the daily SPY / VIX market-state decisions.
+# States are regimes and rarely change, so most days the LLM just confirms
+# yesterday's answer. Here every allowed state has a few deterministic
+# checks on the market_features vector; the state with the highest share
+# of passing checks is the local classification and that share is its
+# confidence. When the local state equals the previous decision with
+# enough confidence, the state is carried forward without an LLM call.
+# Anything ambiguous or shifting is escalated to the model, and so is a
+# day whose last model-made decision is too old (carry-forwards cannot
+# chain forever without the model looking again).
+#
+#   MARKET_REGIME_FAST_PATH=0          always ask the LLM
+#   MARKET_REGIME_MIN_CONFIDENCE=75    share of checks (%) needed to carry forward
+#   MARKET_REGIME_MAX_AGE_DAYS=5       last LLM decision must be this recent
+
+import os
+from datetime import date
+
+FAST_PATH_ENABLED = os.getenv("MARKET_REGIME_FAST_PATH", "1") == "1"
+MIN_CONFIDENCE = float(os.getenv("MARKET_REGIME_MIN_CONFIDENCE", "75"))
+MAX_AGE_DAYS = int(os.getenv("MARKET_REGIME_MAX_AGE_DAYS", "5"))
+
+CARRY_FORWARD_EXPLANATION = "Regime unchanged; indicators confirm prior state"
+
+
+def _gt(key, x):
+    return lambda f: f.get(key) is not None and f[key] > x
+
+
+def _lt(key, x):
+    return lambda f: f.get(key) is not None and f[key] < x
+
+
+def _between(key, lo, hi):
+    return lambda f: f.get(key) is not None and lo <= f[key] <= hi
+
+
+def _ge_keys(a, b):
+    return lambda f: f.get(a) is not None and f.get(b) is not None and f[a] >= f[b]
+
+
+# ---------------- SPY ---------------- #
+
+SPY_RULES = {
+    "Strong Uptrend": [
+        _gt("vs_sma_20_pct", 0),
+        _gt("vs_sma_50_pct", 1),
+        _gt("sma_20_slope_10d_pct", 0.5),
+        _gt("sma_50_slope_10d_pct", 0.5),
+        _gt("drawdown_from_high_pct", -3),
+        _ge_keys("higher_lows", "lower_lows"),
+        _lt("realized_vol_20d_pct", 25),
+    ],
+    "Weak Uptrend": [
+        _gt("vs_sma_50_pct", 0),
+        _between("sma_50_slope_10d_pct", 0, 0.5),
+        _gt("drawdown_from_high_pct", -6),
+        _lt("realized_vol_20d_pct", 25),
+    ],
+    "Range / Balanced": [
+        _between("sma_50_slope_10d_pct", -0.3, 0.3),
+        _between("vs_sma_50_pct", -2, 2),
+        _lt("range_10d_to_60d", 0.5),
+        _lt("realized_vol_20d_pct", 20),
+    ],
+    "Weak Downtrend": [
+        _lt("vs_sma_50_pct", 0),
+        _between("sma_50_slope_10d_pct", -0.5, 0),
+        _lt("drawdown_from_high_pct", -3),
+        _lt("realized_vol_20d_pct", 30),
+    ],
+    "Strong Downtrend": [
+        _lt("vs_sma_20_pct", 0),
+        _lt("vs_sma_50_pct", -1),
+        _lt("sma_20_slope_10d_pct", -0.5),
+        _lt("sma_50_slope_10d_pct", -0.5),
+        _lt("drawdown_from_high_pct", -8),
+        _ge_keys("lower_highs", "higher_highs"),
+    ],
+    "High Volatility / Unstable": [
+        _gt("realized_vol_20d_pct", 30),
+        _gt("atr_14_pct", 2.5),
+        _gt("atr_5_to_atr_20", 1.3),
+    ],
+}
+
+# ---------------- VIX ---------------- #
+
+VIX_RULES = {
+    "Volatility Spike (Event-Driven)": [
+        _gt("return_5d_pct", 40),
+        _gt("close_percentile", 95),
+        _gt("atr_5_to_atr_20", 1.5),
+    ],
+    "Strong Volatility Uptrend": [
+        _gt("vs_sma_20_pct", 10),
+        _gt("sma_20_slope_10d_pct", 5),
+        _gt("return_20d_pct", 15),
+        _ge_keys("higher_lows", "lower_lows"),
+    ],
+    "Volatility Expansion": [
+        _gt("atr_5_to_atr_20", 1.2),
+        _gt("return_5d_pct", 10),
+        _gt("vs_sma_20_pct", 0),
+    ],
+    "Volatility Compression": [
+        _lt("atr_5_to_atr_20", 0.8),
+        _lt("range_10d_to_60d", 0.35),
+        _between("sma_20_slope_10d_pct", -5, 2),
+    ],
+    "Low Volatility Regime": [
+        _lt("last_close", 15),
+        _lt("close_percentile", 35),
+        _lt("atr_14_pct", 6),
+        _between("sma_50_slope_10d_pct", -5, 3),
+    ],
+    "Mean Reversion Phase": [
+        _lt("drawdown_from_high_pct", -20),
+        _lt("vs_sma_20_pct", 0),
+        _lt("sma_20_slope_10d_pct", 0),
+    ],
+}
+
+
+def classify(features: dict, rules: dict) -> tuple[str | None, float]:
+    """Best-matching state and its confidence (% of its checks passing)."""
+    best_state, best_conf = None, 0.0
+    for state, checks in rules.items():
+        conf = 100.0 * sum(1 for check in checks if check(features)) / len(checks)
+        if conf > best_conf:
+            best_state, best_conf = state, conf
+    return best_state, best_conf
+
+
+def _age_days(decision_date) -> int | None:
+    try:
+        return (date.today() - date.fromisoformat(str(decision_date)[:10])).days
+    except Exception:
+        return None
+
+
+def fast_path(label: str, features: dict, history: list[dict], rules: dict) -> dict | None:
+    """
+    Carry the previous state forward when the indicators clearly agree.
+    history: recent decisions, oldest first (market_state, decision_strength,
+    decision_date, explanation).
+    Returns {"market_state", "decision_strength", "explanation"} or None
+    (= ask the LLM). Logs which path was taken and why.
+    """
+    if not FAST_PATH_ENABLED:
+        print(f"[regime] {label}: fast path disabled -> LLM")
+        return None
+
+    previous = history[-1] if history else None
+    if not previous or not previous.get("market_state"):
+        print(f"[regime] {label}: no previous decision -> LLM")
+        return None
+
+    llm_decisions = [d for d in history if d.get("explanation") != CARRY_FORWARD_EXPLANATION]
+    age = _age_days(llm_decisions[-1].get("decision_date")) if llm_decisions else None
+    if age is None or age > MAX_AGE_DAYS:
+        print(f"[regime] {label}: last LLM decision is {age if age is not None else '?'} days old -> LLM")
+        return None
+
+    state, conf = classify(features, rules)
+    prev_state = previous["market_state"]
+
+    if state != prev_state:
+        print(f"[regime] {label}: local '{state}' ({conf:.0f}%) differs from previous '{prev_state}' -> LLM")
+        return None
+    if conf < MIN_CONFIDENCE:
+        print(f"[regime] {label}: '{state}' confidence {conf:.0f}% < {MIN_CONFIDENCE:.0f}% -> LLM")
+        return None
+
+    strength = previous.get("decision_strength")
+    print(f"[regime] {label}: fast path, carrying forward '{prev_state}' ({conf:.0f}%) – no LLM call")
+    return {
+        "market_state": prev_state,
+        "decision_strength": int(strength) if strength is not None else int(conf),
+        "explanation": CARRY_FORWARD_EXPLANATION,
+    }
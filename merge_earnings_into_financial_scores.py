@@ -1,74 +1,177 @@
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
 import os
-from datetime import datetime, timezone
-from supabase import create_client
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+from clients import get_supabase
+from supabase_reader import stream_rows
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = get_supabase()
 
-NEWS_WEIGHT = 0.65
-BASE_WEIGHT = 0.35
+RESULTS_TABLE = "news_analyst_revalidation_results"
+SCORES_TABLE = "analyst_financial_scores"
+STATE_TABLE = "pipeline_state"
+HWM_KEY = "news_revalidation_merge_hwm"
+
+# Results are merged from (high-water mark - overlap), so a result written a
+# little late by a still-running revalidation worker is not skipped.
+MERGE_OVERLAP_SECONDS = int(os.getenv("MERGE_OVERLAP_SECONDS", "600"))
+
+# Decimal strings so the client-side fallback computes exactly what the
+# RPC's numeric arithmetic does (round half away from zero)
+NEWS_WEIGHT = "0.65"
+BASE_WEIGHT = "0.35"
+
+DEFAULT_UI_LABEL = "Neutral / Mixed"
 
 # ✅ Map DB labels -> Frontend labels
 BIAS_LABEL_TO_UI = {
     "strong_bullish": "Strong Bullish Bias",
     "bullish": "Bullish Bias",
-    "neutral": "Neutral / Mixed",
+    "neutral": DEFAULT_UI_LABEL,
     "bearish": "Bearish Bias",
     "strong_bearish": "Strong Bearish Bias",
     "high_risk_unclear": "High Risk / Unclear",
 }
 
-def run_earnings_merge():
-    rows = (
-        supabase
-        .table("news_analyst_revalidation_results")
-        .select("""
-            symbol,
-            base_score,
-            updated_total_score,
-            bias_label,
-            bias_strength,
-            explanation_text,
-            created_at
-        """)
-        .execute()
-        .data
-    ) or []
 
+# ==================================================
+# HIGH-WATER MARK
+# ==================================================
+
+def load_high_water_mark() -> str | None:
+    """created_at of the newest result merged so far (None = merge everything)."""
+    try:
+        res = supabase.table(STATE_TABLE).select("value").eq("key", HWM_KEY).execute()
+    except Exception as e:
+        print(f"⚠️ {STATE_TABLE} unavailable ({e}) – merging all results")
+        return None
+    return res.data[0]["value"] if res.data else None
+
+
+def save_high_water_mark(value: str):
+    try:
+        supabase.table(STATE_TABLE).upsert({
+            "key": HWM_KEY,
+            "value": value,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }, on_conflict="key").execute()
+    except Exception as e:
+        print(f"⚠️ Could not save high-water mark ({e})")
+
+
+# ==================================================
+# MERGE
+# ==================================================
+
+def merge_via_rpc() -> int:
+    """
+    Server-side set-based merge (sql/news_revalidation_merge.sql): latest
+    result per symbol since the high-water mark, one UPDATE ... FROM, mark
+    advanced in the same transaction. Returns the number of score rows updated.
+    """
+    res = supabase.rpc("merge_news_revalidation_into_scores", {
+        "p_labels": BIAS_LABEL_TO_UI,
+        "p_default_label": DEFAULT_UI_LABEL,
+        "p_base_weight": BASE_WEIGHT,
+        "p_news_weight": NEWS_WEIGHT,
+        "p_overlap_seconds": MERGE_OVERLAP_SECONDS,
+    }).execute()
+    return int(res.data or 0)
+
+
+def load_latest_results(since: str | None) -> dict[str, dict]:
+    """{symbol: latest result} for results created after `since`."""
+    where = None
+    if since:
+        start = datetime.fromisoformat(since) - timedelta(seconds=MERGE_OVERLAP_SECONDS)
+        where = lambda q: q.gt("created_at", start.isoformat())
+
+    latest: dict[str, dict] = {}
+    rows = stream_rows(
+        RESULTS_TABLE,
+        "symbol,base_score,updated_total_score,bias_label,bias_strength,explanation_text,created_at",
+        key=("symbol", "created_at"),
+        where=where,
+        client=supabase,
+    )
     for r in rows:
-        # weights
-        final_weighted_score = round(
-            (r["base_score"] * BASE_WEIGHT) +
-            (r["updated_total_score"] * NEWS_WEIGHT)
-        )
+        # ordered by (symbol, created_at): the last row per symbol wins
+        latest[r["symbol"]] = r
+    return latest
+
+
+def to_score_update(r: dict, news_updated_at: str) -> dict:
+    # weights (same rounding as the RPC: numeric, half away from zero)
+    final_weighted_score = (
+        Decimal(str(r["base_score"])) * Decimal(BASE_WEIGHT) +
+        Decimal(str(r["updated_total_score"])) * Decimal(NEWS_WEIGHT)
+    ).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+
+    raw_label = (r.get("bias_label") or "").strip()
+    ui_label = BIAS_LABEL_TO_UI.get(raw_label, DEFAULT_UI_LABEL)  # fallback safe
+
+    return {
+        # ✅ store UI-ready label
+        "news_bias_label": ui_label,
+
+        # keep numeric strength 그대로 (1–100)
+        "news_bias_strength": int(r["bias_strength"]),
 
-        raw_label = (r.get("bias_label") or "").strip()
-        ui_label = BIAS_LABEL_TO_UI.get(raw_label, "Neutral / Mixed")  # fallback safe
+        # news score is what AI returned
+        "news_score": int(r["updated_total_score"]),
 
-        supabase.table("analyst_financial_scores") \
-            .update({
-                # ✅ store UI-ready label
-                "news_bias_label": ui_label,
+        # final weighted score
+        "final_weighted_score": int(final_weighted_score),
 
-                # keep numeric strength 그대로 (1–100)
-                "news_bias_strength": int(r["bias_strength"]),
+        "explanation_text": r.get("explanation_text"),
+        # timestamp
+        "news_updated_at": news_updated_at
+    }
 
-                # news score is what AI returned
-                "news_score": int(r["updated_total_score"]),
 
-                # final weighted score
-                "final_weighted_score": int(final_weighted_score),
+def merge_client_side() -> int:
+    """
+    Fallback when the RPC is not installed: same delta (latest result per
+    symbol since the high-water mark), applied as one update per symbol.
+    """
+    hwm = load_high_water_mark()
+    latest = load_latest_results(hwm)
+    if not latest:
+        return 0
 
-               "explanation_text": r.get("explanation_text"),
-                # timestamp
-                "news_updated_at": datetime.now(timezone.utc).isoformat()
-            }) \
-            .eq("symbol", r["symbol"]) \
-            .execute()
+    now = datetime.now(timezone.utc).isoformat()
+    merged = 0
+    failed = 0
+    for symbol, r in latest.items():
+        try:
+            supabase.table(SCORES_TABLE) \
+                .update(to_score_update(r, now)) \
+                .eq("symbol", symbol) \
+                .execute()
+            merged += 1
+        except Exception as e:
+            failed += 1
+            print(f"❌ Merge failed for {symbol}: {e}")
+
+    if failed:
+        # keep the mark so the failed symbols are retried next run
+        return merged
+
+    newest = max((r["created_at"] for r in latest.values()), key=datetime.fromisoformat)
+    if hwm is None or datetime.fromisoformat(newest) > datetime.fromisoformat(hwm):
+        save_high_water_mark(newest)
+    return merged
+
+
+def run_earnings_merge():
+    try:
+        merged = merge_via_rpc()
+        print("Merge done server-side.")
+    except Exception as e:
+        print(f"Merge RPC unavailable ({e}) – merging client-side.")
+        merged = merge_client_side()
 
-    print("✅ Earnings merge completed (label mapped to UI)")
+    print(f"✅ Earnings merge completed: {merged} symbols updated (label mapped to UI)")
 
 if __name__ == "__main__":
     run_earnings_merge()
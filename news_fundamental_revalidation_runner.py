@@ -2,6 +2,9 @@ import os
 from datetime import datetime
 from supabase import create_client, Client
 
+import llm_telemetry
+from supabase_reader import stream_rows
+
 APP_VERSION = 20251222_1018  # YYYYMMDD_HHMM
 
 # ==================================================
@@ -31,16 +34,13 @@ log(f"🚀 NEWS REVALIDATION VERSION LOADED: {APP_VERSION}")
 def get_symbols_from_fmp_news():
     log("Fetching symbols from fmp_news")
 
-    res = supabase.table("fmp_news") \
-        .select("symbol") \
-        .execute()
+    rows = stream_rows("fmp_news", "symbol", key="url", client=supabase)
+    symbols = sorted({row["symbol"] for row in rows if row.get("symbol")})
 
-    if not res.data:
+    if not symbols:
         log("No rows found in fmp_news")
         return []
 
-    symbols = sorted({row["symbol"] for row in res.data if row.get("symbol")})
-
     log(f"Found {len(symbols)} unique symbols in fmp_news")
     return symbols
 
@@ -128,6 +128,14 @@ openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
 def run_revalidation_ai(symbol: str, baseline: dict, news_items: list):
+    with llm_telemetry.track("news_fundamental_revalidation", "gpt-4o", symbol) as t:
+        ai_result = _run_revalidation_ai(symbol, baseline, news_items, t)
+        if ai_result is None:
+            t.fail("invalid_response")
+        return ai_result
+
+
+def _run_revalidation_ai(symbol: str, baseline: dict, news_items: list, t: llm_telemetry.Call):
     log(f"Running AI revalidation for {symbol}")
 
     # --- load prompt template ---
@@ -154,7 +162,7 @@ Body: {n.get('body')}
     log(f"Prompt built for {symbol} (news={len(news_items)})")
 
     # --- call OpenAI ---
-    response = openai_client.chat.completions.create(
+    response = t.call(lambda: openai_client.chat.completions.create(
         model="gpt-4o",
         messages=[
             {
@@ -167,7 +175,7 @@ Body: {n.get('body')}
             }
         ],
         temperature=0.2
-    )
+    ))
 
     # --- raw text cleanup BEFORE json.loads ---
     raw_text = response.choices[0].message.content or ""
@@ -314,6 +322,7 @@ def main():
         except Exception as e:
             log(f"ERROR processing {symbol}: {e}")
 
+    llm_telemetry.flush()
     log("News Fundamental Revalidation Runner finished")
 
 
@@ -1,28 +1,51 @@
 import os
 import json
+import socket
+import threading
+import time
+import uuid
 from datetime import datetime, timezone
-from supabase import create_client, Client
-from openai import OpenAI
+from supabase import Client
 import re
 
+import llm_payload_encoder
+import llm_telemetry
+import openai_batch
+from clients import get_openai, get_supabase
+
 APP_VERSION = "2025-12-22_26"
 
 # ==================================================
 # CONFIG
 # ==================================================
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY or not OPENAI_API_KEY:
-    raise Exception("Missing environment variables")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+supabase: Client = get_supabase()
+openai_client = get_openai()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROMPT_PATH = os.path.join(BASE_DIR, "A44_Fundamental_News_Reconcile.txt")
+PACKED_PROMPT_PATH = os.path.join(BASE_DIR, "A44_Fundamental_News_Reconcile_packed.txt")
+
+MODEL = "gpt-4o"
+SYSTEM_MESSAGE = "You are a financial analyst AI. Return ONLY valid JSON."
+
+# Inputs per round when LLM_BACKEND=batch (one OpenAI batch per round)
+BATCH_FETCH_LIMIT = int(os.getenv("REVALIDATION_BATCH_LIMIT", "1000"))
+
+# Work queue leases (sql/news_revalidation_queue.sql): every runner process
+# claims its own rows, keeps them alive with a heartbeat, and rows of a
+# crashed runner are reclaimed once their lease expires
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+LEASE_SECONDS = int(os.getenv("REVALIDATION_LEASE_SECONDS", "600"))
+MAX_ATTEMPTS = int(os.getenv("REVALIDATION_MAX_ATTEMPTS", "3"))
+# Transient claim failures (network, 5xx) are retried, then raised
+CLAIM_RETRIES = int(os.getenv("REVALIDATION_CLAIM_RETRIES", "3"))
+CLAIM_RETRY_SECONDS = float(os.getenv("REVALIDATION_CLAIM_RETRY_SECONDS", "2"))
+
+# Packed mode: up to PACK_SIZE symbols per request (1 = one request per
+# symbol), as long as the prompt stays within PACK_TOKEN_BUDGET tokens
+PACK_SIZE = int(os.getenv("REVALIDATION_PACK_SIZE", "1"))
+PACK_TOKEN_BUDGET = int(os.getenv("REVALIDATION_PACK_TOKEN_BUDGET", "12000"))
 
 # ==================================================
 # LOGGING
@@ -41,21 +64,109 @@ log(f"🚀 AI Revalidation Runner Loaded | VERSION={APP_VERSION}")
 with open(PROMPT_PATH, "r") as f:
     PROMPT_TEMPLATE = f.read()
 
+with open(PACKED_PROMPT_PATH, "r") as f:
+    PACKED_PROMPT_TEMPLATE = f.read()
+
+# The packed prompt reuses the single-symbol instructions (everything
+# before the JSON format section) so the rules live in one file
+PROMPT_INSTRUCTIONS = PROMPT_TEMPLATE.split("JSON FORMAT")[0].rstrip()
+
 # ==================================================
 # FETCH INPUT ROWS
 # ==================================================
 
+_lease_mode = True
+
+
+def _rpc_missing(e: Exception) -> bool:
+    """True when PostgREST reports the function itself does not exist."""
+    code = str(getattr(e, "code", "") or "")
+    return code in ("PGRST202", "404", "42883") or "PGRST202" in str(e)
+
+
+def claim_inputs(limit: int) -> list[dict]:
+    """claim_news_revalidation_inputs, retrying transient failures."""
+    for attempt in range(CLAIM_RETRIES + 1):
+        try:
+            res = supabase.rpc("claim_news_revalidation_inputs", {
+                "p_worker": WORKER_ID,
+                "p_limit": limit,
+                "p_lease_seconds": LEASE_SECONDS,
+                "p_max_attempts": MAX_ATTEMPTS,
+            }).execute()
+            return res.data or []
+        except Exception as e:
+            if _rpc_missing(e) or attempt == CLAIM_RETRIES:
+                raise
+            wait = CLAIM_RETRY_SECONDS * (2 ** attempt)
+            log(f"⚠️ Lease claim failed ({e}) — retrying in {wait:.0f}s")
+            time.sleep(wait)
+
+
 def fetch_pending_inputs(limit: int = 10):
+    """
+    Claim up to `limit` pending rows for this worker (leased).
+    Only when the queue functions are not installed in the database does
+    it fall back to a plain select – safe with a single runner only.
+    """
+    global _lease_mode
+
+    if _lease_mode:
+        try:
+            return claim_inputs(limit)
+        except Exception as e:
+            if not _rpc_missing(e):
+                raise
+            log(f"⚠️ Lease queue not installed ({e}) — falling back to unleased select (single runner only)")
+            _lease_mode = False
+
     res = (
         supabase
         .table("news_revalidation_input")
-        .select("symbol, base_score, news_block")
+        .select("symbol, analysis_date, base_score, news_block")
         .eq("processed", False)
         .limit(limit)
         .execute()
     )
     return res.data or []
 
+
+def mark_processed(row: dict, error: str | None = None):
+    """Complete a claimed row (only while this worker still holds it)."""
+    fields = {
+        "processed": True,
+        "processed_at": datetime.now(timezone.utc).isoformat()
+    }
+    if error:
+        fields["error"] = error
+
+    q = supabase.table("news_revalidation_input").update(fields).eq("symbol", row["symbol"])
+    if row.get("analysis_date") is not None:
+        q = q.eq("analysis_date", row["analysis_date"])
+    if _lease_mode:
+        q = q.eq("claimed_by", WORKER_ID)
+    q.execute()
+
+
+def start_heartbeat() -> threading.Event:
+    """Renew this worker's leases every LEASE_SECONDS / 3 until the event is set."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(LEASE_SECONDS / 3):
+            if not _lease_mode:
+                continue
+            try:
+                supabase.rpc("renew_news_revalidation_leases", {
+                    "p_worker": WORKER_ID,
+                    "p_lease_seconds": LEASE_SECONDS,
+                }).execute()
+            except Exception as e:
+                log(f"⚠️ Lease heartbeat failed: {e}")
+
+    threading.Thread(target=beat, name="lease-heartbeat", daemon=True).start()
+    return stop
+
 # ==================================================
 # RUN AI
 # ==================================================
@@ -69,37 +180,65 @@ ALLOWED_BIAS = {
     "high_risk_unclear"
 }
 
-def run_ai(symbol: str, base_score: int, news_block: str):
+def build_ai_request(symbol: str, base_score: int, news_block: str) -> dict:
+    """chat.completions.create kwargs for one symbol (sync and batch backends)."""
     prompt = PROMPT_TEMPLATE.format(
         symbol=symbol,
         base_score=base_score,
         news_block=news_block
     )
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        temperature=0.2,
-        messages=[
-            {"role": "system", "content": "You are a financial analyst AI. Return ONLY valid JSON."},
+    return {
+        "model": MODEL,
+        "temperature": 0.2,
+        "messages": [
+            {"role": "system", "content": SYSTEM_MESSAGE},
             {"role": "user", "content": prompt}
         ]
-    )
+    }
+
+
+def run_ai(symbol: str, base_score: int, news_block: str):
+    with llm_telemetry.track("news_revalidation", MODEL, symbol) as t:
+        response = t.call(lambda: openai_client.chat.completions.create(
+            **build_ai_request(symbol, base_score, news_block)
+        ))
+
+        result = validate_ai_response(symbol, response.choices[0].message.content)
+        if result is None:
+            t.fail("invalid_response")
+        return result
 
-    raw = response.choices[0].message.content or ""
+
+def parse_ai_json(label: str, raw: str | None):
+    """Model output -> dict with normalized keys, or None."""
+    raw = raw or ""
     raw = raw.replace("```json", "").replace("```", "").strip()
 
-    log(f"RAW AI RESPONSE ({symbol}): {raw}")
+    log(f"RAW AI RESPONSE ({label}): {raw}")
 
     try:
         data = json.loads(raw)
 
         # 🔧 FIX: normalize keys (remove whitespace / newlines)
-        data = {k.strip(): v for k, v in data.items()}
+        return {k.strip(): v for k, v in data.items()}
 
     except Exception as e:
-        log(f"❌ JSON parse error for {symbol}: {e}")
+        log(f"❌ JSON parse error for {label}: {e}")
+        return None
+
+
+def validate_ai_response(symbol: str, raw: str | None):
+    """Parse and validate the model output; returns the result dict or None."""
+    data = parse_ai_json(symbol, raw)
+    if data is None:
         return None
 
+    return validate_ai_result(symbol, data)
+
+
+def validate_ai_result(symbol: str, data: dict):
+    """Validation rules for one symbol's result; returns data or None."""
     # ---- Validation ----
     if data.get("symbol") != symbol:
         log(f"❌ Symbol mismatch: expected {symbol}, got {data.get('symbol')}")
@@ -123,8 +262,6 @@ def run_ai(symbol: str, base_score: int, news_block: str):
 
     word_count = len(re.findall(r"\b\w+\b", explanation))
 
-    word_count = len(re.findall(r"\b\w+\b", explanation))
-
     if word_count < 120:
         log(f"❌ explanation_text too short for {symbol} ({word_count} words)")
         return None
@@ -132,6 +269,126 @@ def run_ai(symbol: str, base_score: int, news_block: str):
 
     return data
 
+# ==================================================
+# PACKED MODE (several symbols per request)
+# ==================================================
+
+def pack_rows(rows: list[dict]) -> list[list[dict]]:
+    """
+    Group rows into packs of up to PACK_SIZE whose packed prompt stays
+    within PACK_TOKEN_BUDGET. A row too large to share goes alone.
+    """
+    base_tokens = llm_payload_encoder.count_tokens(PROMPT_INSTRUCTIONS + PACKED_PROMPT_TEMPLATE)
+    packs, current, current_tokens = [], [], base_tokens
+
+    for row in rows:
+        row_tokens = llm_payload_encoder.count_tokens(format_pack_item(0, row))
+        if current and (len(current) >= PACK_SIZE or current_tokens + row_tokens > PACK_TOKEN_BUDGET):
+            packs.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(row)
+        current_tokens += row_tokens
+
+    if current:
+        packs.append(current)
+    return packs
+
+
+def format_pack_item(i: int, row: dict) -> str:
+    return (
+        f"=== STOCK {i} ===\n"
+        f"Symbol:\n{row['symbol']}\n\n"
+        f"Base score (before earnings):\n{row['base_score']}\n\n"
+        f"News:\n{row['news_block']}\n"
+    )
+
+
+def build_packed_request(rows: list[dict]) -> dict:
+    prompt = PACKED_PROMPT_TEMPLATE.format(
+        instructions=PROMPT_INSTRUCTIONS,
+        count=len(rows),
+        items_block="\n".join(format_pack_item(i + 1, row) for i, row in enumerate(rows)),
+    )
+
+    return {
+        "model": MODEL,
+        "temperature": 0.2,
+        "messages": [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+
+def run_ai_packed(rows: list[dict]) -> dict:
+    """
+    One request for several symbols. Returns {symbol: validated result};
+    symbols missing from the answer or failing validation are left out.
+    """
+    label = ",".join(row["symbol"] for row in rows)
+
+    with llm_telemetry.track("news_revalidation_packed", MODEL, label) as t:
+        try:
+            response = t.call(lambda: openai_client.chat.completions.create(**build_packed_request(rows)))
+        except Exception as e:
+            log(f"❌ Packed AI call failed ({label}): {e}")
+            return {}
+
+        data = parse_ai_json(label, response.choices[0].message.content)
+        items = data.get("results") if data else None
+        if not isinstance(items, list):
+            log(f"❌ Packed response without results array ({label})")
+            t.fail()
+            return {}
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item = {k.strip(): v for k, v in item.items()}
+        symbol = item.get("symbol")
+        if symbol in results or symbol not in {row["symbol"] for row in rows}:
+            continue
+        result = validate_ai_result(symbol, item)
+        if result:
+            results[symbol] = result
+    return results
+
+
+def _input_key(row: dict) -> tuple:
+    """Queue key of a news_revalidation_input row."""
+    return (row["symbol"], row.get("analysis_date"))
+
+
+def run_packed_round(rows: list[dict]):
+    """
+    Packed requests; items that fail are split back out into single calls.
+    Packed answers are matched by symbol, so a second claimed row for the
+    same symbol (another analysis_date) goes out as a single request.
+    """
+    rows = list({_input_key(row): row for row in rows}.values())
+    first, extra, seen = [], [], set()
+    for row in rows:
+        (extra if row["symbol"] in seen else first).append(row)
+        seen.add(row["symbol"])
+
+    for row in extra:
+        handle_result(row, run_ai(row["symbol"], row["base_score"], row["news_block"]))
+
+    for pack in pack_rows(first):
+        results = run_ai_packed(pack) if len(pack) > 1 else {}
+        if len(pack) > 1:
+            log(f"Packed request: {len(results)}/{len(pack)} symbols valid")
+
+        for row in pack:
+            result = results.get(row["symbol"])
+            if result is None:
+                if len(pack) > 1:
+                    log(f"Retrying {row['symbol']} as a single request")
+                result = run_ai(row["symbol"], row["base_score"], row["news_block"])
+            handle_result(row, result)
+
+
 def insert_revalidation_result(
     symbol: str,
     base_score: int,
@@ -157,63 +414,85 @@ def insert_revalidation_result(
 # MAIN
 # ==================================================
 
-def main():
-    log("Starting AI Revalidation Step 2.6")
+def handle_result(row: dict, result: dict | None):
+    """Store a validated AI result (or the failure) and mark the input processed."""
+    symbol = row["symbol"]
+    base_score = row["base_score"]
 
-    while True:
-        rows = fetch_pending_inputs(limit=10)
+    if not result:
+        log(f"❌ AI failed for {symbol} — marking as processed to avoid loop")
+        mark_processed(row, error="ai_validation_failed")
+        return
 
-        if not rows:
-            log("No more pending inputs — exiting loop")
-            break
+    log(f"✅ AI RESULT FINAL ({symbol}): {json.dumps(result, ensure_ascii=False)}")
 
-        log(f"Fetched {len(rows)} pending inputs")
+    insert_revalidation_result(
+        symbol=symbol,
+        base_score=base_score,
+        bias_label=result["bias_label"],
+        bias_strength=result["bias_strength"],
+        updated_total_score=result["updated_total_score"],
+        explanation_text=result["explanation_text"],
+        ai_version=APP_VERSION
+    )
 
-        for row in rows:
-            symbol = row["symbol"]
-            base_score = row["base_score"]
-            news_block = row["news_block"]
+    # ✅ mark as processed
+    mark_processed(row)
 
-            log(f"Running AI for {symbol} | base_score={base_score}")
 
-            result = run_ai(symbol, base_score, news_block)
-            if not result:
-                log(f"❌ AI failed for {symbol} — marking as processed to avoid loop")
+def run_batch_round(rows: list[dict]):
+    """LLM_BACKEND=batch: all fetched inputs go out as one OpenAI batch."""
+    rows = list({_input_key(row): row for row in rows}.values())
 
-                supabase.table("news_revalidation_input") \
-                    .update({
-                    "processed": True,
-                    "processed_at": datetime.now(timezone.utc).isoformat(),
-                    "error": "ai_validation_failed"
-                }) \
-                    .eq("symbol", symbol) \
-                    .execute()
+    def custom_id(row: dict) -> str:
+        return f"{row['symbol']}|{row.get('analysis_date')}"
+
+    requests = [
+        {
+            "custom_id": custom_id(row),
+            "symbol": row["symbol"],
+            "body": build_ai_request(row["symbol"], row["base_score"], row["news_block"]),
+        }
+        for row in rows
+    ]
+    contents = openai_batch.run(requests, "news_revalidation", step="news_revalidation")
+
+    for row in rows:
+        handle_result(row, validate_ai_response(row["symbol"], contents.get(custom_id(row))))
 
-                continue
 
-            log(f"✅ AI RESULT FINAL ({symbol}): {json.dumps(result, ensure_ascii=False)}")
-
-            insert_revalidation_result(
-                symbol=symbol,
-                base_score=base_score,
-                bias_label=result["bias_label"],
-                bias_strength=result["bias_strength"],
-                updated_total_score=result["updated_total_score"],
-                explanation_text=result["explanation_text"],
-                ai_version=APP_VERSION
-            )
-
-            # ✅ mark as processed
-            supabase.table("news_revalidation_input") \
-                .update({
-                "processed": True,
-                "processed_at": datetime.now(timezone.utc).isoformat()
-            }) \
-                .eq("symbol", symbol) \
-                .execute()
-
-
-        log("Batch completed — checking for more inputs")
+def main():
+    log(f"Starting AI Revalidation Step 2.6 | worker={WORKER_ID}")
+    heartbeat = start_heartbeat()
+    batch_mode = openai_batch.enabled()
+    if batch_mode:
+        log("LLM backend: OpenAI Batch API")
+    elif PACK_SIZE > 1:
+        log(f"Packed mode: up to {PACK_SIZE} symbols per request")
+
+    try:
+        while True:
+            rows = fetch_pending_inputs(limit=BATCH_FETCH_LIMIT if batch_mode else max(10, PACK_SIZE))
+
+            if not rows:
+                log("No more pending inputs — exiting loop")
+                break
+
+            log(f"Fetched {len(rows)} pending inputs")
+
+            if batch_mode:
+                run_batch_round(rows)
+            elif PACK_SIZE > 1:
+                run_packed_round(rows)
+            else:
+                for row in rows:
+                    log(f"Running AI for {row['symbol']} | base_score={row['base_score']}")
+                    handle_result(row, run_ai(row["symbol"], row["base_score"], row["news_block"]))
+
+            log("Batch completed — checking for more inputs")
+    finally:
+        heartbeat.set()
+        llm_telemetry.flush()
 
     log("Finished AI Revalidation Step 2.6")
 
@@ -1,18 +1,14 @@
-import os
 from datetime import datetime
-from supabase import create_client, Client
+from supabase import Client
+
+from clients import get_supabase
+from supabase_reader import stream_rows
 
 # ==================================================
 # CONFIG
 # ==================================================
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("Missing Supabase environment variables")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_supabase()
 
 # ==================================================
 # LOGGING
@@ -27,11 +23,8 @@ def log(msg: str):
 # ==================================================
 
 def get_symbols_with_news():
-    res = supabase.table("fmp_news").select("symbol").execute()
-    if not res.data:
-        return []
-
-    return sorted({r["symbol"] for r in res.data if r.get("symbol")})
+    rows = stream_rows("fmp_news", "symbol", key="url")
+    return sorted({r["symbol"] for r in rows if r.get("symbol")})
 
 # ==================================================
 # STEP 2 – COLLECT NEWS
@@ -106,7 +99,14 @@ def upsert_news_revalidation_input(
         "base_score": base_score,
         "news_block": news_block,
         "processed": False,
-        "created_at": datetime.utcnow().isoformat()
+        "created_at": datetime.utcnow().isoformat(),
+
+        # a re-queued row starts over in the lease queue
+        # (sql/news_revalidation_queue.sql)
+        "attempts": 0,
+        "claimed_by": None,
+        "lease_expires_at": None,
+        "error": None
     }
 
     supabase.table("news_revalidation_input") \
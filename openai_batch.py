@@ -0,0 +1,196 @@
+# openai_batch.py
+#
+# OpenAI Batch API backend for the offline nightly GPT steps.
+# All requests of a run go into one JSONL file, which is uploaded as a
+# single batch; we poll until it finishes and hand every answer back by
+# custom_id. Requests the batch did not answer (errors, expiry, our own
+# timeout) are "stragglers" and are re-run through the normal synchronous
+# path, so a run never ends with missing answers just because of the batch.
+#
+#   LLM_BACKEND=batch                  use this backend (default: sync)
+#   OPENAI_BATCH_REPLAY_FILE=out.jsonl local stand-in: answers are read from a
+#                                      canned batch output file, nothing is
+#                                      uploaded (missing ids become stragglers)
+#   OPENAI_BATCH_SYNC_FALLBACK=0       leave stragglers unanswered (None)
+#
+# Every batch answer and every straggler call gets an llm_calls row
+# (llm_telemetry) under the caller's step name.
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import llm_telemetry
+import openai_throttle
+from clients import get_openai
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "sync").lower()
+OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "30"))
+OPENAI_BATCH_TIMEOUT_SECONDS = float(os.getenv("OPENAI_BATCH_TIMEOUT_SECONDS", str(3 * 3600)))
+OPENAI_BATCH_REPLAY_FILE = os.getenv("OPENAI_BATCH_REPLAY_FILE")
+OPENAI_BATCH_SYNC_FALLBACK = os.getenv("OPENAI_BATCH_SYNC_FALLBACK", "1") == "1"
+OPENAI_BATCH_DIR = os.getenv(
+    "OPENAI_BATCH_DIR", os.path.join(tempfile.gettempdir(), "analyst44_batches")
+)
+
+ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def enabled() -> bool:
+    return LLM_BACKEND == "batch"
+
+
+# ---------------- Sync path ---------------- #
+
+def complete_sync(body: dict, step: str, symbol: str | None = None) -> str | None:
+    """One synchronous chat completion for a batch request body; returns the content."""
+    messages_text = "".join(m.get("content") or "" for m in body.get("messages", []))
+    with llm_telemetry.track(step, body.get("model"), symbol) as t:
+        resp = openai_throttle.call(
+            lambda: t.call(lambda: get_openai(max_retries=0).chat.completions.create(**body)),
+            openai_throttle.estimate_tokens(messages_text) + 800,
+            on_retry=t.on_retry,
+            on_wait=t.on_wait,
+        )
+        return resp.choices[0].message.content
+
+
+# ---------------- Batch file I/O ---------------- #
+
+def _write_input(requests: list[dict], label: str) -> str:
+    os.makedirs(OPENAI_BATCH_DIR, exist_ok=True)
+    path = os.path.join(
+        OPENAI_BATCH_DIR, f"{label}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        for req in requests:
+            line = {"custom_id": req["custom_id"], "method": "POST", "url": ENDPOINT, "body": req["body"]}
+            f.write(json.dumps(line, default=str) + "\n")
+    return path
+
+
+def parse_output(text: str) -> dict[str, dict]:
+    """
+    Batch output JSONL -> {custom_id: {"content", "usage", "error"}}.
+    content is None for lines that did not succeed; error says why.
+    """
+    outputs = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            out = {"content": None, "usage": body.get("usage"), "error": None}
+            if response.get("status_code") == 200:
+                out["content"] = body["choices"][0]["message"]["content"]
+            else:
+                err = item.get("error") or body.get("error") or {}
+                out["error"] = f"{response.get('status_code')}: {err.get('message') or err}"
+            outputs[item["custom_id"]] = out
+        except Exception as e:
+            print(f"  Skipping unreadable batch output line: {e}")
+    return outputs
+
+
+# ---------------- Batch run ---------------- #
+
+def _run_remote(path: str, label: str) -> dict[str, dict]:
+    client = get_openai()
+
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=ENDPOINT,
+        completion_window="24h",
+        metadata={"job": label},
+    )
+    print(f"  Batch {batch.id} submitted ({path})")
+
+    deadline = time.time() + OPENAI_BATCH_TIMEOUT_SECONDS
+    while batch.status not in FINAL_STATUSES:
+        if time.time() > deadline:
+            print(f"  Batch {batch.id} still {batch.status} after timeout – cancelling")
+            try:
+                client.batches.cancel(batch.id)
+            except Exception as e:
+                print(f"  Cancel failed: {e}")
+            break
+        time.sleep(OPENAI_BATCH_POLL_SECONDS)
+        batch = client.batches.retrieve(batch.id)
+
+    counts = getattr(batch, "request_counts", None)
+    print(f"  Batch {batch.id} status={batch.status} counts={counts}")
+
+    # Completed (and cancelled/expired) batches still deliver what finished
+    if not getattr(batch, "output_file_id", None):
+        return {}
+    return parse_output(client.files.content(batch.output_file_id).text)
+
+
+def run(
+    requests: list[dict],
+    label: str,
+    step: str | None = None,
+    sync_fn=complete_sync,
+) -> dict[str, str | None]:
+    """
+    requests: [{"custom_id": str, "body": {chat.completions.create kwargs},
+                "symbol": str (optional, for telemetry)}]
+    Returns {custom_id: content or None}. Never raises for a failed batch:
+    everything unanswered goes through sync_fn(body, step, symbol) (unless
+    the fallback is off). `step` names the llm_calls rows (default: label).
+    """
+    step = step or label
+    if not requests:
+        return {}
+
+    path = _write_input(requests, label)
+    print(f"Batch '{label}': {len(requests)} requests")
+
+    try:
+        if OPENAI_BATCH_REPLAY_FILE:
+            print(f"  Replaying canned batch output from {OPENAI_BATCH_REPLAY_FILE}")
+            with open(OPENAI_BATCH_REPLAY_FILE, "r", encoding="utf-8") as f:
+                outputs = parse_output(f.read())
+        else:
+            outputs = _run_remote(path, label)
+    except Exception as e:
+        print(f"  Batch '{label}' failed: {e}")
+        outputs = {}
+
+    results: dict[str, str | None] = {}
+    stragglers = []
+    for req in requests:
+        cid = req["custom_id"]
+        out = outputs.get(cid)
+        if out is not None:
+            llm_telemetry.record(
+                f"{step}_batch", req["body"].get("model"), req.get("symbol"), out["usage"],
+                status="ok" if out["content"] is not None else "error", error=out["error"],
+            )
+        if out is not None and out["content"] is not None:
+            results[cid] = out["content"]
+        else:
+            stragglers.append(req)
+
+    if stragglers:
+        print(
+            f"  {len(stragglers)} stragglers "
+            f"{'– running synchronously' if OPENAI_BATCH_SYNC_FALLBACK else '– left unanswered'}"
+        )
+    for req in stragglers:
+        results[req["custom_id"]] = None
+        if not OPENAI_BATCH_SYNC_FALLBACK:
+            continue
+        try:
+            results[req["custom_id"]] = sync_fn(req["body"], step, req.get("symbol"))
+        except Exception as e:
+            print(f"  Sync fallback failed for {req['custom_id']}: {e}")
+
+    return results
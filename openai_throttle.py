@@ -0,0 +1,133 @@
+# openai_throttle.py
+#
+# Client-side limits for concurrent OpenAI calls in one process:
+# - a tokens-per-minute budget (token bucket refilled at OPENAI_TPM_LIMIT/60
+#   per second), so N threads do not burst past the account TPM;
+# - adaptive backoff on 429: every thread pauses for the cool-down, the
+#   pause doubles while 429s keep coming and halves again on success.
+# Clients used through call() should be created with max_retries=0
+# (clients.get_openai(max_retries=0)): SDK-internal retries would multiply
+# the retries here and hide 429s from the cool-down.
+
+import os
+import threading
+import time
+
+from openai import RateLimitError
+
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", "200000"))  # 0 disables the budget
+OPENAI_MAX_429_RETRIES = int(os.getenv("OPENAI_MAX_429_RETRIES", "5"))
+OPENAI_429_BACKOFF_SECONDS = float(os.getenv("OPENAI_429_BACKOFF_SECONDS", "2"))
+OPENAI_429_BACKOFF_MAX_SECONDS = 60.0
+
+_lock = threading.Lock()
+_tokens = OPENAI_TPM_LIMIT
+_updated_at = time.monotonic()
+_cooldown_until = 0.0
+_backoff = OPENAI_429_BACKOFF_SECONDS
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough prompt size (~4 characters per token)."""
+    return sum(len(t) for t in texts) // 4 + 1
+
+
+def _refill(now: float) -> None:
+    global _tokens, _updated_at
+    rate = OPENAI_TPM_LIMIT / 60.0
+    _tokens = min(OPENAI_TPM_LIMIT, _tokens + (now - _updated_at) * rate)
+    _updated_at = now
+
+
+def acquire(tokens: int) -> float:
+    """
+    Block until the budget has `tokens` and no 429 cool-down is active.
+    Returns the seconds spent waiting.
+    """
+    global _tokens
+    waited = 0.0
+    while True:
+        with _lock:
+            now = time.monotonic()
+            wait = max(0.0, _cooldown_until - now)
+
+            if wait == 0 and OPENAI_TPM_LIMIT > 0:
+                _refill(now)
+                need = min(tokens, OPENAI_TPM_LIMIT)
+                if _tokens >= need:
+                    _tokens -= need
+                else:
+                    wait = (need - _tokens) / (OPENAI_TPM_LIMIT / 60.0)
+
+        if wait <= 0:
+            return waited
+        time.sleep(wait)
+        waited += wait
+
+
+def settle(estimated: int, actual: int | None) -> None:
+    """Correct the budget once the real usage is known (refund or debit)."""
+    global _tokens
+    if actual is None or OPENAI_TPM_LIMIT <= 0:
+        return
+    with _lock:
+        _tokens -= actual - estimated
+
+
+def _retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except Exception:
+        return None
+
+
+def _on_rate_limited(exc: Exception) -> float:
+    global _cooldown_until, _backoff
+    with _lock:
+        delay = _retry_after(exc) or _backoff
+        _backoff = min(_backoff * 2, OPENAI_429_BACKOFF_MAX_SECONDS)
+        _cooldown_until = max(_cooldown_until, time.monotonic() + delay)
+    return delay
+
+
+def _on_success() -> None:
+    global _backoff
+    with _lock:
+        _backoff = max(OPENAI_429_BACKOFF_SECONDS, _backoff / 2)
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    return isinstance(exc, RateLimitError) or getattr(exc, "status_code", None) == 429
+
+
+def call(fn, estimated_tokens: int, on_retry=None, on_wait=None):
+    """
+    Run fn() (one OpenAI request) inside the budget, retrying 429s with
+    the shared backoff. Returns fn()'s result; other errors propagate.
+    The tokens are reserved once for the whole call: a 429 consumed no
+    budget, so retries only wait out the cool-down.
+    on_retry() is called before every retry and on_wait(seconds) after
+    every wait for budget or cool-down (telemetry).
+    """
+    attempt = 0
+    while True:
+        waited = acquire(estimated_tokens if attempt == 0 else 0)
+        if on_wait is not None and waited:
+            on_wait(waited)
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_rate_limited(e) or attempt >= OPENAI_MAX_429_RETRIES:
+                raise
+            attempt += 1
+            delay = _on_rate_limited(e)
+            print(f"  OpenAI 429, backing off {delay:.1f}s (attempt {attempt}/{OPENAI_MAX_429_RETRIES})")
+            if on_retry is not None:
+                on_retry()
+            continue
+
+        _on_success()
+        usage = getattr(result, "usage", None)
+        settle(estimated_tokens, getattr(usage, "total_tokens", None))
+        return result
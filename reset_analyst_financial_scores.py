@@ -1,10 +1,8 @@
-import os
-from supabase import create_client, Client
+from supabase import Client
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+from clients import get_supabase
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_supabase()
 
 def reset_scores():
     print("Resetting analyst_financial_scores...")
@@ -1,13 +1,13 @@
 import os
-import requests
 import datetime
 from zoneinfo import ZoneInfo
 from supabase import create_client, Client
 
+import fmp_client
+
 # -------------------------------------------
 # CONFIG
 # -------------------------------------------
-API_KEY = os.getenv("FMP_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
@@ -42,9 +42,7 @@ def upsert(row):
 
 def fetch_live_quote():
     """שליפת ציטוט חי"""
-    url = f"https://financialmodelingprep.com/api/v3/quote/{SYMBOL}?apikey={API_KEY}"
-    r = requests.get(url)
-    data = r.json()
+    data = fmp_client.quote_symbol(SYMBOL)
     if not data:
         return None
     return data[0]
@@ -79,10 +77,7 @@ def build_live_bar():
 
 def fetch_hist_5m():
     """היסטוריה רשמית 5 דקות"""
-    url = f"https://financialmodelingprep.com/api/v3/historical-chart/5min/{SYMBOL}?apikey={API_KEY}"
-    r = requests.get(url)
-    data = r.json()
-    return data
+    return fmp_client.historical_chart("5min", SYMBOL)
 
 
 def build_hist_bar(bar):
@@ -4,12 +4,13 @@ from datetime import datetime, date
 from supabase import create_client
 from zoneinfo import ZoneInfo
 
+import fmp_client
+
 # ------------------------------------------------------
 # Load environment
 # ------------------------------------------------------
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-FMP_KEY = os.getenv("FMP_API_KEY")
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 NY = ZoneInfo("America/New_York")
@@ -18,12 +19,11 @@ NY = ZoneInfo("America/New_York")
 # Fetch all 5m bars from FMP
 # ------------------------------------------------------
 def fetch_spy_history():
-    url = f"https://financialmodelingprep.com/api/v3/historical-chart/5min/SPY?apikey={FMP_KEY}"
-    r = requests.get(url)
-    if r.status_code != 200:
-        print("ERROR fetching history:", r.text)
+    try:
+        return fmp_client.historical_chart("5min", "SPY")
+    except requests.HTTPError as e:
+        print("ERROR fetching history:", e.response.text)
         return None
-    return r.json()
 
 
 # ------------------------------------------------------
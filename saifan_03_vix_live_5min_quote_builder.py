@@ -1,18 +1,18 @@
 import os
-import requests
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from supabase import create_client, Client
 
+import fmp_client
+
 # =============================
 # CONFIG
 # =============================
 
-FMP_API_KEY = os.getenv("FMP_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-if not FMP_API_KEY or not SUPABASE_URL or not SUPABASE_KEY:
+if not fmp_client.FMP_API_KEY or not SUPABASE_URL or not SUPABASE_KEY:
     raise Exception("Missing environment variables")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
@@ -25,9 +25,7 @@ NY = ZoneInfo("America/New_York")
 # =============================
 
 def get_live_quote_vix():
-    url = f"https://financialmodelingprep.com/api/v3/quote/%5EVIX?apikey={FMP_API_KEY}"
-    r = requests.get(url)
-    data = r.json()
+    data = fmp_client.quote_symbol("^VIX")
     if not data:
         return None
 
@@ -4,12 +4,13 @@ from datetime import datetime
 from supabase import create_client
 from zoneinfo import ZoneInfo
 
+import fmp_client
+
 # ------------------------------------------------------
 # Environment
 # ------------------------------------------------------
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-FMP_KEY = os.getenv("FMP_API_KEY")
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 NY = ZoneInfo("America/New_York")
@@ -21,16 +22,13 @@ TABLE = "saifan_intraday_candles_vix_5m"
 # Fetch 5-minute official VIX bars
 # ------------------------------------------------------
 def fetch_vix_history():
-    # %5EVIX is URL-encoded for ^VIX
-    url = f"https://financialmodelingprep.com/api/v3/historical-chart/5min/%5EVIX?apikey={FMP_KEY}"
-    r = requests.get(url)
-
-    if r.status_code != 200:
-        print("ERROR fetching VIX history:", r.text)
+    # ^VIX is URL-encoded (%5EVIX) by fmp_client
+    try:
+        return fmp_client.historical_chart("5min", "^VIX")
+    except requests.HTTPError as e:
+        print("ERROR fetching VIX history:", e.response.text)
         return None
 
-    return r.json()
-
 
 # ------------------------------------------------------
 # Main logic: overwrite/update all bars from today
@@ -1,10 +1,10 @@
 import os
-import requests
 from datetime import datetime, timezone
 from supabase import create_client, Client
 
+import fmp_client
+
 # ========= CONFIG =========
-FMP_API_KEY = os.getenv("FMP_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
@@ -18,10 +18,8 @@ TABLE_STOCK_LIST = "saifan_stock_list"
 # ========= HELPERS =========
 
 def fetch_symbol_5m(symbol):
-    url = f"https://financialmodelingprep.com/api/v3/historical-chart/5min/{symbol}?apikey={FMP_API_KEY}"
     try:
-        res = requests.get(url, timeout=10)
-        data = res.json()
+        data = fmp_client.historical_chart("5min", symbol)
         if isinstance(data, list) and len(data) > 0:
             return data[0]
         return None
@@ -1,15 +1,17 @@
 # spy_daily_bars_reset.py
 
-from supabase import create_client
-import os
+from clients import get_supabase
 
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-)
+supabase = get_supabase()
 
-print("Resetting spy_daily_bars table...")
 
-supabase.table("spy_daily_bars").delete().neq("symbol", "").execute()
+def run():
+    print("Resetting spy_daily_bars table...")
 
-print("spy_daily_bars reset completed")
+    supabase.table("spy_daily_bars").delete().neq("symbol", "").execute()
+
+    print("spy_daily_bars reset completed")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,8 +1,13 @@
-import os
 import json
 from datetime import date, timedelta
-from supabase import create_client, Client
-from openai import OpenAI
+from supabase import Client
+
+import llm_payload_encoder
+import llm_telemetry
+import market_features
+import market_regime
+import openai_throttle
+from clients import get_openai, get_supabase
 
 # =============================
 # CONFIG
@@ -10,65 +15,30 @@ from openai import OpenAI
 SYMBOL = "SPY"
 DAYS_BACK = 190
 DECISIONS_LOOKBACK = 7
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not all([SUPABASE_URL, SUPABASE_KEY, OPENAI_API_KEY]):
-    raise Exception("Missing environment variables")
+TAIL_BARS = 10
+EST_COMPLETION_TOKENS = 300
 
 # =============================
 # CLIENTS  ❗❗❗
 # =============================
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-client = OpenAI(api_key=OPENAI_API_KEY)
+supabase: Client = get_supabase()
+# no SDK retries: 429s are retried by openai_throttle
+client = get_openai(max_retries=0)
 
-# =============================
-# FETCH DAILY BARS
-# =============================
-bars_resp = supabase.table("spy_daily_bars") \
-    .select("bar_date, open, high, low, close, volume") \
-    .gte("bar_date", date.today() - timedelta(days=DAYS_BACK)) \
-    .order("bar_date", desc=False) \
-    .execute()
-
-bars = [
-    {
-        "date": r["bar_date"],
-        "open": float(r["open"]),
-        "high": float(r["high"]),
-        "low": float(r["low"]),
-        "close": float(r["close"]),
-        "volume": int(r["volume"]),
-    }
-    for r in bars_resp.data
-]
-
-if len(bars) < 50:
-    raise Exception("Not enough daily bars")
 
-# =============================
-# FETCH PREVIOUS DECISIONS
-# =============================
-decisions_resp = supabase.table("spy_market_state_history") \
-    .select("decision_date, market_state, decision_strength") \
-    .eq("symbol", SYMBOL) \
-    .order("decision_date", desc=True) \
-    .limit(DECISIONS_LOOKBACK) \
-    .execute()
-
-previous_decisions = list(reversed(decisions_resp.data or []))
-
-# =============================
-# BUILD PROMPT
-# =============================
-prompt = f"""
+def decide_with_llm(features_text: str, tail_text: str, previous_decisions: list[dict]) -> dict:
+    # =============================
+    # BUILD PROMPT
+    # =============================
+    prompt = f"""
 You are a professional market analyst.
 
 You are given:
-1. 6 months of DAILY OHLCV data for SPY
-2. A history of recent market state decisions
+1. Features computed from 6 months of DAILY OHLCV data for SPY
+   (returns, realized volatility, ATR, drawdowns, moving-average distance
+   and slope, range compression, swing structure; percentages are in %)
+2. The last {TAIL_BARS} daily bars
+3. A history of recent market state decisions
 
 Choose EXACTLY ONE market state from:
 - Strong Uptrend
@@ -87,49 +57,136 @@ Return JSON ONLY:
   "short_explanation_8_words": "<MAX 8 WORDS>"
 }}
 
-Data:
-{json.dumps(bars)}
+Features:
+{features_text}
+
+Last {TAIL_BARS} bars (columns, then one row per day, oldest first):
+{tail_text}
 
 Previous Decisions:
 {json.dumps(previous_decisions)}
 """
 
-# =============================
-# CALL OPENAI
-# =============================
-response = client.chat.completions.create(
-    model="gpt-4o-mini",
-    messages=[{"role": "user", "content": prompt}],
-    temperature=0
-)
-
-raw_content = response.choices[0].message.content.strip()
-print("🔍 RAW LLM RESPONSE:")
-print(raw_content)
-
-# =============================
-# SAFE JSON PARSING
-# =============================
-cleaned = raw_content
-if cleaned.startswith("```"):
-    cleaned = cleaned.strip("`").strip()
-    if cleaned.lower().startswith("json"):
-        cleaned = cleaned[4:].strip()
-
-result = json.loads(cleaned)
-
-# =============================
-# UPSERT DECISION
-# =============================
-supabase.table("spy_market_state_history").upsert(
-    {
-        "symbol": SYMBOL,
-        "decision_date": date.today().isoformat(),
-        "market_state": result["market_state"],
-        "decision_strength": int(result["decision_strength"]),
-        "explanation": result["short_explanation_8_words"],
-    },
-    on_conflict="symbol,decision_date"
-).execute()
-
-print("✔️ SPY market state decision saved:", result)
+    # =============================
+    # CALL OPENAI
+    # =============================
+    with llm_telemetry.track("spy_market_state", "gpt-4o-mini", SYMBOL) as t:
+        response = openai_throttle.call(
+            lambda: t.call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0
+            )),
+            openai_throttle.estimate_tokens(prompt) + EST_COMPLETION_TOKENS,
+            on_retry=t.on_retry,
+            on_wait=t.on_wait,
+        )
+
+        raw_content = response.choices[0].message.content.strip()
+        print("🔍 RAW LLM RESPONSE:")
+        print(raw_content)
+
+        # =============================
+        # SAFE JSON PARSING
+        # =============================
+        cleaned = raw_content
+        if cleaned.startswith("```"):
+            cleaned = cleaned.strip("`").strip()
+            if cleaned.lower().startswith("json"):
+                cleaned = cleaned[4:].strip()
+
+        try:
+            result = json.loads(cleaned)
+        except Exception as e:
+            t.fail(error=str(e))
+            raise
+
+    return result
+
+
+def run():
+    # =============================
+    # FETCH DAILY BARS
+    # =============================
+    bars_resp = supabase.table("spy_daily_bars") \
+        .select("bar_date, open, high, low, close, volume") \
+        .gte("bar_date", date.today() - timedelta(days=DAYS_BACK)) \
+        .order("bar_date", desc=False) \
+        .execute()
+
+    bars = [
+        {
+            "date": r["bar_date"],
+            "open": float(r["open"]),
+            "high": float(r["high"]),
+            "low": float(r["low"]),
+            "close": float(r["close"]),
+            "volume": int(r["volume"]),
+        }
+        for r in bars_resp.data
+    ]
+
+    if len(bars) < 50:
+        raise Exception("Not enough daily bars")
+
+    # =============================
+    # FETCH PREVIOUS DECISIONS
+    # =============================
+    decisions_resp = supabase.table("spy_market_state_history") \
+        .select("decision_date, market_state, decision_strength, explanation") \
+        .eq("symbol", SYMBOL) \
+        .order("decision_date", desc=True) \
+        .limit(DECISIONS_LOOKBACK) \
+        .execute()
+
+    previous_decisions = list(reversed(decisions_resp.data or []))
+
+    # The model gets the feature vector over all bars plus the last few
+    # bars (columns header + one array per day; 6 significant digits keeps
+    # cents on SPY prices)
+    features = market_features.compute_features(bars)
+    features_text = llm_payload_encoder.encode(features)
+    tail_text = llm_payload_encoder.encode(
+        llm_payload_encoder.columnar(
+            llm_payload_encoder.compact(market_features.tail(bars, TAIL_BARS), digits=6)
+        )
+    )
+    before, after = llm_payload_encoder.record_savings(
+        "spy_market_state", json.dumps(bars), features_text + tail_text
+    )
+    print(f"Bars payload: {before} -> {after} tokens")
+
+    # =============================
+    # RULE-BASED FAST PATH
+    # =============================
+    carried = market_regime.fast_path(SYMBOL, features, previous_decisions, market_regime.SPY_RULES)
+
+    if carried:
+        result = {
+            "market_state": carried["market_state"],
+            "decision_strength": carried["decision_strength"],
+            "short_explanation_8_words": carried["explanation"],
+        }
+    else:
+        result = decide_with_llm(features_text, tail_text, previous_decisions)
+
+    # =============================
+    # UPSERT DECISION
+    # =============================
+    supabase.table("spy_market_state_history").upsert(
+        {
+            "symbol": SYMBOL,
+            "decision_date": date.today().isoformat(),
+            "market_state": result["market_state"],
+            "decision_strength": int(result["decision_strength"]),
+            "explanation": result["short_explanation_8_words"],
+        },
+        on_conflict="symbol,decision_date"
+    ).execute()
+
+    print("✔️ SPY market state decision saved:", result)
+    llm_telemetry.flush()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,13 @@
+-- earnings_calendar_us_keys.sql
+--
+-- earnings_calendar_us is filled with plain inserts, so (symbol, report_date)
+-- is not unique. Readers page it with keyset pagination
+-- (supabase_reader.stream_rows), which needs a unique key or pages can skip
+-- or repeat rows: make sure every row has a unique id.
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+alter table earnings_calendar_us
+    add column if not exists id bigint generated by default as identity;
+
+create unique index if not exists earnings_calendar_us_id_key
+    on earnings_calendar_us (id);
@@ -0,0 +1,20 @@
+-- latest_two_reports.sql
+--
+-- The two newest analyst_input_financial_statements rows per symbol, for
+-- analyst_financial_scores_worker.load_two_latest_reports(). Paging this
+-- view (symbol in (...), keyset on (symbol, report_rank)) transfers at most
+-- 2 rows per symbol however deep the report history grows; the symbol
+-- filter is pushed below the window function onto the index.
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+create index if not exists analyst_input_financial_statements_symbol_report_date_idx
+    on analyst_input_financial_statements (symbol, report_date desc);
+
+create or replace view analyst_input_financial_statements_latest_two as
+select *
+from (
+    select s.*,
+           row_number() over (partition by s.symbol order by s.report_date desc) as report_rank
+    from analyst_input_financial_statements s
+) ranked
+where report_rank <= 2;
@@ -0,0 +1,49 @@
+-- llm_calls.sql
+--
+-- Per-call OpenAI telemetry written by llm_telemetry.py, plus a daily
+-- summary per step/model (p50/p95 latency, tokens, cost, failures,
+-- throttle waits).
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+create table if not exists llm_calls (
+    id bigserial primary key,
+    created_at timestamptz not null default now(),
+    step text not null,
+    model text,
+    symbol text,
+    latency_ms integer,
+    prompt_tokens integer,
+    completion_tokens integer,
+    total_tokens integer,
+    cost_usd numeric(12, 6),
+    retries integer not null default 0,
+    throttle_wait_ms integer not null default 0,   -- TPM budget / 429 cool-down, not in latency_ms
+    status text not null,          -- ok | error | parse_error | invalid_response
+    error text
+);
+
+alter table llm_calls
+    add column if not exists throttle_wait_ms integer not null default 0;
+
+create index if not exists llm_calls_step_created_at_idx
+    on llm_calls (step, created_at);
+
+
+create or replace view llm_calls_daily_summary as
+select
+    (created_at at time zone 'utc')::date                                   as day,
+    step,
+    model,
+    count(*)                                                                as calls,
+    count(*) filter (where status <> 'ok')                                  as failures,
+    round(percentile_cont(0.5) within group (order by latency_ms)::numeric) as p50_latency_ms,
+    round(percentile_cont(0.95) within group (order by latency_ms)::numeric) as p95_latency_ms,
+    sum(prompt_tokens)                                                      as prompt_tokens,
+    sum(completion_tokens)                                                  as completion_tokens,
+    sum(total_tokens)                                                       as total_tokens,
+    round(avg(total_tokens))                                                as avg_tokens_per_call,
+    sum(cost_usd)                                                           as cost_usd,
+    sum(retries)                                                            as retries,
+    sum(throttle_wait_ms)                                                   as throttle_wait_ms
+from llm_calls
+group by 1, 2, 3;
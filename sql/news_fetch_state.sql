@@ -0,0 +1,12 @@
+-- news_fetch_state.sql
+--
+-- Per-symbol cursor for fmp_earnings_news_fetcher.py: the latest FMP
+-- publishedDate already fetched for each symbol, so the next run only asks
+-- FMP for (and writes) news newer than that.
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+create table if not exists news_fetch_state (
+    symbol text primary key,
+    last_published_at timestamp,   -- FMP publishedDate, as FMP reports it (no time zone)
+    last_fetched_at timestamptz not null default now()
+);
@@ -0,0 +1,89 @@
+-- news_revalidation_merge.sql
+--
+-- Incremental merge of news_analyst_revalidation_results into
+-- analyst_financial_scores (merge_earnings_into_financial_scores.py calls it
+-- via RPC).
+--
+-- * pipeline_state: small key/value table for pipeline bookmarks. The merge
+--   keeps its high-water mark (latest created_at merged) under
+--   'news_revalidation_merge_hwm'.
+-- * merge_news_revalidation_into_scores: takes only results newer than the
+--   mark (minus an overlap window for late inserts from still-running
+--   workers), keeps the latest result per symbol and applies them in one
+--   UPDATE ... FROM, then advances the mark — all in one transaction.
+--   Label mapping and weights are passed in by the caller.
+--
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+create table if not exists pipeline_state (
+    key text primary key,
+    value text,
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists news_analyst_revalidation_results_created_at_idx
+    on news_analyst_revalidation_results (created_at);
+
+
+create or replace function merge_news_revalidation_into_scores(
+    p_labels jsonb,
+    p_default_label text,
+    p_base_weight numeric,
+    p_news_weight numeric,
+    p_overlap_seconds integer default 600
+)
+returns integer
+language plpgsql
+as $$
+declare
+    hwm timestamptz;
+    new_hwm timestamptz;
+    merged integer;
+begin
+    select value::timestamptz into hwm
+    from pipeline_state
+    where key = 'news_revalidation_merge_hwm'
+    for update;
+
+    hwm := coalesce(hwm - make_interval(secs => p_overlap_seconds), '-infinity'::timestamptz);
+
+    with recent as (
+        select *
+        from news_analyst_revalidation_results
+        where created_at > hwm
+    ),
+    latest as (
+        select distinct on (symbol) *
+        from recent
+        order by symbol, created_at desc
+    ),
+    applied as (
+        update analyst_financial_scores s
+        set news_bias_label      = coalesce(p_labels ->> trim(l.bias_label), p_default_label),
+            news_bias_strength   = l.bias_strength::integer,
+            news_score           = l.updated_total_score::integer,
+            final_weighted_score = round(l.base_score * p_base_weight
+                                         + l.updated_total_score * p_news_weight)::integer,
+            explanation_text     = l.explanation_text,
+            news_updated_at      = now()
+        from latest l
+        where s.symbol = l.symbol
+        returning 1
+    )
+    select (select count(*) from applied)::integer,
+           (select max(created_at) from recent)
+    into merged, new_hwm;
+
+    if new_hwm is not null then
+        insert into pipeline_state (key, value, updated_at)
+        values ('news_revalidation_merge_hwm', new_hwm::text, now())
+        on conflict (key) do update
+        set value = excluded.value,
+            updated_at = excluded.updated_at
+        where pipeline_state.value is null
+           or pipeline_state.value::timestamptz < excluded.value::timestamptz;
+    end if;
+
+    return merged;
+end;
+$$;
@@ -0,0 +1,86 @@
+-- news_revalidation_queue.sql
+--
+-- Lease-based work queue on news_revalidation_input, so several
+-- news_revalidation_ai_runner processes (or machines) can drain it at once.
+--
+-- * claim_news_revalidation_inputs: atomically claims pending rows for a
+--   worker. FOR UPDATE SKIP LOCKED means concurrent claims never return
+--   the same row. Each claim holds a lease until lease_expires_at.
+-- * renew_news_revalidation_leases: heartbeat; extends every lease the
+--   worker still holds.
+-- * A row whose lease expired (runner crashed or hung) is claimable again,
+--   up to p_max_attempts claims in total; after that the next claim marks
+--   it processed with error = 'max_attempts_exceeded'.
+--
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+alter table news_revalidation_input
+    add column if not exists claimed_by text,
+    add column if not exists lease_expires_at timestamptz,
+    add column if not exists attempts integer not null default 0;
+
+create index if not exists news_revalidation_input_pending_idx
+    on news_revalidation_input (created_at)
+    where processed = false;
+
+
+create or replace function claim_news_revalidation_inputs(
+    p_worker text,
+    p_limit integer default 10,
+    p_lease_seconds integer default 600,
+    p_max_attempts integer default 3
+)
+returns setof news_revalidation_input
+language plpgsql
+as $$
+begin
+    -- Rows whose last allowed lease expired are done: close them as errored
+    -- so they stop counting as pending.
+    update news_revalidation_input
+    set processed = true,
+        processed_at = now(),
+        error = 'max_attempts_exceeded',
+        claimed_by = null
+    where processed = false
+      and attempts >= p_max_attempts
+      and (lease_expires_at is null or lease_expires_at < now());
+
+    return query
+    with picked as (
+        select i.symbol, i.analysis_date
+        from news_revalidation_input i
+        where i.processed = false
+          and (i.lease_expires_at is null or i.lease_expires_at < now())
+          and i.attempts < p_max_attempts
+        order by i.created_at
+        limit p_limit
+        for update skip locked
+    )
+    update news_revalidation_input t
+    set claimed_by = p_worker,
+        lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+        attempts = t.attempts + 1
+    from picked
+    where t.symbol = picked.symbol
+      and t.analysis_date = picked.analysis_date
+    returning t.*;
+end;
+$$;
+
+
+create or replace function renew_news_revalidation_leases(
+    p_worker text,
+    p_lease_seconds integer default 600
+)
+returns integer
+language sql
+as $$
+    with renewed as (
+        update news_revalidation_input
+        set lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+        where claimed_by = p_worker
+          and processed = false
+        returning 1
+    )
+    select count(*)::integer from renewed;
+$$;
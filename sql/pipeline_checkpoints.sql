@@ -0,0 +1,20 @@
+-- pipeline_checkpoints.sql
+--
+-- Completion markers for analyst44worker.py --resume: one row per step that
+-- finished successfully. run_id is a deterministic uuid of
+-- (run date, step, input fingerprint), so editing a step's script gives it
+-- (and everything downstream) a new run_id and it runs again.
+-- Kept separate from jobs_monitor so the daily jobs digest is not affected.
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+create table if not exists pipeline_checkpoints (
+    run_id uuid primary key,
+    step_name text not null,
+    run_date date not null,
+    started_at timestamptz,
+    finished_at timestamptz not null default now(),
+    duration_ms integer
+);
+
+create index if not exists pipeline_checkpoints_run_date_idx
+    on pipeline_checkpoints (run_date);
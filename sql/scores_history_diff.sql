@@ -0,0 +1,29 @@
+-- scores_history_diff.sql
+--
+-- Change-only history snapshots (build_scores_history.py,
+-- SCORES_HISTORY_MODE=diff). Each history row carries a hash of its scored
+-- columns; a snapshot inserts a new row only when a symbol's hash differs
+-- from its latest history row, and otherwise just bumps last_seen_at on
+-- that row.
+--
+-- * A changed row for the same analysis_date as the symbol's latest history
+--   row (same-day rerun) replaces that row instead of adding one.
+-- * analyst_financial_scores_history_latest: latest history row per symbol.
+--   DISTINCT ON over the (symbol, saved_at desc, id desc) index, so it is an
+--   index walk rather than a sort of the whole history.
+--
+-- Apply once (Supabase SQL editor / psql). Idempotent.
+
+alter table analyst_financial_scores_history
+    add column if not exists row_hash text,
+    add column if not exists last_seen_at timestamptz;
+
+create index if not exists analyst_financial_scores_history_symbol_saved_at_idx
+    on analyst_financial_scores_history (symbol, saved_at desc, id desc);
+
+
+create or replace view analyst_financial_scores_history_latest as
+select distinct on (symbol)
+    id, symbol, row_hash, saved_at, last_seen_at, analysis_date
+from analyst_financial_scores_history
+order by symbol, saved_at desc, id desc;
@@ -0,0 +1,48 @@
+-- scores_history_snapshot.sql
+--
+-- Copies the current analyst_financial_scores into
+-- analyst_financial_scores_history in one server-side INSERT ... SELECT
+-- (build_scores_history.py calls it via RPC). Idempotent per analysis_date:
+-- the history of every analysis_date being copied is replaced, in the same
+-- transaction, so reruns never duplicate a day.
+-- Apply once (Supabase SQL editor / psql).
+
+create or replace function snapshot_analyst_financial_scores_history()
+returns integer
+language plpgsql
+as $$
+declare
+    copied integer;
+begin
+    delete from analyst_financial_scores_history h
+    where h.analysis_date in (
+        select distinct s.analysis_date
+        from analyst_financial_scores s
+        where s.analysis_date is not null
+    );
+
+    insert into analyst_financial_scores_history (
+        original_id, symbol, last_earnings_date, analysis_date, echo_price,
+        total_score, profitability, growth, financial_strength,
+        target_range_low, target_range_high,
+        swing_forecast_weeks_2_3, volatility_flag, summary_30_words,
+        comparison_trend, direction,
+        news_bias_label, news_bias_strength, news_score,
+        final_weighted_score, news_updated_at,
+        saved_at
+    )
+    select
+        s.id, s.symbol, s.last_earnings_date, s.analysis_date, s.echo_price,
+        s.total_score, s.profitability, s.growth, s.financial_strength,
+        s.target_range_low, s.target_range_high,
+        s.swing_forecast_weeks_2_3, s.volatility_flag, s.summary_30_words,
+        s.comparison_trend, s.direction,
+        s.news_bias_label, s.news_bias_strength, s.news_score,
+        s.final_weighted_score, s.news_updated_at,
+        now()
+    from analyst_financial_scores s;
+
+    get diagnostics copied = row_count;
+    return copied;
+end;
+$$;
@@ -0,0 +1,50 @@
+# supabase_batch.py
+#
+# Multi-row writes to Supabase (PostgREST) in chunks.
+# One HTTP round trip per chunk instead of one per row. When a chunk is
+# rejected it is retried row by row, so a single bad row is reported on
+# its own and does not sink its neighbours.
+
+from clients import get_supabase
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def _chunks(rows: list[dict], size: int):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def write_rows(
+    table: str,
+    rows: list[dict],
+    on_conflict: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> list[tuple[dict, Exception]]:
+    """
+    Upsert (when on_conflict is given) or insert rows in chunks of batch_size.
+    Returns the rows that failed, each with its error; [] means all written.
+    """
+    supabase = get_supabase()
+    failed: list[tuple[dict, Exception]] = []
+
+    def _write(payload):
+        q = supabase.table(table)
+        if on_conflict:
+            q = q.upsert(payload, on_conflict=on_conflict)
+        else:
+            q = q.insert(payload)
+        q.execute()
+
+    for chunk in _chunks(rows, max(1, batch_size)):
+        try:
+            _write(chunk)
+        except Exception:
+            # Find the offending row(s)
+            for row in chunk:
+                try:
+                    _write(row)
+                except Exception as e:
+                    failed.append((row, e))
+
+    return failed
@@ -0,0 +1,115 @@
+# supabase_reader.py
+#
+# Paged reads from Supabase (PostgREST) as a stream of rows.
+# PostgREST silently caps every response (max-rows, 1000 by default), so a
+# bare .select().execute() on a growing table is truncated. stream_rows()
+# walks the table page by page with keyset pagination (WHERE key > last
+# ORDER BY key LIMIT n): each page is an index range scan, memory stays at
+# one page, and callers can start working on the first page right away.
+
+import os
+
+from clients import get_supabase
+
+DEFAULT_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+
+def _quote(value) -> str:
+    """Quote a value for a PostgREST or=() filter."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def _after(keys: tuple[str, ...], last: tuple, op: str) -> str:
+    """
+    or=() filter for "(k1, k2, ...) > (v1, v2, ...)" (op="gt") or "<" (op="lt"):
+    k1.gt.v1, and(k1.eq.v1, k2.gt.v2), ...
+    """
+    branches = []
+    for i, col in enumerate(keys):
+        conds = [f"{keys[j]}.eq.{_quote(last[j])}" for j in range(i)]
+        conds.append(f"{col}.{op}.{_quote(last[i])}")
+        branches.append(conds[0] if len(conds) == 1 else f"and({','.join(conds)})")
+    return ",".join(branches)
+
+
+def stream_rows(
+    table: str,
+    columns: str = "*",
+    key: str | tuple[str, ...] = "id",
+    page_size: int = DEFAULT_PAGE_SIZE,
+    where=None,
+    desc: bool = False,
+    client=None,
+):
+    """
+    Yield every row of `table`, page_size rows per request.
+
+    key: unique column (or tuple of columns) to page on; key columns are
+         always selected. Rows come out ordered by key.
+    where: optional callable applied to each query to add filters,
+           e.g. lambda q: q.eq("analysis_date", today).
+    desc: page from the largest key down.
+    client: Supabase client (defaults to the shared one).
+    """
+    supabase = client or get_supabase()
+    keys = (key,) if isinstance(key, str) else tuple(key)
+
+    if columns.strip() != "*":
+        selected = [c.strip() for c in columns.split(",")]
+        columns = ",".join(selected + [k for k in keys if k not in selected])
+
+    op = "lt" if desc else "gt"
+    last = None
+
+    while True:
+        q = supabase.table(table).select(columns)
+        if where is not None:
+            q = where(q)
+
+        if last is not None:
+            if len(keys) == 1:
+                q = getattr(q, op)(keys[0], last[0])
+            else:
+                q = q.or_(_after(keys, last, op))
+
+        for k in keys:
+            q = q.order(k, desc=desc)
+
+        rows = q.limit(page_size).execute().data or []
+        yield from rows
+
+        if len(rows) < page_size:
+            return
+        last = tuple(rows[-1][k] for k in keys)
+
+
+def stream_rows_offset(
+    table: str,
+    columns: str = "*",
+    order: str | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    where=None,
+    client=None,
+):
+    """
+    Offset-paged variant (.range(start, end)) for tables without a usable
+    unique key. Later pages get slower on big tables and rows can shift
+    between pages if the table changes mid-read; prefer stream_rows().
+    """
+    supabase = client or get_supabase()
+    start = 0
+
+    while True:
+        q = supabase.table(table).select(columns)
+        if where is not None:
+            q = where(q)
+        if order:
+            q = q.order(order)
+
+        rows = q.range(start, start + page_size - 1).execute().data or []
+        yield from rows
+
+        if len(rows) < page_size:
+            return
+        start += page_size
@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("supabase")
+pytest.importorskip("openai")
+
+import analyst44worker  # noqa: E402
+
+
+def step(name, after=(), **extra):
+    return dict({"name": name, "script": f"{name}.py", "entry": "run", "after": list(after)}, **extra)
+
+
+def test_validate_pipeline_orders_dependencies_first():
+    steps = [step("c", ["a", "b"]), step("b", ["a"]), step("a")]
+    assert analyst44worker.validate_pipeline(steps) == ["a", "b", "c"]
+
+
+def test_validate_pipeline_rejects_cycles():
+    steps = [step("a", ["c"]), step("b", ["a"]), step("c", ["b"]), step("d")]
+    with pytest.raises(ValueError, match="cycle"):
+        analyst44worker.validate_pipeline(steps)
+
+
+def test_validate_pipeline_rejects_unknown_dependency():
+    with pytest.raises(ValueError, match="unknown step missing"):
+        analyst44worker.validate_pipeline([step("a", ["missing"])])
+
+
+def test_validate_pipeline_rejects_duplicate_names():
+    with pytest.raises(ValueError, match="Duplicate"):
+        analyst44worker.validate_pipeline([step("a"), step("a")])
+
+
+def test_shipped_pipeline_is_valid():
+    order = analyst44worker.validate_pipeline(analyst44worker.PIPELINE_STEPS)
+    assert len(order) == len(analyst44worker.PIPELINE_STEPS)
+
+
+def resumable(monkeypatch, steps, completed):
+    order = analyst44worker.validate_pipeline(steps)
+    run_ids = {s["name"]: f"id-{s['name']}" for s in steps}
+    monkeypatch.setattr(
+        analyst44worker, "load_completed_run_ids",
+        lambda ids: {f"id-{name}" for name in completed},
+    )
+    return analyst44worker.find_resumable_steps(steps, order, run_ids)
+
+
+def test_find_resumable_steps_stops_at_first_incomplete_step(monkeypatch):
+    steps = [step("a"), step("b", ["a"]), step("c", ["b"]), step("d")]
+    # c has a marker but b does not, so c reruns after b
+    assert resumable(monkeypatch, steps, {"a", "c", "d"}) == {"a", "d"}
+
+
+def test_find_resumable_steps_honors_resume_with(monkeypatch):
+    steps = [step("reset", resume_with=["refill"]), step("refill", ["reset"])]
+    assert resumable(monkeypatch, steps, {"reset"}) == set()
+    assert resumable(monkeypatch, steps, {"reset", "refill"}) == {"reset", "refill"}
+
+
+def test_find_resumable_steps_runs_everything_when_markers_unavailable(monkeypatch):
+    def unavailable(ids):
+        raise RuntimeError("down")
+
+    steps = [step("a")]
+    monkeypatch.setattr(analyst44worker, "load_completed_run_ids", unavailable)
+    assert analyst44worker.find_resumable_steps(steps, ["a"], {"a": "id-a"}) == set()
@@ -0,0 +1,55 @@
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("supabase")
+pytest.importorskip("openai")
+
+import analyst_financial_statements_worker as worker  # noqa: E402
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """earning_calendar stub that truncates at D11_CALENDAR_ROW_CAP rows, like FMP."""
+    rows = []
+    calls = []
+
+    def earning_calendar(start, end):
+        calls.append((start, end))
+        hits = [r for r in rows if start <= r["date"] <= end]
+        return hits[:worker.D11_CALENDAR_ROW_CAP]
+
+    monkeypatch.setattr(worker, "D11_LOOKBACK_DAYS", 20)
+    monkeypatch.setattr(worker, "D11_CALENDAR_CHUNK_DAYS", 30)
+    monkeypatch.setattr(worker, "D11_CALENDAR_ROW_CAP", 5)
+    monkeypatch.setattr(worker.fmp_client, "earning_calendar", earning_calendar)
+    return rows, calls
+
+
+def day(n):
+    return (date.today() - timedelta(days=n)).isoformat()
+
+
+def test_capped_window_is_split_until_complete(calendar):
+    rows, calls = calendar
+    rows += [{"symbol": "OLD", "date": day(15)}]
+    rows += [{"symbol": f"S{i}", "date": day(3)} for i in range(4)]
+    rows += [{"symbol": "NEW", "date": day(2)}]
+
+    found = worker._load_last_earnings_bulk({"OLD", "NEW", "S0"})
+    assert {s: r["date"] for s, r in found.items()} == {"OLD": day(15), "NEW": day(2), "S0": day(3)}
+    assert len(calls) > 1
+
+
+def test_symbols_older_than_a_capped_day_are_left_to_the_fallback(calendar):
+    rows, _ = calendar
+    rows += [{"symbol": f"S{i}", "date": day(3)} for i in range(8)]  # one day over the cap
+    rows += [{"symbol": "OLD", "date": day(15)}, {"symbol": "NEW", "date": day(1)}]
+
+    found = worker._load_last_earnings_bulk({"OLD", "NEW", "S0", "S7"})
+    # S7 was cut from the capped day; OLD may also have reported on it
+    assert set(found) == {"NEW", "S0"}
@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("supabase")
+pytest.importorskip("openai")
+
+import build_scores_history as history  # noqa: E402
+
+SCORE_COLUMNS = [
+    "last_earnings_date", "echo_price", "total_score", "profitability", "growth",
+    "financial_strength", "target_range_low", "target_range_high",
+    "swing_forecast_weeks_2_3", "volatility_flag", "summary_30_words",
+    "comparison_trend", "direction", "news_bias_label", "news_bias_strength",
+    "news_score", "final_weighted_score", "news_updated_at",
+]
+
+
+def score_row(symbol="AAPL", analysis_date="2025-01-02", row_id=1, **scores):
+    row = {c: None for c in SCORE_COLUMNS}
+    row.update(id=row_id, symbol=symbol, analysis_date=analysis_date,
+               total_score=70, direction="up", echo_price=187.35)
+    row.update(scores)
+    return row
+
+
+def test_row_hash_ignores_key_order_and_bookkeeping():
+    a = history.to_history_row(score_row(), "2025-01-02T01:00:00")
+    b = history.to_history_row(
+        score_row(analysis_date="2025-01-03", row_id=99, news_updated_at="2025-01-03T00:00:00"),
+        "2025-01-03T01:00:00",
+    )
+    reordered = dict(reversed(list(a.items())))
+    assert history.row_hash(a) == history.row_hash(b) == history.row_hash(reordered)
+
+
+def test_row_hash_changes_with_a_score():
+    a = history.to_history_row(score_row(), "t")
+    b = history.to_history_row(score_row(total_score=71), "t")
+    assert history.row_hash(a) != history.row_hash(b)
+
+
+def test_row_hash_is_pinned():
+    # stored hashes must keep matching across releases: changing the
+    # encoding turns every symbol into a "changed" row once
+    row = {"symbol": "AAPL", "total_score": 70, "echo_price": 187.35, "direction": None}
+    assert history.row_hash(row) == (
+        "9c5e8865dafc0c14881ffc7f11becda29a350da1c1e72c2181b4e30fdae2d0e6"
+    )
+
+
+def test_snapshot_diff_inserts_replaces_and_touches(monkeypatch):
+    rows = [
+        score_row("SAME", row_id=1),
+        score_row("NEWDAY", row_id=2, analysis_date="2025-01-03", total_score=80),
+        score_row("RERUN", row_id=3, total_score=60),
+        score_row("FIRST", row_id=4),
+    ]
+    latest = {
+        "SAME": {"id": 11, "row_hash": history.row_hash(history.to_history_row(rows[0], "t")),
+                 "analysis_date": "2025-01-02"},
+        "NEWDAY": {"id": 12, "row_hash": "old", "analysis_date": "2025-01-02"},
+        "RERUN": {"id": 13, "row_hash": "old", "analysis_date": "2025-01-02"},
+    }
+    writes, touched = [], []
+    monkeypatch.setattr(history, "stream_rows", lambda *a, **k: iter(rows))
+    monkeypatch.setattr(history, "load_latest_hashes", lambda symbols: latest)
+    monkeypatch.setattr(history, "touch_last_seen", lambda ids, seen_at: touched.extend(ids))
+    monkeypatch.setattr(
+        history.supabase_batch, "write_rows",
+        lambda table, batch, on_conflict=None, **k: writes.append((on_conflict, batch)) or [],
+    )
+
+    assert history.snapshot_diff() == (2, 1, 1)
+    (_, inserts), (conflict, replaces) = writes
+    assert sorted(r["symbol"] for r in inserts) == ["FIRST", "NEWDAY"]
+    assert conflict == "id" and [(r["symbol"], r["id"]) for r in replaces] == [("RERUN", 13)]
+    assert touched == [11]
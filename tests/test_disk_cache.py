@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import disk_cache  # noqa: E402
+
+NS = "test"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    clock = FakeClock()
+    monkeypatch.setattr(disk_cache, "time", clock)
+    monkeypatch.setattr(disk_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(disk_cache, "_local", type(disk_cache._local)())
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    disk_cache.put(NS, "k", {"v": 1}, ttl_seconds=10, max_bytes=10_000)
+    assert disk_cache.get(NS, "k") == (True, {"v": 1})
+
+    clock.now += 10
+    assert disk_cache.get(NS, "k") == (False, None)
+
+
+def test_no_ttl_never_expires(clock):
+    disk_cache.put(NS, "k", [1, 2], ttl_seconds=None, max_bytes=10_000)
+    clock.now += 10 * 365 * 24 * 3600
+    assert disk_cache.get(NS, "k") == (True, [1, 2])
+
+
+def test_least_recently_used_is_evicted_first(clock):
+    value = "x" * 10  # 12 bytes as JSON
+    for key in ("a", "b", "c"):
+        disk_cache.put(NS, key, value, ttl_seconds=None, max_bytes=36)
+        clock.now += 1
+
+    disk_cache.get(NS, "a")  # a is now more recent than b
+    clock.now += 1
+    disk_cache.put(NS, "d", value, ttl_seconds=None, max_bytes=36)
+
+    assert disk_cache.get(NS, "b")[0] is False
+    assert all(disk_cache.get(NS, key)[0] for key in ("a", "c", "d"))
+
+
+def test_expired_entries_are_evicted_before_live_ones(clock):
+    value = "x" * 10
+    disk_cache.put(NS, "old", value, ttl_seconds=None, max_bytes=36)
+    clock.now += 1
+    disk_cache.put(NS, "short", value, ttl_seconds=5, max_bytes=36)
+    disk_cache.put(NS, "live", value, ttl_seconds=None, max_bytes=36)
+
+    clock.now += 5
+    disk_cache.put(NS, "new", value, ttl_seconds=None, max_bytes=36)
+
+    # only the expired entry had to go; the least recently used one stays
+    assert disk_cache.get(NS, "old")[0] is True
+    assert disk_cache.get(NS, "short")[0] is False
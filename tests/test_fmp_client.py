@@ -0,0 +1,79 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fmp_client  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._data = data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise fmp_client.requests.HTTPError(str(self.status_code))
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture
+def fake_fmp(monkeypatch):
+    responses = []
+    tokens = []
+
+    class Session:
+        def get(self, url, params=None, timeout=None):
+            return responses.pop(0)
+
+    monkeypatch.setattr(fmp_client, "FMP_API_KEY", "test")
+    monkeypatch.setattr(fmp_client, "FMP_5XX_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(fmp_client, "get_session", lambda: Session())
+    monkeypatch.setattr(fmp_client.fmp_rate_limiter, "acquire", lambda: tokens.append(1) or 0.0)
+    return responses, tokens
+
+
+def test_5xx_retries_take_a_rate_limiter_token_each(fake_fmp):
+    responses, tokens = fake_fmp
+    responses.extend([FakeResponse(503), FakeResponse(502), FakeResponse(200, [{"ok": 1}])])
+
+    assert fmp_client.fmp_get("/quote/AAPL", endpoint="quote") == [{"ok": 1}]
+    assert len(tokens) == 3
+
+
+def test_5xx_gives_up_after_max_retries(fake_fmp, monkeypatch):
+    responses, tokens = fake_fmp
+    monkeypatch.setattr(fmp_client, "FMP_MAX_5XX_RETRIES", 1)
+    responses.extend([FakeResponse(504), FakeResponse(504)])
+
+    with pytest.raises(fmp_client.requests.HTTPError):
+        fmp_client.fmp_get("/quote/AAPL", endpoint="quote")
+    assert len(tokens) == 2
+
+
+def test_session_adapter_does_not_retry_statuses(monkeypatch):
+    monkeypatch.setattr(fmp_client, "_session", None)
+    retry = fmp_client.get_session().get_adapter("https://").max_retries
+    assert not retry.status_forcelist
+
+
+def test_statements_skip_the_disk_cache_when_asked(fake_fmp, monkeypatch):
+    responses, tokens = fake_fmp
+    cached = {}
+    monkeypatch.setattr(fmp_client, "FMP_CACHE_BYPASS", False)
+    monkeypatch.setattr(fmp_client.disk_cache, "get", lambda ns, key: (key in cached, cached.get(key)))
+    monkeypatch.setattr(fmp_client.disk_cache, "put", lambda ns, key, data, *a: cached.update({key: data}))
+
+    responses.append(FakeResponse(200, [{"date": "2025-06-30"}]))
+    fmp_client.income_statement("AAPL", 2)
+    assert fmp_client.income_statement("AAPL", 2) == [{"date": "2025-06-30"}]
+    assert len(tokens) == 1
+
+    responses.append(FakeResponse(200, [{"date": "2025-09-30"}]))
+    assert fmp_client.income_statement("AAPL", 2, use_cache=False) == [{"date": "2025-09-30"}]
+    assert len(tokens) == 2
@@ -0,0 +1,118 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("supabase")
+pytest.importorskip("openai")
+
+import fmp_earnings_news_fetcher as fetcher  # noqa: E402
+
+
+def target(symbol, report_date="2025-01-04", cursor=None, start="2025-01-01"):
+    return {
+        "symbol": symbol,
+        "report_date": report_date,
+        "cursor": cursor,
+        "window": {"from": start, "to": "2025-01-07"},
+    }
+
+
+def news(symbol, published: datetime, i=0):
+    return {"symbol": symbol, "url": f"{symbol}/{i}",
+            "publishedDate": published.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(fetcher, "NEWS_BATCH_LIMIT", 10)
+    monkeypatch.setattr(fetcher, "NEWS_BATCH_ITEMS_PER_SYMBOL", 5)  # 2 tickers per chunk
+    monkeypatch.setattr(fetcher, "NEWS_BATCH_MAX_TICKERS_CHARS", 1500)
+    monkeypatch.setattr(fetcher, "NEWS_BATCH_MAX_PAGES", 1)
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Stub stock_news_multi over a fixed list of items, newest first."""
+    items = []
+    calls = []
+
+    def stock_news_multi(symbols, limit, page=0, **window):
+        calls.append((tuple(symbols), page))
+        hits = sorted((n for n in items if n["symbol"] in symbols),
+                      key=lambda n: n["publishedDate"], reverse=True)
+        return hits[page * limit:(page + 1) * limit]
+
+    monkeypatch.setattr(fetcher.fmp_client, "stock_news_multi", stock_news_multi)
+    return items, calls
+
+
+def chunk_symbols(chunks):
+    return [[t["symbol"] for t in chunk] for chunk in chunks]
+
+
+def test_chunk_targets_groups_by_report_date_and_size(limits):
+    targets = [target("A"), target("B"), target("C"), target("D", "2025-01-05"), target("A")]
+    assert chunk_symbols(fetcher.chunk_targets(targets)) == [["A", "B"], ["C"], ["D"]]
+
+
+def test_chunk_targets_respects_the_url_budget(limits, monkeypatch):
+    monkeypatch.setattr(fetcher, "NEWS_BATCH_MAX_TICKERS_CHARS", 12)
+    # "^VIX" encodes to "%5EVIX" (6 chars) + 3 for the comma
+    targets = [target("^VIX"), target("AB"), target("CD")]
+    assert chunk_symbols(fetcher.chunk_targets(targets)) == [["^VIX"], ["AB", "CD"]]
+
+
+def test_short_page_means_every_symbol_is_complete(limits, feed):
+    items, _ = feed
+    t0 = datetime(2025, 1, 4, 12)
+    items += [news("A", t0, 1), news("B", t0 - timedelta(hours=1), 2)]
+
+    found, heavy, incomplete = fetcher.fetch_chunk([target("A"), target("B")])
+    assert {s: len(v) for s, v in found.items()} == {"A": 1, "B": 1}
+    assert heavy == incomplete == []
+
+
+def test_full_page_splits_complete_heavy_and_incomplete(limits, feed):
+    items, _ = feed
+    t0 = datetime(2025, 1, 6, 12)
+    # HEAVY fills the page with 9 newer items; LITE gets 1, older ones are cut off
+    items += [news("HEAVY", t0 - timedelta(minutes=i), i) for i in range(20)]
+    items += [news("LITE", t0 - timedelta(minutes=5, seconds=30), 100),
+              news("LITE", t0 - timedelta(days=1), 101)]
+    # DONE's cursor is newer than the oldest item on the page: nothing missing
+    done = target("DONE", cursor=t0 - timedelta(minutes=1))
+
+    found, heavy, incomplete = fetcher.fetch_chunk([target("HEAVY"), target("LITE"), done])
+    assert list(found) == ["DONE"]
+    assert [t["symbol"] for t in heavy] == ["HEAVY"]
+    assert [t["symbol"] for t in incomplete] == ["LITE"]
+
+
+def test_items_older_than_the_cursor_are_dropped(limits, feed):
+    items, _ = feed
+    cursor = datetime(2025, 1, 4, 12)
+    items += [news("A", cursor + timedelta(hours=1), 1), news("A", cursor - timedelta(hours=1), 2)]
+
+    found, _, _ = fetcher.fetch_chunk([target("A", cursor=cursor)])
+    assert [n["url"] for n in found["A"]] == ["A/1"]
+
+
+def test_per_symbol_paging_reports_the_page_cap(monkeypatch):
+    monkeypatch.setattr(fetcher, "NEWS_PAGE_LIMIT", 2)
+    monkeypatch.setattr(fetcher, "NEWS_MAX_PAGES", 2)
+    t0 = datetime(2025, 1, 4, 12)
+    items = [news("A", t0 - timedelta(hours=i), i) for i in range(6)]
+    monkeypatch.setattr(
+        fetcher.fmp_client, "stock_news",
+        lambda limit, symbol, page=0, **window: items[page * limit:(page + 1) * limit],
+    )
+
+    found, complete = fetcher.fetch_new_news("A", "2025-01-04", t0 - timedelta(hours=10))
+    assert len(found) == 4 and complete is False
+
+    found, complete = fetcher.fetch_new_news("A", "2025-01-04", t0 - timedelta(hours=2))
+    assert len(found) == 3 and complete is True
@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fmp_rate_limiter  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    clock = FakeClock()
+    monkeypatch.setattr(fmp_rate_limiter, "time", clock)
+    monkeypatch.setattr(fmp_rate_limiter, "FMP_RATE_LIMIT_DB", str(tmp_path / "bucket.sqlite"))
+    monkeypatch.setattr(fmp_rate_limiter, "FMP_RATE_LIMIT_PER_MINUTE", 60.0)  # 1 token/s
+    monkeypatch.setattr(fmp_rate_limiter, "FMP_RATE_LIMIT_BURST", 3.0)
+    monkeypatch.setattr(fmp_rate_limiter, "_local", type(fmp_rate_limiter._local)())
+    return clock
+
+
+def test_burst_is_free_then_callers_wait_for_refill(clock):
+    assert [fmp_rate_limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert fmp_rate_limiter.acquire() == pytest.approx(1.0)
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_refill_is_capped_at_burst(clock):
+    for _ in range(3):
+        fmp_rate_limiter.acquire()
+    clock.now += 60  # would be 60 tokens without the cap
+
+    assert [fmp_rate_limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert fmp_rate_limiter.acquire() > 0
+
+
+def test_penalize_empties_the_bucket_for_the_penalty(clock):
+    fmp_rate_limiter.penalize(5)
+    # bucket is 5 tokens in debt: the next call waits until it is back at 1
+    assert fmp_rate_limiter.acquire() == pytest.approx(6.0)
+
+
+def test_zero_rate_disables_the_limiter(clock, monkeypatch):
+    monkeypatch.setattr(fmp_rate_limiter, "FMP_RATE_LIMIT_PER_MINUTE", 0.0)
+    fmp_rate_limiter.penalize(30)
+    assert [fmp_rate_limiter.acquire() for _ in range(10)] == [0.0] * 10
+    assert clock.slept == []
@@ -0,0 +1,32 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import llm_payload_encoder  # noqa: E402
+
+
+def test_exact_fields_are_not_rounded():
+    report = {"close_before_earnings": 187.35, "gross_margin": 0.4567891, "eps_basic": 1.23456}
+    out = llm_payload_encoder.compact(report, exact={"close_before_earnings", "eps_basic"})
+    assert out["close_before_earnings"] == 187.35
+    assert out["eps_basic"] == 1.23456
+    assert out["gross_margin"] == 0.4568
+
+
+def test_scoring_payload_keeps_close_before_earnings():
+    pytest.importorskip("supabase")
+    pytest.importorskip("openai")
+    import analyst_financial_scores_worker as worker
+
+    prompt = worker.load_system_prompt()
+    payload = {
+        "latest_report": {"close_before_earnings": 187.35, "analysis_date": "2025-01-02"},
+        "previous_report": {"close_before_earnings": 12345.678},
+    }
+    sent = json.loads(worker.encode_payload(prompt, payload))
+    assert sent["latest_report"]["close_before_earnings"] == 187.35
+    assert sent["previous_report"]["close_before_earnings"] == 12345.678
@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("numpy")
+
+import market_features  # noqa: E402
+
+
+def bars(closes, spread=1.0):
+    return [{"close": c, "high": c + spread, "low": c - spread} for c in closes]
+
+
+def test_returns_and_short_history():
+    f = market_features.compute_features(bars([100.0 + i for i in range(21)]))
+    assert f["bars"] == 21
+    assert f["last_close"] == 120.0
+    assert f["return_1d_pct"] == pytest.approx((120 / 119 - 1) * 100, abs=1e-3)
+    assert f["return_20d_pct"] == 20.0
+    # not enough history
+    assert f["return_60d_pct"] is None
+    assert f["realized_vol_60d_pct"] is None
+    assert f["vs_sma_20_pct"] is None
+
+
+def test_constant_growth_has_no_volatility_or_drawdown():
+    f = market_features.compute_features(bars([100 * 1.01 ** i for i in range(120)]))
+    assert f["realized_vol_20d_pct"] == 0.0
+    assert f["drawdown_from_high_pct"] == 0.0
+    assert f["max_drawdown_pct"] == 0.0
+    assert f["close_percentile"] == 100.0
+    assert f["vs_sma_20_pct"] > 0
+    assert f["sma_50_slope_10d_pct"] > 0
+
+
+def test_drawdown_and_missing_high_low():
+    closes = [100.0, 120.0, 90.0, 96.0]
+    f = market_features.compute_features([{"close": c} for c in closes])
+    assert f["max_drawdown_pct"] == -25.0
+    assert f["drawdown_from_high_pct"] == -20.0
+    assert f["pct_from_window_low"] == pytest.approx(6.667, abs=1e-3)
+
+
+def test_swing_structure():
+    # higher highs and higher lows: a rising zig-zag with a 4-bar half period
+    closes = []
+    for leg in range(8):
+        base = 100 + leg * 5
+        closes += [base + i for i in range(4)] if leg % 2 == 0 else [base + 3 - i for i in range(4)]
+    f = market_features.compute_features(bars(closes))
+    assert f["swing_highs"] >= 2 and f["swing_lows"] >= 2
+    assert f["higher_highs"] == f["swing_highs"] - 1
+    assert f["higher_lows"] == f["swing_lows"] - 1
+    assert f["lower_highs"] == f["lower_lows"] == 0
+
+
+def test_same_bars_give_the_same_features():
+    data = bars([100 + (i * 7919 % 13) for i in range(150)])
+    assert market_features.compute_features(data) == market_features.compute_features(list(data))
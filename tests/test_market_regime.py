@@ -0,0 +1,92 @@
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import market_regime  # noqa: E402
+
+RULES = {
+    "Up": [market_regime._gt("trend", 0), market_regime._lt("vol", 20),
+           market_regime._between("slope", 0, 1), market_regime._ge_keys("hl", "ll")],
+    "Down": [market_regime._lt("trend", 0), market_regime._gt("vol", 20)],
+}
+
+
+def days_ago(n):
+    return (date.today() - timedelta(days=n)).isoformat()
+
+
+def decision(state="Up", age=1, strength=70, explanation="model"):
+    return {"market_state": state, "decision_strength": strength,
+            "decision_date": days_ago(age), "explanation": explanation}
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(market_regime, "FAST_PATH_ENABLED", True)
+    monkeypatch.setattr(market_regime, "MIN_CONFIDENCE", 75.0)
+    monkeypatch.setattr(market_regime, "MAX_AGE_DAYS", 5)
+
+
+def test_classify_picks_the_state_with_most_passing_checks():
+    f = {"trend": 1, "vol": 10, "slope": 0.5, "hl": 2, "ll": 3}
+    assert market_regime.classify(f, RULES) == ("Up", 75.0)
+
+
+def test_checks_on_missing_features_fail():
+    assert market_regime.classify({}, RULES) == (None, 0.0)
+    assert market_regime.classify({"trend": -1}, RULES) == ("Down", 50.0)
+
+
+def test_between_is_inclusive():
+    check = market_regime._between("slope", 0, 1)
+    assert check({"slope": 0}) and check({"slope": 1})
+    assert not check({"slope": 1.01})
+
+
+def test_carries_forward_at_min_confidence():
+    f = {"trend": 1, "vol": 10, "slope": 0.5, "hl": 2, "ll": 3}  # 75%
+    out = market_regime.fast_path("SPY", f, [decision()], RULES)
+    assert out == {
+        "market_state": "Up",
+        "decision_strength": 70,
+        "explanation": market_regime.CARRY_FORWARD_EXPLANATION,
+    }
+
+
+def test_below_min_confidence_asks_the_llm():
+    f = {"trend": 1, "vol": 10}  # 50%
+    assert market_regime.fast_path("SPY", f, [decision()], RULES) is None
+
+
+def test_state_change_asks_the_llm():
+    f = {"trend": -1, "vol": 30}
+    assert market_regime.fast_path("SPY", f, [decision()], RULES) is None
+
+
+def test_old_llm_decision_asks_the_llm():
+    f = {"trend": 1, "vol": 10, "slope": 0.5, "hl": 3, "ll": 2}
+    assert market_regime.fast_path("SPY", f, [decision(age=5)], RULES) is not None
+    assert market_regime.fast_path("SPY", f, [decision(age=6)], RULES) is None
+
+
+def test_carry_forwards_do_not_refresh_the_llm_decision_age():
+    f = {"trend": 1, "vol": 10, "slope": 0.5, "hl": 3, "ll": 2}
+    carried = decision(age=0, explanation=market_regime.CARRY_FORWARD_EXPLANATION)
+    assert market_regime.fast_path("SPY", f, [decision(age=6), carried], RULES) is None
+
+
+def test_no_history_asks_the_llm():
+    assert market_regime.fast_path("SPY", {"trend": 1}, [], RULES) is None
+
+
+def test_steady_uptrend_classifies_as_strong_uptrend():
+    market_features = pytest.importorskip("market_features")
+    closes = [400 * 1.002 ** i + (1.5 if i % 6 < 3 else -1.5) for i in range(190)]
+    bars = [{"close": c, "high": c + 1, "low": c - 1} for c in closes]
+    state, conf = market_regime.classify(market_features.compute_features(bars), market_regime.SPY_RULES)
+    assert state == "Strong Uptrend"
+    assert conf >= market_regime.MIN_CONFIDENCE
@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("supabase")
+pytest.importorskip("openai")
+
+import news_revalidation_ai_runner as runner  # noqa: E402
+
+
+def row(symbol, news="n", analysis_date="2025-01-02"):
+    return {"symbol": symbol, "base_score": 50, "news_block": news, "analysis_date": analysis_date}
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    """1 token per character of a pack item; the fixed prompt costs nothing."""
+    monkeypatch.setattr(
+        runner.llm_payload_encoder, "count_tokens",
+        lambda text: 0 if "=== STOCK" not in text else len(text),
+    )
+    return len(runner.format_pack_item(0, row("AAA")))
+
+
+def symbols(packs):
+    return [[r["symbol"] for r in pack] for pack in packs]
+
+
+def test_packs_are_capped_at_pack_size(monkeypatch, tokens):
+    monkeypatch.setattr(runner, "PACK_SIZE", 2)
+    monkeypatch.setattr(runner, "PACK_TOKEN_BUDGET", 10_000)
+    rows = [row(s) for s in ("AAA", "BBB", "CCC", "DDD", "EEE")]
+    assert symbols(runner.pack_rows(rows)) == [["AAA", "BBB"], ["CCC", "DDD"], ["EEE"]]
+
+
+def test_packs_stay_within_the_token_budget(monkeypatch, tokens):
+    monkeypatch.setattr(runner, "PACK_SIZE", 10)
+    monkeypatch.setattr(runner, "PACK_TOKEN_BUDGET", 2 * tokens)
+    rows = [row(s) for s in ("AAA", "BBB", "CCC")]
+    assert symbols(runner.pack_rows(rows)) == [["AAA", "BBB"], ["CCC"]]
+
+
+def test_oversized_row_goes_alone(monkeypatch, tokens):
+    monkeypatch.setattr(runner, "PACK_SIZE", 10)
+    monkeypatch.setattr(runner, "PACK_TOKEN_BUDGET", 3 * tokens)
+    rows = [row("AAA"), row("BIG", news="x" * 10 * tokens), row("CCC")]
+    assert symbols(runner.pack_rows(rows)) == [["AAA"], ["BIG"], ["CCC"]]
+
+
+def test_packed_round_keeps_every_analysis_date(monkeypatch, tokens):
+    monkeypatch.setattr(runner, "PACK_SIZE", 10)
+    monkeypatch.setattr(runner, "PACK_TOKEN_BUDGET", 10_000)
+    single, packed, handled = [], [], []
+    monkeypatch.setattr(runner, "run_ai", lambda symbol, *a: single.append(symbol) or {"s": symbol})
+    monkeypatch.setattr(
+        runner, "run_ai_packed",
+        lambda pack: packed.append([r["symbol"] for r in pack]) or {r["symbol"]: {} for r in pack},
+    )
+    monkeypatch.setattr(runner, "handle_result", lambda r, result: handled.append(runner._input_key(r)))
+
+    rows = [row("AAA"), row("AAA", analysis_date="2025-01-03"), row("BBB"), row("AAA")]
+    runner.run_packed_round(rows)
+
+    assert packed == [["AAA", "BBB"]]
+    assert single == ["AAA"]
+    assert sorted(handled) == [
+        ("AAA", "2025-01-02"), ("AAA", "2025-01-03"), ("BBB", "2025-01-02"),
+    ]
@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("supabase")
+pytest.importorskip("openai")
+
+import supabase_reader  # noqa: E402
+
+
+def test_after_single_key():
+    assert supabase_reader._after(("id",), (42,), "gt") == 'id.gt."42"'
+
+
+def test_after_composite_key_ascending():
+    assert supabase_reader._after(("symbol", "report_date"), ("AAPL", "2025-06-30"), "gt") == (
+        'symbol.gt."AAPL",'
+        'and(symbol.eq."AAPL",report_date.gt."2025-06-30")'
+    )
+
+
+def test_after_composite_key_descending():
+    assert supabase_reader._after(("a", "b", "c"), (1, 2, 3), "lt") == (
+        'a.lt."1",'
+        'and(a.eq."1",b.lt."2"),'
+        'and(a.eq."1",b.eq."2",c.lt."3")'
+    )
+
+
+def test_after_quotes_reserved_characters():
+    assert supabase_reader._after(("symbol",), ('BRK,"B"\\',), "gt") == (
+        'symbol.gt."BRK,\\"B\\"\\\\"'
+    )
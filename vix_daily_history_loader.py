@@ -1,19 +1,13 @@
-import os
-import requests
 from datetime import datetime
-from supabase import create_client, Client
+from supabase import Client
+
+import fmp_client
+from clients import get_supabase
 
 # ======================
 # ENV
 # ======================
-FMP_API_KEY = os.getenv("FMP_API_KEY")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-if not all([FMP_API_KEY, SUPABASE_URL, SUPABASE_KEY]):
-    raise Exception("Missing environment variables")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_supabase()
 
 # ======================
 # CONFIG
@@ -39,14 +33,7 @@ def reset_vix_table():
 # FETCH DATA
 # ======================
 def fetch_vix_history():
-    url = (
-        f"https://financialmodelingprep.com/api/v3/historical-price-full/"
-        f"{SYMBOL}?timeseries={DAYS_BACK}&apikey={FMP_API_KEY}"
-    )
-
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    data = r.json()
+    data = fmp_client.historical_price_full(SYMBOL, timeseries=DAYS_BACK)
 
     if "historical" not in data:
         raise Exception("No historical data returned from FMP")
@@ -1,8 +1,9 @@
 import os
-import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 from supabase import create_client, Client
 
+import fmp_client
+
 # ======================
 # ENV
 # ======================
@@ -26,14 +27,7 @@ SOURCE = "FMP"
 # FETCH VIX DATA
 # ======================
 def fetch_vix_history():
-    url = (
-        f"https://financialmodelingprep.com/api/v3/historical-price-full/"
-        f"{SYMBOL}?timeseries={DAYS_BACK}&apikey={FMP_API_KEY}"
-    )
-
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    data = r.json()
+    data = fmp_client.historical_price_full(SYMBOL, timeseries=DAYS_BACK)
 
     if "historical" not in data:
         raise Exception("No historical data returned from FMP")
@@ -1,24 +1,25 @@
-import os
 import json
 from datetime import date
-from supabase import create_client, Client
-from openai import OpenAI
+from supabase import Client
+
+import llm_telemetry
+import market_features
+import market_regime
+import openai_throttle
+from clients import get_openai, get_supabase
 
 # =============================
 # CONFIG
 # =============================
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-assert SUPABASE_URL and SUPABASE_KEY and OPENAI_API_KEY
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-client = OpenAI(api_key=OPENAI_API_KEY)
+supabase: Client = get_supabase()
+# no SDK retries: 429s are retried by openai_throttle
+client = get_openai(max_retries=0)
 
 PROMPT_FILE = "vix_market_state_prompt.txt"
 SYMBOL = "VIX"
+TAIL_BARS = 10
+EST_COMPLETION_TOKENS = 300
 
 # =============================
 # HELPERS
@@ -29,37 +30,50 @@ def load_prompt() -> str:
         return f.read()
 
 def fetch_vix_daily(limit=180):
+    """Latest `limit` bars, oldest first."""
     res = (
         supabase.table("vix_daily")
         .select("trade_date, open, high, low, close")
-        .order("trade_date", desc=False)
+        .order("trade_date", desc=True)
         .limit(limit)
         .execute()
     )
-    return res.data or []
+    return list(reversed(res.data or []))
 
-def fetch_previous_decision():
+def fetch_recent_decisions(limit=7):
+    """Latest `limit` decisions, oldest first."""
     res = (
         supabase.table("vix_market_state_history")
         .select("market_state, decision_strength, decision_date, explanation")
         .order("decision_date", desc=True)
-        .limit(1)
+        .limit(limit)
         .execute()
     )
-    return res.data[0] if res.data else None
+    return list(reversed(res.data or []))
 
 def call_llm(prompt: str, payload: dict) -> dict:
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.1,
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": json.dumps(payload)}
-        ]
-    )
-
-    content = response.choices[0].message.content.strip()
-    return json.loads(content)
+    with llm_telemetry.track("vix_market_state", "gpt-4o-mini", SYMBOL) as t:
+        user_text = json.dumps(payload, separators=(",", ":"))
+        response = openai_throttle.call(
+            lambda: t.call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                temperature=0.1,
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": user_text}
+                ]
+            )),
+            openai_throttle.estimate_tokens(prompt, user_text) + EST_COMPLETION_TOKENS,
+            on_retry=t.on_retry,
+            on_wait=t.on_wait,
+        )
+
+        content = response.choices[0].message.content.strip()
+        try:
+            return json.loads(content)
+        except Exception as e:
+            t.fail(error=str(e))
+            raise
 
 def insert_decision(result: dict):
     supabase.table("vix_market_state_history").insert({
@@ -82,18 +96,25 @@ def main():
     if len(vix_data) < 30:
         raise Exception("Not enough VIX data")
 
-    previous_decision = fetch_previous_decision()
+    recent_decisions = fetch_recent_decisions()
+    previous_decision = recent_decisions[-1] if recent_decisions else None
+    features = market_features.compute_features(vix_data)
+
+    result = market_regime.fast_path(SYMBOL, features, recent_decisions, market_regime.VIX_RULES)
 
-    payload = {
-        "vix_daily_data": vix_data,
-        "previous_vix_decision": previous_decision
-    }
+    if result is None:
+        payload = {
+            "vix_features": features,
+            "vix_recent_bars": market_features.tail(vix_data, TAIL_BARS),
+            "previous_vix_decision": previous_decision
+        }
 
-    prompt = load_prompt()
-    result = call_llm(prompt, payload)
+        prompt = load_prompt()
+        result = call_llm(prompt, payload)
 
     insert_decision(result)
 
+    llm_telemetry.flush()
     print("✅ VIX market state stored:", result["market_state"])
 
 if __name__ == "__main__":